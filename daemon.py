@@ -0,0 +1,38 @@
+"""
+Scheduler daemon of the split deployment(`SCHEDULER_DAEMON = True` in `src/config.py`).
+
+Runs the scheduler and serves its operations to the WebUI processes, which are started apart,
+e.g. `uvicorn main:app --workers 4`, see `src/rpc.py`.
+"""
+
+import asyncio
+import signal
+
+from src import operations  # noqa: F401, registers the operations
+from src.config import SCHEDULER_SOCKET
+from src.log import add_log_files
+from src.rpc import serve_operations
+from src.service import start_scheduler, stop_scheduler
+
+
+async def main() -> None:
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    # Rotate, compress and expire the log files, the WebUI processes only append to them
+    add_log_files(owner=True)
+    start_scheduler()
+    server = await serve_operations()
+    try:
+        await stop.wait()
+    finally:
+        server.close()
+        await server.wait_closed()
+        SCHEDULER_SOCKET.unlink(missing_ok=True)
+        await stop_scheduler()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
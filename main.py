@@ -4,29 +4,43 @@ from fastapi import FastAPI
 from fastapi.responses import HTMLResponse
 from fastui import prebuilt_html
 
+from src.config import SCHEDULER_DAEMON
+from src.loop_monitor import LoopOwnerMiddleware
 from src.routes.api import router as api_router
 from src.routes.executor import router as executor_router
 from src.routes.job import router as job_router
 from src.routes.job_log import router as log_router
 from src.routes.job_store import router as store_router
+from src.routes.metrics import router as metrics_router
+from src.routes.monitor import router as monitor_router
+from src.routes.timeline import router as timeline_router
 from src.scheduler import scheduler
+from src.service import start_scheduler, stop_scheduler
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    scheduler.start()
+    # With SCHEDULER_DAEMON the scheduler runs in `daemon.py`, the routes send it the operations
+    if SCHEDULER_DAEMON:
+        yield
+        return
+    start_scheduler()
     app.state.scheduler = scheduler
     yield
-    scheduler.shutdown()
+    await stop_scheduler()
 
 
 app = FastAPI(lifespan=lifespan)
+app.add_middleware(LoopOwnerMiddleware)
 
 app.include_router(executor_router)
 app.include_router(store_router)
 app.include_router(log_router)
+app.include_router(monitor_router)
+app.include_router(timeline_router)
 app.include_router(job_router)  # this router has a wildcard path: /job/{action}/{id}
 app.include_router(api_router)
+app.include_router(metrics_router)
 
 
 @app.get("/{path:path}")
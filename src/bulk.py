@@ -0,0 +1,351 @@
+"""
+Pause, resume, remove or modify many jobs at once, selected by ids, name pattern, job store or
+executor.
+
+`scheduler.pause_job` and the other single job actions write each job in its own job store call
+(a transaction of SQLAlchemy, a round-trip of Redis or MongoDB). A bulk action loads and writes
+the jobs of a store in batches of `BULK_BATCH` instead: one transaction(SQLAlchemy), one
+MULTI/EXEC pipeline(Redis) or one `bulk_write`(MongoDB) per batch. The batches run one after
+another in a dedicated thread, each holding the lock of the job stores so the scheduler doesn't
+process a half written batch, a wakeup meanwhile is retried shortly instead of blocking the event
+loop(see `Scheduler` in `src/scheduler.py`). The events of the jobs are dispatched on the event
+loop after each batch, so the listeners see the same events as for single actions.
+"""
+
+import asyncio
+import pickle
+import time
+from collections.abc import Awaitable, Callable
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from fnmatch import fnmatchcase
+from functools import partial
+from typing import TYPE_CHECKING, TypeVar
+from uuid import uuid4
+
+from apscheduler.events import EVENT_JOB_MODIFIED, EVENT_JOB_REMOVED, JobEvent
+
+from .config import BULK_BATCH, BULK_HISTORY
+from .exceptions import OperationFailed
+from .job_query import get_all_jobs, load_jobs
+from .log import server_log
+from .scheduler import remember_written_jobs, scheduler
+from .schema import BulkJobParam, BulkProgress
+from .spread import respread_job
+from .store_thread import flush, written
+
+if TYPE_CHECKING:
+    from apscheduler.job import Job
+    from apscheduler.jobstores.base import BaseJobStore
+
+# Errors kept in the progress of a bulk action
+MAX_ERRORS = 20
+# Events dispatched between two runs of the other callbacks of the loop
+DISPATCH_SLICE = 50
+
+T = TypeVar("T")
+Writer = Callable[["BaseJobStore", list["Job"], list["Job"], list[str]], None]
+
+# One thread, the bulk actions don't interleave their batches
+_thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix="bulk")
+_progress: dict[str, BulkProgress] = {}
+# Monotonic start time of the running ones by id of the progress
+_started: dict[int, float] = {}
+_tasks: set[asyncio.Task] = set()
+
+
+def _state(store: "BaseJobStore", job: "Job") -> bytes:
+    return pickle.dumps(job.__getstate__(), store.pickle_protocol)  # type: ignore
+
+
+def _write_sqlalchemy(
+    store: "BaseJobStore", added: list["Job"], updated: list["Job"], removed: list[str]
+) -> None:
+    from apscheduler.util import datetime_to_utc_timestamp
+    from sqlalchemy import bindparam
+
+    table = store.jobs_t  # type: ignore
+    with store.engine.begin() as connection:  # type: ignore
+        if added:
+            connection.execute(
+                table.insert(),
+                [
+                    {
+                        "id": job.id,
+                        "next_run_time": datetime_to_utc_timestamp(job.next_run_time),
+                        "job_state": _state(store, job),
+                    }
+                    for job in added
+                ],
+            )
+        if updated:
+            connection.execute(
+                table.update()
+                .where(table.c.id == bindparam("job_id"))
+                .values(next_run_time=bindparam("run_time"), job_state=bindparam("state")),
+                [
+                    {
+                        "job_id": job.id,
+                        "run_time": datetime_to_utc_timestamp(job.next_run_time),
+                        "state": _state(store, job),
+                    }
+                    for job in updated
+                ],
+            )
+        if removed:
+            connection.execute(table.delete().where(table.c.id.in_(removed)))
+
+
+def _write_redis(
+    store: "BaseJobStore", added: list["Job"], updated: list["Job"], removed: list[str]
+) -> None:
+    from apscheduler.util import datetime_to_utc_timestamp
+
+    jobs_key, run_times_key = store.jobs_key, store.run_times_key  # type: ignore
+    with store.redis.pipeline() as pipe:  # type: ignore
+        for job in [*added, *updated]:
+            pipe.hset(jobs_key, job.id, _state(store, job))
+            if job.next_run_time:
+                pipe.zadd(run_times_key, {job.id: datetime_to_utc_timestamp(job.next_run_time)})
+            else:
+                pipe.zrem(run_times_key, job.id)
+        if removed:
+            pipe.hdel(jobs_key, *removed)
+            pipe.zrem(run_times_key, *removed)
+        pipe.execute()
+
+
+def _write_mongodb(
+    store: "BaseJobStore", added: list["Job"], updated: list["Job"], removed: list[str]
+) -> None:
+    from apscheduler.util import datetime_to_utc_timestamp
+    from bson.binary import Binary  # type: ignore
+    from pymongo import DeleteMany, InsertOne, UpdateOne  # type: ignore
+
+    requests: list = [
+        InsertOne(
+            {
+                "_id": job.id,
+                "next_run_time": datetime_to_utc_timestamp(job.next_run_time),
+                "job_state": Binary(_state(store, job)),
+            }
+        )
+        for job in added
+    ]
+    requests += [
+        UpdateOne(
+            {"_id": job.id},
+            {
+                "$set": {
+                    "next_run_time": datetime_to_utc_timestamp(job.next_run_time),
+                    "job_state": Binary(_state(store, job)),
+                }
+            },
+        )
+        for job in updated
+    ]
+    if removed:
+        requests.append(DeleteMany({"_id": {"$in": removed}}))
+    if requests:
+        store.collection.bulk_write(requests, ordered=False)  # type: ignore
+
+
+def _write_each(
+    store: "BaseJobStore", added: list["Job"], updated: list["Job"], removed: list[str]
+) -> None:
+    for job in added:
+        store.add_job(job)
+    for job in updated:
+        store.update_job(job)
+    for job_id in removed:
+        store.remove_job(job_id)
+
+
+# Stores writing many jobs in one transaction or round-trip
+WRITERS: dict[str, Writer] = {
+    "SQLAlchemyJobStore": _write_sqlalchemy,
+    "RedisJobStore": _write_redis,
+    "MongoDBJobStore": _write_mongodb,
+}
+
+
+def write_jobs(
+    store: "BaseJobStore", added: list["Job"], updated: list["Job"], removed: list[str]
+) -> None:
+    """Add, update and remove the jobs in one transaction or round-trip if the store can."""
+
+    WRITERS.get(store.__class__.__name__, _write_each)(store, added, updated, removed)
+    # Not reprocessed stale by a wakeup of the scheduler loading them meanwhile
+    written(store, [*(job.id for job in (*added, *updated)), *removed])
+
+
+def _matches(job: "Job", param: BulkJobParam, ids: set[str]) -> bool:
+    return (
+        (not ids or job.id in ids)
+        and (not param.name or fnmatchcase(job.name, param.name))
+        and (not param.executor or job.executor == param.executor)
+    )
+
+
+def _select_ids(alias: str, param: BulkJobParam) -> list[str]:
+    """Ids of the jobs of the store matching the name pattern or the executor."""
+
+    ids = set(param.id_list())
+    store = scheduler._jobstores[alias]
+    return [job.id for job in get_all_jobs(store) if _matches(job, param, ids)]
+
+
+def _apply_batch(
+    alias: str, job_ids: list[str], param: BulkJobParam
+) -> tuple[set[str], list[JobEvent], list[str]]:
+    """
+    Apply the action to the jobs of the ids in the store.
+
+    Returns:
+        tuple[set[str], list[JobEvent], list[str]]: Ids of the jobs found in the store, the
+            events of the written jobs and the errors of the others.
+    """
+
+    changes = param.change_dict()
+    spread = changes.pop("spread", None)
+    updated, removed, errors = [], [], []
+    with scheduler._jobstores_lock:
+        if (store := scheduler._jobstores.get(alias)) is None:
+            return set(), [], [f"Job store {alias} was removed"] * len(job_ids)
+        # After the runs written behind by the I/O thread of the store
+        flush(store)
+        jobs = load_jobs(store, job_ids)
+        now = datetime.now(scheduler.timezone)
+        for job in jobs.values():
+            # Selected before, the job may be changed since
+            if not _matches(job, param, set()):
+                errors.append(f"Job {job.id} doesn't match anymore")
+                continue
+            try:
+                match param.action:
+                    case "pause":
+                        job._modify(next_run_time=None)
+                    case "resume":
+                        # Same as `scheduler.resume_job`, a finished job is removed
+                        if (next_run_time := job.trigger.get_next_fire_time(None, now)) is None:
+                            removed.append(job.id)
+                            continue
+                        job._modify(next_run_time=next_run_time)
+                    case "modify":
+                        if spread is not None:
+                            job._modify(**respread_job(job, spread, now))
+                        job._modify(**changes)
+                    case "remove":
+                        removed.append(job.id)
+                        continue
+            except Exception as e:
+                errors.append(f"Job {job.id}: {e}")
+                continue
+            updated.append(job)
+        try:
+            write_jobs(store, [], updated, removed)
+            remember_written_jobs(updated)
+        except Exception as e:
+            server_log.opt(exception=e).warning(f"Bulk {param.action} failed in {alias}")
+            return set(jobs), [], [f"Job {job.id}: {e!r}" for job in jobs.values()]
+    events = [JobEvent(EVENT_JOB_MODIFIED, job.id, alias) for job in updated]
+    events += [JobEvent(EVENT_JOB_REMOVED, job_id, alias) for job_id in removed]
+    return set(jobs), events, errors
+
+
+def run_in_thread(func: Callable[..., T], *args) -> "asyncio.Future[T]":
+    """Run a batch in the thread of the bulk actions."""
+
+    return asyncio.get_running_loop().run_in_executor(_thread, partial(func, *args))
+
+
+async def dispatch_events(events: list[JobEvent]) -> None:
+    """Dispatch the events of a written batch on the loop and wake the scheduler up."""
+
+    for index, event in enumerate(events, 1):
+        scheduler._dispatch_event(event)
+        if index % DISPATCH_SLICE == 0:
+            await asyncio.sleep(0)  # the listeners log each job, let the loop run
+    if events:
+        scheduler.wakeup()
+
+
+def record_batch(progress: BulkProgress, done: int, errors: list[str]) -> None:
+    progress.done += done
+    progress.failed += len(errors)
+    progress.errors.extend(errors[: MAX_ERRORS - len(progress.errors)])
+    progress.elapsed = time.monotonic() - _started[id(progress)]
+
+
+async def _run_bulk(param: BulkJobParam, progress: BulkProgress) -> None:
+    async def apply(alias: str, job_ids: list[str]) -> set[str]:
+        found, events, errors = await run_in_thread(_apply_batch, alias, job_ids, param)
+        await dispatch_events(events)
+        record_batch(progress, len(events), errors)
+        return found
+
+    # Not waiting on the loop for the lock held by a batch
+    aliases = [alias for alias in list(scheduler._jobstores) if param.store in ("", alias)]
+    if param.name or param.executor or not param.id_list():
+        selected = [(alias, await run_in_thread(_select_ids, alias, param)) for alias in aliases]
+        progress.selected = sum(len(job_ids) for _, job_ids in selected)
+        for alias, job_ids in selected:
+            for start in range(0, len(job_ids), BULK_BATCH):
+                await apply(alias, job_ids[start : start + BULK_BATCH])
+    else:
+        # Each id is looked up in the stores until found, without listing the stores
+        remaining = param.id_list()
+        progress.selected = len(remaining)
+        for alias in aliases:
+            missing = []
+            for start in range(0, len(remaining), BULK_BATCH):
+                batch = remaining[start : start + BULK_BATCH]
+                found = await apply(alias, batch)
+                missing.extend(job_id for job_id in batch if job_id not in found)
+            remaining = missing
+        record_batch(progress, 0, [f"Job {job_id} not found" for job_id in remaining])
+
+
+async def _track(progress: BulkProgress, run: Callable[[BulkProgress], Awaitable[None]]) -> None:
+    try:
+        await run(progress)
+    except Exception as e:
+        server_log.opt(exception=e).error(f"Bulk {progress.action} failed")
+        progress.errors.append(f"Stopped: {e!r}")
+    progress.elapsed = time.monotonic() - _started.pop(id(progress))
+    progress.finished = True
+    server_log.info(
+        f"Bulk {progress.action}: {progress.done} jobs done, {progress.failed} failed "
+        f"in {progress.elapsed:.3f}s"
+    )
+
+
+def start_task(action: str, run: Callable[[BulkProgress], Awaitable[None]]) -> str:
+    """Run the coroutine function with a new progress on the loop, return the id of the progress."""
+
+    task_id = uuid4().hex
+    progress = _progress[task_id] = BulkProgress(action=action)
+    _started[id(progress)] = time.monotonic()
+    # The oldest finished ones are dropped, the running ones are kept
+    finished = [key for key, progress in _progress.items() if progress.finished]
+    for key in finished[: max(len(_progress) - BULK_HISTORY, 0)]:
+        del _progress[key]
+    task = asyncio.get_running_loop().create_task(_track(progress, run))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    return task_id
+
+
+def start_bulk(param: BulkJobParam) -> str:
+    """Start the bulk action on the running loop, return its id for `bulk_progress`."""
+
+    if param.store and param.store not in scheduler._jobstores:
+        raise OperationFailed(f"Job store {param.store} not exists")
+    executor = param.change_dict().get("executor")
+    if param.action == "modify" and executor is not None and executor not in scheduler._executors:
+        raise OperationFailed(f"Executor {executor} not exists")
+    return start_task(param.action, partial(_run_bulk, param))
+
+
+def bulk_progress(task_id: str) -> BulkProgress | None:
+    return _progress.get(task_id)
@@ -0,0 +1,410 @@
+"""
+Several schedulers(nodes) sharing the same SQLAlchemy or Redis job stores.
+
+APScheduler 3 runs every due job of a store it can see, two schedulers on one store run each job
+twice. With `CLUSTER_ENABLED`, the jobs are split into `CLUSTER_BUCKETS` buckets by the crc32 of
+their id, and a node only runs the due jobs of the buckets it holds a lease on:
+
+- The leases are rows of a `<jobs table>_leases` table updated by conditional `UPDATE`s(SQL), or
+  keys set with `SET NX PX`(Redis), they expire after `CLUSTER_LEASE_TTL` seconds.
+- A heartbeat thread renews the leases of the node every `CLUSTER_HEARTBEAT` seconds, registers
+  the node as alive and balances the buckets: a node holds at most its share of the buckets(by
+  the count of the alive nodes), releases the extra ones to new nodes and claims free or expired
+  ones, so the buckets of a dead node are taken over after the TTL and its due jobs run late
+  (subject to their `misfire_grace_time`).
+- `get_due_jobs` of the store only loads the due jobs of the held buckets, `get_next_run_time`
+  wakes the node at least every `CLUSTER_POLL_INTERVAL` seconds, for the jobs added or modified by
+  other nodes and for the due jobs of other nodes(never a time in the past).
+
+A lease is only trusted until one heartbeat before it expires, the clocks of the nodes must be
+synchronized(SQL leases compare the times of the nodes). Memory job stores are not shared and
+MongoDB job stores are not coordinated.
+"""
+
+import math
+import os
+import random
+import socket
+import threading
+import time
+import zlib
+from collections.abc import Callable
+from datetime import datetime, timedelta, timezone
+from typing import TYPE_CHECKING, Protocol
+
+from .config import (
+    CLUSTER_BUCKETS,
+    CLUSTER_ENABLED,
+    CLUSTER_HEARTBEAT,
+    CLUSTER_LEASE_TTL,
+    CLUSTER_NODE,
+    CLUSTER_POLL_INTERVAL,
+)
+from .log import server_log
+
+if TYPE_CHECKING:
+    from apscheduler.job import Job
+    from apscheduler.jobstores.base import BaseJobStore
+
+NODE = CLUSTER_NODE or f"{socket.gethostname()}:{os.getpid()}"
+# Ids of the due jobs loaded per query
+LOAD_BATCH = 500
+
+RENEW_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('pexpire', KEYS[1], ARGV[2]) end
+return 0
+"""
+RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end
+return 0
+"""
+
+
+def job_bucket(job_id: str) -> int:
+    return zlib.crc32(job_id.encode()) % CLUSTER_BUCKETS
+
+
+class Leases(Protocol):
+    def heartbeat(self, now: float) -> list[str]:
+        """Register the node as alive, return the alive nodes."""
+
+    def renew(self, buckets: set[int], now: float) -> set[int]:
+        """Extend the leases of the node, return the buckets still held."""
+
+    def claim(self, count: int, now: float) -> set[int]:
+        """Take up to count free or expired buckets."""
+
+    def release(self, buckets: set[int]) -> None: ...
+
+    def owners(self, now: float) -> dict[int, str]:
+        """Node holding each leased bucket."""
+
+
+class SQLLeases:
+    def __init__(self, store: "BaseJobStore") -> None:
+        from sqlalchemy import Column, Float, Integer, MetaData, Table, Unicode, select
+
+        self.engine = store.engine  # type: ignore
+        jobs_t = store.jobs_t  # type: ignore
+        metadata = MetaData()
+        self.leases_t = Table(
+            f"{jobs_t.name}_leases",
+            metadata,
+            Column("bucket", Integer, primary_key=True),
+            Column("node", Unicode(191)),
+            Column("expires", Float, nullable=False),
+            schema=jobs_t.schema,
+        )
+        self.nodes_t = Table(
+            f"{jobs_t.name}_nodes",
+            metadata,
+            Column("node", Unicode(191), primary_key=True),
+            Column("expires", Float, nullable=False),
+            schema=jobs_t.schema,
+        )
+        metadata.create_all(self.engine)
+        with self.engine.begin() as connection:
+            existing = set(connection.execute(select(self.leases_t.c.bucket)).scalars())
+        rows = [
+            {"bucket": bucket, "node": None, "expires": 0}
+            for bucket in sorted(set(range(CLUSTER_BUCKETS)) - existing)
+        ]
+        # In one transaction, one by one if another node inserted some of them meanwhile
+        if rows and not self._insert(self.leases_t, rows):
+            for row in rows:
+                self._insert(self.leases_t, [row])
+
+    def _insert(self, table, rows: list[dict]) -> bool:
+        from sqlalchemy.exc import IntegrityError
+
+        try:
+            with self.engine.begin() as connection:
+                connection.execute(table.insert(), rows)
+        except IntegrityError:
+            return False  # inserted by another node
+        return True
+
+    def heartbeat(self, now: float) -> list[str]:
+        from sqlalchemy import select
+
+        nodes = self.nodes_t
+        with self.engine.begin() as connection:
+            updated = connection.execute(
+                nodes.update()
+                .values(expires=now + CLUSTER_LEASE_TTL)
+                .where(nodes.c.node == NODE)
+            ).rowcount
+        if not updated:
+            self._insert(nodes, [{"node": NODE, "expires": now + CLUSTER_LEASE_TTL}])
+        with self.engine.begin() as connection:
+            connection.execute(nodes.delete().where(nodes.c.expires < now - CLUSTER_LEASE_TTL))
+            alive = connection.execute(select(nodes.c.node).where(nodes.c.expires >= now))
+            return list(alive.scalars())
+
+    def renew(self, buckets: set[int], now: float) -> set[int]:
+        from sqlalchemy import select
+
+        leases = self.leases_t
+        mine = (leases.c.node == NODE) & (leases.c.expires >= now)
+        with self.engine.begin() as connection:
+            connection.execute(leases.update().values(expires=now + CLUSTER_LEASE_TTL).where(mine))
+            return set(connection.execute(select(leases.c.bucket).where(mine)).scalars())
+
+    def claim(self, count: int, now: float) -> set[int]:
+        from sqlalchemy import select
+
+        leases = self.leases_t
+        with self.engine.begin() as connection:
+            free = list(
+                connection.execute(select(leases.c.bucket).where(leases.c.expires < now)).scalars()
+            )
+        # In random order, so the nodes starting together don't race for the same buckets
+        random.shuffle(free)
+        claimed = set()
+        for bucket in free:
+            if len(claimed) >= count:
+                break
+            with self.engine.begin() as connection:
+                # Atomic: only one node updates the row while the lease is expired
+                if connection.execute(
+                    leases.update()
+                    .values(node=NODE, expires=now + CLUSTER_LEASE_TTL)
+                    .where(leases.c.bucket == bucket, leases.c.expires < now)
+                ).rowcount:
+                    claimed.add(bucket)
+        return claimed
+
+    def release(self, buckets: set[int]) -> None:
+        leases = self.leases_t
+        with self.engine.begin() as connection:
+            connection.execute(
+                leases.update()
+                .values(expires=0)
+                .where(leases.c.node == NODE, leases.c.bucket.in_(buckets))
+            )
+
+    def owners(self, now: float) -> dict[int, str]:
+        from sqlalchemy import select
+
+        leases = self.leases_t
+        with self.engine.begin() as connection:
+            rows = connection.execute(
+                select(leases.c.bucket, leases.c.node).where(leases.c.expires >= now)
+            )
+            return {bucket: node for bucket, node in rows}
+
+
+class RedisLeases:
+    def __init__(self, store: "BaseJobStore") -> None:
+        self.redis = store.redis  # type: ignore
+        prefix = store.jobs_key.rsplit(".", 1)[0]  # type: ignore
+        self.nodes_key = f"{prefix}.nodes"
+        self.lease_keys = [f"{prefix}.leases:{bucket}" for bucket in range(CLUSTER_BUCKETS)]
+        self.ttl_ms = int(CLUSTER_LEASE_TTL * 1000)
+
+    def heartbeat(self, now: float) -> list[str]:
+        pipe = self.redis.pipeline()
+        pipe.zadd(self.nodes_key, {NODE: now + CLUSTER_LEASE_TTL})
+        pipe.zremrangebyscore(self.nodes_key, "-inf", now)
+        pipe.zrangebyscore(self.nodes_key, now, "+inf")
+        return [node.decode() for node in pipe.execute()[-1]]
+
+    def renew(self, buckets: set[int], now: float) -> set[int]:
+        buckets = sorted(buckets)
+        pipe = self.redis.pipeline()
+        for bucket in buckets:
+            pipe.eval(RENEW_SCRIPT, 1, self.lease_keys[bucket], NODE, self.ttl_ms)
+        return {bucket for bucket, renewed in zip(buckets, pipe.execute()) if renewed}
+
+    def claim(self, count: int, now: float) -> set[int]:
+        free = [
+            bucket
+            for bucket, node in enumerate(self.redis.mget(self.lease_keys))
+            if node is None
+        ]
+        random.shuffle(free)
+        claimed = set()
+        for bucket in free:
+            if len(claimed) >= count:
+                break
+            if self.redis.set(self.lease_keys[bucket], NODE, nx=True, px=self.ttl_ms):
+                claimed.add(bucket)
+        return claimed
+
+    def release(self, buckets: set[int]) -> None:
+        pipe = self.redis.pipeline()
+        for bucket in buckets:
+            pipe.eval(RELEASE_SCRIPT, 1, self.lease_keys[bucket], NODE)
+        pipe.execute()
+
+    def owners(self, now: float) -> dict[int, str]:
+        return {
+            bucket: node.decode()
+            for bucket, node in enumerate(self.redis.mget(self.lease_keys))
+            if node is not None
+        }
+
+
+def _sqlalchemy_due_jobs(store: "BaseJobStore", owns: Callable[[str], bool], now: datetime):
+    from apscheduler.util import datetime_to_utc_timestamp
+    from sqlalchemy import select
+
+    table = store.jobs_t  # type: ignore
+    due = table.c.next_run_time <= datetime_to_utc_timestamp(now)
+    with store.engine.begin() as connection:  # type: ignore
+        ids = connection.execute(select(table.c.id).where(due)).scalars()
+        ids = [job_id for job_id in ids if owns(job_id)]
+    jobs = []
+    for start in range(0, len(ids), LOAD_BATCH):
+        batch = table.c.id.in_(ids[start : start + LOAD_BATCH])
+        jobs.extend(store._get_jobs(due, batch))  # type: ignore
+    return sorted(jobs, key=lambda job: job.next_run_time)
+
+
+def _redis_due_jobs(store: "BaseJobStore", owns: Callable[[str], bool], now: datetime):
+    from apscheduler.util import datetime_to_utc_timestamp
+
+    redis = store.redis  # type: ignore
+    timestamp = datetime_to_utc_timestamp(now)
+    job_ids = [
+        job_id
+        for job_id in redis.zrangebyscore(store.run_times_key, 0, timestamp)  # type: ignore
+        if owns(job_id.decode())
+    ]
+    if not job_ids:
+        return []
+    job_states = redis.hmget(store.jobs_key, *job_ids)  # type: ignore
+    return store._reconstitute_jobs(zip(job_ids, job_states))  # type: ignore
+
+
+class Coordinator:
+    """Leases of the node on the buckets of a job store."""
+
+    def __init__(self, alias: str, store: "BaseJobStore", leases: Leases) -> None:
+        self.alias = alias
+        self.store = store
+        self.leases = leases
+        self.buckets: set[int] = set()
+        self.nodes: list[str] = []
+        # Monotonic time until which the leases are trusted
+        self.valid_until = 0.0
+
+    def owns(self, job_id: str) -> bool:
+        return time.monotonic() < self.valid_until and job_bucket(job_id) in self.buckets
+
+    def heartbeat(self) -> bool:
+        """Renew, balance and claim the leases, return whether buckets were gained."""
+
+        started = time.monotonic()
+        now = time.time()
+        self.nodes = self.leases.heartbeat(now)
+        share = math.ceil(CLUSTER_BUCKETS / max(len(self.nodes), 1))
+        buckets = self.leases.renew(self.buckets, now)
+        if lost := self.buckets - buckets:
+            server_log.warning(f"Lost the leases of {len(lost)} buckets of {self.alias}")
+        if len(buckets) > share:
+            extra = set(sorted(buckets)[share:])
+            self.leases.release(extra)
+            buckets -= extra
+        elif len(buckets) < share:
+            buckets |= self.leases.claim(share - len(buckets), now)
+        gained = buckets - self.buckets
+        self.buckets = buckets
+        self.valid_until = started + CLUSTER_LEASE_TTL - CLUSTER_HEARTBEAT
+        return bool(gained)
+
+    def next_run_time(self, next_run_time: datetime | None) -> datetime:
+        now = datetime.now(timezone.utc)
+        poll = now + timedelta(seconds=CLUSTER_POLL_INTERVAL)
+        if next_run_time is None or next_run_time <= now:
+            return poll
+        return min(next_run_time, poll)
+
+
+_coordinators: dict[str, Coordinator] = {}
+_stop = threading.Event()
+_wakeup: Callable[[], None] = lambda: None  # noqa: E731
+
+
+def coordinate_jobstore(alias: str, store: "BaseJobStore") -> None:
+    """Only run the due jobs of the buckets leased by the node, if the store is shared."""
+
+    if not CLUSTER_ENABLED or getattr(store, "_coordinated_alias", None) == alias:
+        return
+    name = store.__class__.__name__
+    if name == "SQLAlchemyJobStore":
+        leases, due_jobs = SQLLeases(store), _sqlalchemy_due_jobs
+    elif name == "RedisJobStore":
+        leases, due_jobs = RedisLeases(store), _redis_due_jobs
+    else:
+        if name != "MemoryJobStore":
+            server_log.warning(f"Job store {alias}({name}) is not coordinated between nodes")
+        return
+
+    coordinator = _coordinators[alias] = Coordinator(alias, store, leases)
+    get_next_run_time = store.get_next_run_time
+
+    def coordinated_due_jobs(now: datetime) -> list["Job"]:
+        return due_jobs(store, coordinator.owns, now)
+
+    def coordinated_next_run_time() -> datetime:
+        return coordinator.next_run_time(get_next_run_time())
+
+    store.get_due_jobs = coordinated_due_jobs  # type: ignore
+    store.get_next_run_time = coordinated_next_run_time  # type: ignore
+    store._coordinated_alias = alias  # type: ignore
+    try:
+        coordinator.heartbeat()
+    except Exception:
+        server_log.exception(f"Failed to lease the buckets of {alias}")
+    server_log.info(f"Node {NODE} holds {len(coordinator.buckets)} buckets of {alias}")
+
+
+def uncoordinate_jobstore(alias: str) -> None:
+    if coordinator := _coordinators.pop(alias, None):
+        try:
+            coordinator.leases.release(coordinator.buckets)
+        except Exception:
+            server_log.exception(f"Failed to release the leases of {alias}")
+
+
+def _run_heartbeat() -> None:
+    while not _stop.wait(CLUSTER_HEARTBEAT):
+        gained = False
+        for alias, coordinator in list(_coordinators.items()):
+            try:
+                gained |= coordinator.heartbeat()
+            except Exception:
+                server_log.exception(f"Failed to renew the leases of {alias}")
+        if gained:
+            _wakeup()  # the due jobs of the new buckets
+
+
+def start_heartbeat(wakeup: Callable[[], None]) -> None:
+    """Start renewing the leases, `wakeup` makes the scheduler process the jobs."""
+
+    global _wakeup
+
+    if not CLUSTER_ENABLED:
+        return
+    _wakeup = wakeup
+    _stop.clear()
+    threading.Thread(target=_run_heartbeat, name="cluster-heartbeat", daemon=True).start()
+
+
+def stop_heartbeat() -> None:
+    """Stop renewing and release the leases, the other nodes take over at once."""
+
+    _stop.set()
+    for alias in list(_coordinators):
+        uncoordinate_jobstore(alias)
+
+
+def cluster_state() -> dict[str, tuple[list[str], dict[int, str]]]:
+    """Alive nodes and the node holding each bucket by job store alias."""
+
+    now = time.time()
+    return {
+        alias: (coordinator.nodes, coordinator.leases.owners(now))
+        for alias, coordinator in _coordinators.items()
+    }
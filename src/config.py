@@ -1,9 +1,100 @@
 from pathlib import Path
+from typing import Literal
 
-from apscheduler.executors.asyncio import AsyncIOExecutor
+from .executors import AsyncIOExecutor
 
 ROOT = Path(__file__).parent.parent
 LOG_PATH = ROOT / "logs"
+# Sidecar indexes of the log files, see src/log_index.py
+LOG_INDEX_PATH = LOG_PATH / ".index"
+# Interval(seconds) of indexing new job log records for full-text search, see src/log_search.py
+LOG_SEARCH_INTERVAL = 30
+# Rotated logs older than the retention(loguru's format, e.g. "30 days", None to keep all) are
+# removed, others are compressed by "gz" or "zst"(requires zstandard), None to disable
+LOG_RETENTION: str | None = "30 days"
+LOG_COMPRESSION: str | None = "gz"
+# Uncompressed size of the independently compressed blocks, see src/log_archive.py
+LOG_COMPRESSION_BLOCK = 1024 * 1024
+# Also write the logs as JSON lines(`*.jsonl`), WebUI reads them instead of the text logs
+LOG_STRUCTURED = False
+# Run history of the jobs(SQLite), written by a background thread every interval(seconds). Runs
+# older than the days are compacted into hourly counts and durations per job and status, which
+# are kept for the rollup days, see src/run_history.py
+RUN_HISTORY_PATH = LOG_PATH / "history.db"
+RUN_HISTORY_FLUSH_INTERVAL = 1
+RUN_HISTORY_RAW_DAYS = 7
+RUN_HISTORY_ROLLUP_DAYS = 365
+
+# Threads running the blocking work of WebUI requests(log parsing, file reading...),
+# requests are rejected when too many of them are waiting, see src/worker.py
+WEBUI_WORKERS = 4
+WEBUI_MAX_PENDING = 16
+# Run the scheduler in a separate process(`python daemon.py`), the WebUI processes(e.g. uvicorn
+# with several workers) send their operations on the scheduler to it over the Unix socket and
+# wait for the reply for up to the seconds, see src/rpc.py
+SCHEDULER_DAEMON = False
+SCHEDULER_SOCKET = ROOT / "scheduler.sock"
+SCHEDULER_RPC_TIMEOUT = 30
+# Several schedulers(nodes) sharing SQLAlchemy or Redis job stores: the jobs are split into buckets
+# by id, a node only runs the due jobs of the buckets it leases. Leases last for the TTL and are
+# renewed by a heartbeat every interval, nodes poll the stores for the jobs added by other nodes
+# at least every poll interval(seconds). The node name defaults to "hostname:pid", see
+# src/cluster.py
+CLUSTER_ENABLED = False
+CLUSTER_NODE: str | None = None
+CLUSTER_BUCKETS = 64
+CLUSTER_LEASE_TTL = 15
+CLUSTER_HEARTBEAT = 5
+CLUSTER_POLL_INTERVAL = 1
+# Bulk actions on jobs, see src/bulk.py: jobs loaded and written per job store transaction, bulk
+# actions kept for their progress and seconds between the progress updates sent to the UI or API
+BULK_BATCH = 500
+BULK_HISTORY = 20
+BULK_PROGRESS_INTERVAL = 0.5
+# Histogram buckets of the run time and lateness of each job in `/metrics`, jobs × buckets series,
+# otherwise the histograms are per executor and each job only has the count and sum, see
+# src/metrics.py
+METRICS_JOB_BUCKETS = False
+# Event loop monitor, see src/loop_monitor.py: the lag of the loop is sampled every interval and
+# the samples of the window are kept(seconds). Callbacks blocking the loop(a step of a coroutine
+# job or a request, a scheduler wakeup...) longer than the seconds are recorded, None to disable
+LOOP_LAG_INTERVAL = 0.5
+LOOP_LAG_WINDOW = 3600
+LOOP_SLOW_CALLBACK: float | None = 0.1
+# Timeline of the fire times of the jobs, see src/timeline.py: the longest horizon(hours) and the
+# fire times computed per job in the horizon, the jobs firing more often are cut off
+TIMELINE_MAX_HOURS = 168
+TIMELINE_MAX_FIRES = 1440
+# Spread(seconds) of the cron and interval triggers of the jobs of the job stores by alias, for
+# the jobs which don't set it: each job runs at a fixed offset(from its id) within the spread
+# after its schedule, see src/spread.py
+TRIGGER_SPREAD: dict[str, int] = {}
+# Aliases of the job stores of `SCHEDULER_CONFIG` calling their store on an I/O thread instead of
+# the event loop, as the "I/O Thread" of a new store does, see src/store_thread.py
+STORE_IO_THREADS: set[str] = set()
+# Start method of the processes of the process pool executors("fork", "spawn" or "forkserver"),
+# None for the default of the platform. Their log records are written by the scheduler process,
+# see src/executors.py
+PROCESS_POOL_START_METHOD: str | None = None
+
+# Run the uv scripts of `uv_run` jobs in long-lived interpreters(one per inline dependency set)
+# instead of a new `uv run` process per run. A worker is replaced after the runs or when a script
+# it has run is modified, see src/uv.py
+UV_WORKER = False
+UV_WORKER_MAX_RUNS = 100
+# Bytes of a uv script's output(stdout and stderr) logged per run, the rest is only counted
+UV_OUTPUT_LIMIT = 1024 * 1024
+# Limits of each uv script run, None for no limit: seconds before the script is killed(overridden
+# by the `_timeout` kwarg of a job), seconds of CPU time and bytes of virtual memory(Unix only)
+UV_TIMEOUT: float | None = None
+UV_CPU_TIME_LIMIT: int | None = None
+UV_MEMORY_LIMIT: int | None = None
+# uv scripts running at the same time, other runs wait in a queue ordered by "fifo" or "priority"
+# (the `_priority` kwarg of a job, higher first). Runs of the jobs with a `_tag` kwarg are also
+# limited by the width of the tag, see src/limiter.py
+UV_CONCURRENCY = 8
+UV_TAG_CONCURRENCY: dict[str, int] = {}
+UV_QUEUE_ORDER: Literal["fifo", "priority"] = "fifo"
 
 SCHEDULER_CONFIG = {
     "executors": {"default": AsyncIOExecutor()},
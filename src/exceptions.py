@@ -20,3 +20,15 @@ class InvalidAction(Exception):
     def __init__(self, action: str) -> None:
         msg = f"Invalid action: {action}"
         super().__init__(msg)
+
+
+class OperationFailed(Exception):
+    """An operation of the WebUI on the scheduler failed, shown as an error of the status code."""
+
+    def __init__(self, message: str, status_code: int = 400) -> None:
+        super().__init__(message, status_code)
+        self.message = message
+        self.status_code = status_code
+
+    def __str__(self) -> str:
+        return self.message
@@ -0,0 +1,172 @@
+"""
+Executors tagging the log records of each job run with the job id and a run id.
+
+The ids are bound by `logger.contextualize` (a contextvar) in the function running the job, so they
+are set in the thread or process actually running it, or in the task of a coroutine job. Every
+record logged by the job, including the messages of APScheduler about the run, carries them in
+`record["extra"]`, see `text_format` and `structured_format` in `src/log.py`.
+
+The tasks of running coroutine jobs are kept by job id, so a running instance can be cancelled,
+and marked as owned by the job for the slow callbacks of `src/loop_monitor.py`.
+
+The processes of a process pool don't write the log files, their records are sent over a queue to
+the scheduler process and logged again there, by the sinks rotating its log files.
+"""
+
+import asyncio
+import contextvars
+import multiprocessing
+import sys
+import threading
+import traceback
+from uuid import uuid4
+
+from apscheduler.executors import pool
+from apscheduler.executors.asyncio import AsyncIOExecutor as _AsyncIOExecutor
+from apscheduler.executors.base import run_coroutine_job, run_job
+from apscheduler.util import iscoroutinefunction_partial
+from loguru import logger
+
+
+def new_run_id() -> str:
+    return uuid4().hex[:12]
+
+
+def run_job_in_context(job, jobstore_alias, run_times, logger_name):
+    with logger.contextualize(job_id=job.id, run_id=new_run_id()):
+        return run_job(job, jobstore_alias, run_times, logger_name)
+
+
+def _init_pool_process(queue: multiprocessing.SimpleQueue) -> None:
+    """Initializer of the processes of a process pool, send the log records to `queue`."""
+
+    # Route the standard logging of APScheduler to loguru, no sink is added in a child process
+    from . import log  # noqa: F401
+
+    def send(message) -> None:
+        record = message.record
+        if record["exception"]:
+            # The traceback can't be pickled, it's sent as a part of the message
+            text = "".join(traceback.format_exception(*record["exception"])).rstrip()
+            record = record | {"message": f"{record['message']}\n{text}", "exception": None}
+        queue.put(record)
+
+    logger.remove()
+    logger.add(send, format="{message}", diagnose=False)
+
+
+def _log_records(queue: multiprocessing.SimpleQueue) -> None:
+    """Log the records sent by the processes of a process pool, until None is sent."""
+
+    while (record := queue.get()) is not None:
+        logger.patch(lambda r: r.update(record)).log(record["level"].name, record["message"])
+
+
+# What the running callback of the event loop works for, e.g. "job <id>" or "GET /job/", see
+# src/loop_monitor.py
+loop_owner: contextvars.ContextVar[str | None] = contextvars.ContextVar("loop_owner", default=None)
+# Tasks of the running coroutine jobs by job id
+_running_tasks: dict[str, set[asyncio.Task]] = {}
+
+
+async def run_coroutine_job_in_context(job, jobstore_alias, run_times, logger_name):
+    task = asyncio.current_task()
+    tasks = _running_tasks.setdefault(job.id, set())
+    tasks.add(task)  # type: ignore
+    loop_owner.set(f"job {job.id}")
+    try:
+        with logger.contextualize(job_id=job.id, run_id=new_run_id()):
+            return await run_coroutine_job(job, jobstore_alias, run_times, logger_name)
+    finally:
+        tasks.discard(task)  # type: ignore
+        if not tasks:
+            _running_tasks.pop(job.id, None)
+
+
+def cancel_job_runs(job_id: str) -> int:
+    """
+    Cancel the running instances of a coroutine job, the job receives `CancelledError` and the
+    run is reported as failed. Jobs run by thread or process pools can't be cancelled.
+
+    Returns:
+        int: Count of the cancelled instances.
+    """
+
+    tasks = _running_tasks.get(job_id, set()).copy()
+    for task in tasks:
+        # Called on the loop or in a WebUI worker thread
+        task.get_loop().call_soon_threadsafe(task.cancel)
+    return len(tasks)
+
+
+class AsyncIOExecutor(_AsyncIOExecutor):
+    def _do_submit_job(self, job, run_times):
+        def callback(f):
+            self._pending_futures.discard(f)
+            try:
+                events = f.result()
+            except BaseException:
+                self._run_job_error(job.id, *sys.exc_info()[1:])
+            else:
+                self._run_job_success(job.id, events)
+
+        if iscoroutinefunction_partial(job.func):
+            coro = run_coroutine_job_in_context(
+                job, job._jobstore_alias, run_times, self._logger.name
+            )
+            f = self._eventloop.create_task(coro)
+        else:
+            f = self._eventloop.run_in_executor(
+                None, run_job_in_context, job, job._jobstore_alias, run_times, self._logger.name
+            )
+
+        f.add_done_callback(callback)
+        self._pending_futures.add(f)
+
+
+class _ContextPoolExecutor(pool.BasePoolExecutor):
+    def _do_submit_job(self, job, run_times):
+        def callback(f):
+            exc, tb = (
+                f.exception_info()
+                if hasattr(f, "exception_info")
+                else (f.exception(), getattr(f.exception(), "__traceback__", None))
+            )
+            if exc:
+                self._run_job_error(job.id, exc, tb)
+            else:
+                self._run_job_success(job.id, f.result())
+
+        f = self._pool.submit(
+            run_job_in_context, job, job._jobstore_alias, run_times, self._logger.name
+        )
+        f.add_done_callback(callback)
+
+
+class ThreadPoolExecutor(pool.ThreadPoolExecutor, _ContextPoolExecutor):
+    pass
+
+
+class ProcessPoolExecutor(pool.ProcessPoolExecutor, _ContextPoolExecutor):
+    # The replacement of a broken pool in `pool.ProcessPoolExecutor` submits by the method above,
+    # with the same initializer
+    def __init__(self, max_workers=10, pool_kwargs=None):
+        # Imported by src/config.py
+        from .config import PROCESS_POOL_START_METHOD
+
+        pool_kwargs = pool_kwargs or {}
+        # The start method of the platform unless set, not the "spawn" of APScheduler
+        context = pool_kwargs.setdefault(
+            "mp_context", multiprocessing.get_context(PROCESS_POOL_START_METHOD)
+        )
+        self._log_queue = context.SimpleQueue()
+        pool_kwargs.update(initializer=_init_pool_process, initargs=(self._log_queue,))
+        super().__init__(max_workers, pool_kwargs)
+        threading.Thread(
+            target=_log_records, args=(self._log_queue,), name="process-pool-log", daemon=True
+        ).start()
+
+    def shutdown(self, wait=True):
+        super().shutdown(wait)
+        # After the records of the exited processes
+        self._log_queue.put(None)
@@ -0,0 +1,438 @@
+"""
+Server side pagination, sorting and filtering of the jobs in all job stores.
+
+A page is selected in two steps: each queried store returns the match count and the sort keys of
+its first `offset + limit` matched jobs, then the keys of all stores are merged and only the jobs
+of the page are loaded. Sorting by next run time with the id prefix and state filters is pushed
+down to the stores which keep the next run time outside of the pickled job: SQLAlchemy(indexed
+column), Redis(sorted set of run times) and MongoDB(indexed field), so only the jobs of the page
+are unpickled. Filtering by name or trigger and sorting by name or executor need the jobs
+themselves, the jobs of the queried stores are loaded(`get_all_jobs`) in these cases.
+
+The `JobInfo` snapshots rendered by the UI are cached and dropped by the events of their jobs, so
+a page of cached jobs is neither loaded from the stores nor validated again.
+"""
+
+import heapq
+import math
+import re
+import sys
+import threading
+from collections import Counter
+from collections.abc import Callable, Container, Iterator
+from contextlib import contextmanager
+from functools import partial
+from itertools import islice
+from typing import TYPE_CHECKING, Any, Generic, TypeVar
+
+from apscheduler.events import (
+    EVENT_ALL_JOBS_REMOVED,
+    EVENT_EXECUTOR_ADDED,
+    EVENT_EXECUTOR_REMOVED,
+    EVENT_JOB_ADDED,
+    EVENT_JOB_ERROR,
+    EVENT_JOB_EXECUTED,
+    EVENT_JOB_MAX_INSTANCES,
+    EVENT_JOB_MISSED,
+    EVENT_JOB_MODIFIED,
+    EVENT_JOB_REMOVED,
+    EVENT_JOB_SUBMITTED,
+    EVENT_JOBSTORE_ADDED,
+    EVENT_JOBSTORE_REMOVED,
+    JobEvent,
+    SchedulerEvent,
+)
+
+from .log import server_log
+from .scheduler import scheduler
+from .schema import JobInfo, JobQuery
+from .spread import trigger_name
+
+if TYPE_CHECKING:
+    from apscheduler.job import Job
+    from apscheduler.jobstores.base import BaseJobStore
+
+# (sort value, job id), the job id is the last item of every key
+Key = tuple[Any, str]
+Loader = Callable[[list[str]], dict[str, "Job"]]
+V = TypeVar("V")
+
+
+def _run_time_key(job_id: str, timestamp: float | None) -> Key:
+    # Paused jobs are sorted after the scheduled ones, same as `get_all_jobs`
+    return (math.inf if timestamp is None else timestamp, job_id)
+
+
+def _job_key(job: "Job", sort: str) -> Key:
+    if sort == "name":
+        return (job.name, job.id)
+    if sort == "executor":
+        return (job.executor, job.id)
+    timestamp = job.next_run_time.timestamp() if job.next_run_time else None
+    return _run_time_key(job.id, timestamp)
+
+
+def _match_job(job: "Job", query: JobQuery) -> bool:
+    paused = job.next_run_time is None
+    return (
+        job.id.startswith(query.id)
+        and job.name.startswith(query.name)
+        and (not query.trigger or trigger_name(job.trigger) == query.trigger)
+        and (not query.state or paused == (query.state == "paused"))
+    )
+
+
+# Stores keeping the jobs in the memory of the process, changed by the scheduler under the lock
+# of the job stores
+MEMORY_STORES = {"MemoryJobStore"}
+
+
+def get_all_jobs(store: "BaseJobStore") -> list["Job"]:
+    """
+    All jobs of the store. A store in memory is copied under the lock of the job stores, another
+    thread may be changing it, the other stores are loaded without holding the lock.
+    """
+
+    if store.__class__.__name__ in MEMORY_STORES:
+        with scheduler._jobstores_lock:
+            return store.get_all_jobs()
+    return store.get_all_jobs()
+
+
+def _query_loaded(
+    store: "BaseJobStore", query: JobQuery, limit: int
+) -> tuple[int, list[Key], Loader]:
+    """Load all jobs of the store and filter and sort them in memory."""
+
+    jobs = {job.id: job for job in get_all_jobs(store) if _match_job(job, query)}
+    keys = sorted(
+        (_job_key(job, query.sort) for job in jobs.values()), reverse=query.order == "desc"
+    )
+    return len(jobs), keys[:limit], lambda ids: {job_id: jobs[job_id] for job_id in ids}
+
+
+def _query_sqlalchemy(
+    store: "BaseJobStore", query: JobQuery, limit: int
+) -> tuple[int, list[Key], Loader]:
+    from sqlalchemy import func, select
+
+    table = store.jobs_t  # type: ignore
+    conditions = []
+    if query.id:
+        conditions.append(table.c.id.startswith(query.id, autoescape=True))
+    if query.state:
+        column = table.c.next_run_time
+        conditions.append(column.is_(None) if query.state == "paused" else column.is_not(None))
+    order = [table.c.next_run_time.is_(None), table.c.next_run_time, table.c.id]
+    if query.order == "desc":
+        order = [expression.desc() for expression in order]
+
+    with store.engine.begin() as connection:  # type: ignore
+        count = connection.execute(
+            select(func.count()).select_from(table).where(*conditions)
+        ).scalar_one()
+        rows = connection.execute(
+            select(table.c.id, table.c.next_run_time)
+            .where(*conditions)
+            .order_by(*order)
+            .limit(limit)
+        )
+        keys = [_run_time_key(job_id, timestamp) for job_id, timestamp in rows]
+
+    return count, keys, partial(_load_sqlalchemy, store)
+
+
+def _query_redis(
+    store: "BaseJobStore", query: JobQuery, limit: int
+) -> tuple[int, list[Key], Loader]:
+    redis = store.redis  # type: ignore
+    jobs_key, run_times_key = store.jobs_key, store.run_times_key  # type: ignore
+    keys = None
+    if not query.id and query.state != "paused" and query.order == "asc":
+        # Scheduled jobs in order of the sorted set, paused jobs(not in the set) are the last
+        scheduled = redis.zcard(run_times_key)
+        count = scheduled if query.state == "scheduled" else redis.hlen(jobs_key)
+        if count == scheduled or limit <= scheduled:
+            rows = redis.zrange(run_times_key, 0, limit - 1, withscores=True)
+            keys = [_run_time_key(job_id.decode(), timestamp) for job_id, timestamp in rows]
+    if keys is None:
+        # Sort the ids and run times in memory, the jobs are still not loaded
+        run_times = {
+            job_id.decode(): timestamp
+            for job_id, timestamp in redis.zrange(run_times_key, 0, -1, withscores=True)
+        }
+        keys = [
+            _run_time_key(job_id, run_times.get(job_id))
+            for job_id in map(bytes.decode, redis.hkeys(jobs_key))
+            if job_id.startswith(query.id)
+            and (not query.state or (job_id in run_times) == (query.state == "scheduled"))
+        ]
+        count = len(keys)
+        select = heapq.nsmallest if query.order == "asc" else heapq.nlargest
+        keys = select(limit, keys)
+
+    return count, keys, partial(_load_redis, store)
+
+
+def _query_mongodb(
+    store: "BaseJobStore", query: JobQuery, limit: int
+) -> tuple[int, list[Key], Loader]:
+    from pymongo import ASCENDING, DESCENDING  # type: ignore
+
+    collection = store.collection  # type: ignore
+    conditions: dict[str, Any] = {}
+    if query.id:
+        conditions["_id"] = {"$regex": f"^{re.escape(query.id)}"}
+    direction = DESCENDING if query.order == "desc" else ASCENDING
+
+    def find(paused: bool) -> tuple[int, list[Key]]:
+        if query.state and paused != (query.state == "paused"):
+            return 0, []
+        state_conditions = conditions | {"next_run_time": None if paused else {"$ne": None}}
+        documents = collection.find(
+            state_conditions,
+            ["_id", "next_run_time"],
+            sort=[("next_run_time", direction), ("_id", direction)],
+            limit=limit,
+        )
+        keys = [_run_time_key(doc["_id"], doc.get("next_run_time")) for doc in documents]
+        return collection.count_documents(state_conditions), keys
+
+    # Mongo sorts null before numbers, query the scheduled and paused jobs separately
+    (scheduled, scheduled_keys), (paused, paused_keys) = find(paused=False), find(paused=True)
+    if query.order == "desc":
+        keys = [*paused_keys, *scheduled_keys]
+    else:
+        keys = [*scheduled_keys, *paused_keys]
+    count = scheduled + paused
+
+    return count, keys[:limit], partial(_load_mongodb, store)
+
+
+def _reconstitute(store: "BaseJobStore", states) -> dict[str, "Job"]:
+    jobs = {}
+    for job_id, job_state in states:
+        if job_state is None:
+            continue  # removed after the keys were selected
+        try:
+            jobs[job_id] = store._reconstitute_job(job_state)  # type: ignore
+        except Exception:
+            # The store removes it on next `get_all_jobs`/`get_due_jobs`
+            server_log.exception(f"Unable to restore job {job_id}")
+    return jobs
+
+
+def _load_sqlalchemy(store: "BaseJobStore", ids: list[str]) -> dict[str, "Job"]:
+    from sqlalchemy import select
+
+    table = store.jobs_t  # type: ignore
+    with store.engine.begin() as connection:  # type: ignore
+        rows = connection.execute(select(table.c.id, table.c.job_state).where(table.c.id.in_(ids)))
+        return _reconstitute(store, ((row.id, row.job_state) for row in rows))
+
+
+def _load_redis(store: "BaseJobStore", ids: list[str]) -> dict[str, "Job"]:
+    return _reconstitute(store, zip(ids, store.redis.hmget(store.jobs_key, ids)))  # type: ignore
+
+
+def _load_mongodb(store: "BaseJobStore", ids: list[str]) -> dict[str, "Job"]:
+    documents = store.collection.find({"_id": {"$in": ids}}, ["_id", "job_state"])  # type: ignore
+    return _reconstitute(store, ((doc["_id"], doc["job_state"]) for doc in documents))
+
+
+# Stores loading the jobs of many ids in one query
+LOADERS = {
+    "SQLAlchemyJobStore": _load_sqlalchemy,
+    "RedisJobStore": _load_redis,
+    "MongoDBJobStore": _load_mongodb,
+}
+
+
+def load_jobs(store: "BaseJobStore", ids: list[str]) -> dict[str, "Job"]:
+    """Jobs of the ids in the store by id, the ids not found are skipped."""
+
+    if load := LOADERS.get(store.__class__.__name__):
+        return load(store, ids)
+    return {job_id: job for job_id in ids if (job := store.lookup_job(job_id)) is not None}
+
+
+# Stores with the next run time of the jobs stored outside of the pickled job state
+PUSH_DOWN_QUERIES = {
+    "SQLAlchemyJobStore": _query_sqlalchemy,
+    "RedisJobStore": _query_redis,
+    "MongoDBJobStore": _query_mongodb,
+}
+
+
+def _select_page(
+    query: JobQuery, page_size: int
+) -> tuple[int, list[tuple[str, str]], dict[str, Loader]]:
+    """Total count, `(store alias, job id)` of the jobs of the page and the loaders of stores."""
+
+    offset = (query.page - 1) * page_size
+    push_down = query.sort == "next_run_time" and not query.name and not query.trigger
+    total, results = 0, {}
+    with scheduler._jobstores_lock:
+        stores = [
+            (alias, store)
+            for alias, store in scheduler._jobstores.items()
+            if not query.store or alias == query.store
+        ]
+    for alias, store in stores:
+        store_query = _query_loaded
+        if push_down:
+            store_query = PUSH_DOWN_QUERIES.get(store.__class__.__name__, _query_loaded)
+        count, keys, load = store_query(store, query, offset + page_size)
+        total += count
+        results[alias] = (keys, load)
+
+    def tagged(alias: str, keys: list[Key]):
+        return ((key, alias) for key in keys)
+
+    merged = heapq.merge(
+        *(tagged(alias, keys) for alias, (keys, _) in results.items()),
+        reverse=query.order == "desc",
+    )
+    page = [(alias, key[-1]) for key, alias in islice(merged, offset, offset + page_size)]
+    return total, page, {alias: load for alias, (_, load) in results.items()}
+
+
+def _load_jobs(
+    items: list[tuple[str, str]], loaders: dict[str, Loader]
+) -> dict[tuple[str, str], "Job"]:
+    jobs = {}
+    for alias, load in loaders.items():
+        if ids := [job_id for item_alias, job_id in items if item_alias == alias]:
+            jobs.update(((alias, job_id), job) for job_id, job in load(ids).items())
+    return jobs
+
+
+def query_jobs(query: JobQuery, page_size: int) -> tuple[int, list["Job"]]:
+    """
+    Get the total count of the matched jobs and the jobs of the page.
+
+    Args:
+        query (JobQuery): Filters, sorting and page number.
+        page_size (int): Number of jobs per page.
+    """
+
+    total, page, loaders = _select_page(query, page_size)
+    jobs = _load_jobs(page, loaders)
+    return total, [job for item in page if (job := jobs.get(item)) is not None]
+
+
+class JobCache(dict[tuple[str, str], V], Generic[V]):
+    """
+    Values computed from the jobs by store alias and job id. A value is dropped by the events of
+    its job in `mask`, the other events in `mask` drop all values. A value computed from a job
+    loaded before such an event is not cached, see `loading` and `put`.
+    """
+
+    def __init__(self, mask: int) -> None:
+        super().__init__()
+        self.generation = 0  # count of the events dropping values
+        # Generation of the last event of each job, the oldest first. Entries not newer than the
+        # oldest load in progress are pruned, they no longer prevent caching any value.
+        self._invalidated: dict[tuple[str, str], int] = {}
+        self._cleared = 0  # generation of the last event dropping all values
+        self._loading: Counter[int] = Counter()  # generations of the loads in progress
+        # The listener runs on the loop or in the threads of the pool executors
+        self._lock = threading.Lock()
+        scheduler.add_listener(self._invalidate, mask)
+
+    def _invalidate(self, event: SchedulerEvent) -> None:
+        with self._lock:
+            self.generation += 1
+            if isinstance(event, JobEvent):
+                key = (event.jobstore, event.job_id)
+                self._invalidated.pop(key, None)
+                self._invalidated[key] = self.generation
+                self.pop(key, None)
+            else:
+                # Jobs of a store are removed, or the class of an executor or job store is changed
+                self._cleared = self.generation
+                self._invalidated.clear()
+                self.clear()
+            oldest = min(self._loading, default=self.generation)
+            while self._invalidated and next(iter(self._invalidated.values())) <= oldest:
+                del self._invalidated[next(iter(self._invalidated))]
+
+    @contextmanager
+    def loading(self) -> Iterator[int]:
+        """Generation before the jobs are loaded, pass it to `put` the values computed from them."""
+
+        with self._lock:
+            generation = self.generation
+            self._loading[generation] += 1
+        try:
+            yield generation
+        finally:
+            with self._lock:
+                self._loading[generation] -= 1
+                if not self._loading[generation]:
+                    del self._loading[generation]
+
+    def put(self, key: tuple[str, str], value: V, generation: int | None = None) -> None:
+        """Cache the value unless its job had an event after `generation`(defaults to now)."""
+
+        with self._lock:
+            if generation is None or (
+                self._invalidated.get(key, 0) <= generation and self._cleared <= generation
+            ):
+                self[key] = value
+
+
+# Snapshots of the jobs shown in the UI
+_job_infos: JobCache[JobInfo] = JobCache(
+    EVENT_JOB_ADDED
+    | EVENT_JOB_MODIFIED
+    | EVENT_JOB_REMOVED
+    | EVENT_JOB_SUBMITTED
+    | EVENT_JOB_MAX_INSTANCES
+    | EVENT_JOB_EXECUTED
+    | EVENT_JOB_ERROR
+    | EVENT_JOB_MISSED
+    | EVENT_ALL_JOBS_REMOVED
+    | EVENT_EXECUTOR_ADDED
+    | EVENT_EXECUTOR_REMOVED
+    | EVENT_JOBSTORE_ADDED
+    | EVENT_JOBSTORE_REMOVED
+)
+
+
+def get_job_info(job: "Job", generation: int | None = None) -> JobInfo:
+    """
+    Get the snapshot of a job for the UI from the cache, or build and cache it.
+
+    Args:
+        job (Job): The job.
+        generation (int | None): Generation of `_job_infos.loading()` the job was loaded in,
+            defaults to the current one.
+    """
+
+    key = (job._jobstore_alias, job.id)
+    if (info := _job_infos.get(key)) is None:
+        info = JobInfo.model_validate(job)
+        _job_infos.put(key, info, generation)
+    return info
+
+
+def query_job_infos(query: JobQuery, page_size: int) -> tuple[int, list[JobInfo]]:
+    """Same as `query_jobs` but get the snapshots, only the jobs not cached are loaded."""
+
+    with _job_infos.loading() as generation:
+        total, page, loaders = _select_page(query, page_size)
+        infos = {item: info for item in page if (info := _job_infos.get(item)) is not None}
+        missing = [item for item in page if item not in infos]
+        for item, job in _load_jobs(missing, loaders).items():
+            infos[item] = get_job_info(job, generation)
+    return total, [infos[item] for item in page if item in infos]
+
+
+def load_uncached_jobs(
+    cached: Container[tuple[str, str]],
+) -> tuple[list[tuple[str, str]], dict[tuple[str, str], "Job"]]:
+    """`(store alias, job id)` of all jobs, and the jobs not in the cache loaded from the stores."""
+
+    _, items, loaders = _select_page(JobQuery(), sys.maxsize)
+    return items, _load_jobs([item for item in items if item not in cached], loaders)
@@ -0,0 +1,141 @@
+"""
+Scheduler-wide limit of the running uv scripts.
+
+When many jobs fire at once, `uv_run` waits in a queue for one of `UV_CONCURRENCY` slots instead
+of starting all the processes together. A job with a `_tag` kwarg is also limited by the width of
+its tag in `UV_TAG_CONCURRENCY`, a run blocked by its tag doesn't block the runs of other tags.
+Waiting runs start in arrival order, or by the `_priority` kwarg(higher first, then in arrival
+order) when `UV_QUEUE_ORDER` is "priority".
+"""
+
+import asyncio
+import itertools
+import time
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+
+from .config import UV_CONCURRENCY, UV_QUEUE_ORDER, UV_TAG_CONCURRENCY
+
+# Name of the stats of all runs, the others are the stats of each tag
+ALL = "*"
+
+
+class QueueStats:
+    def __init__(self, width: int | None) -> None:
+        self.width = width
+        self.running = 0
+        self.queued = 0
+        self.max_queued = 0
+        self.started = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def enqueue(self) -> None:
+        self.queued += 1
+        self.max_queued = max(self.max_queued, self.queued)
+
+    def start(self, wait: float) -> None:
+        self.running += 1
+        self.started += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+
+    def as_dict(self) -> dict[str, int | float | None]:
+        return {
+            "width": self.width,
+            "running": self.running,
+            "queued": self.queued,
+            "max_queued": self.max_queued,
+            "started": self.started,
+            "avg_wait": self.total_wait / self.started if self.started else 0.0,
+            "max_wait": self.max_wait,
+        }
+
+
+class _Waiter:
+    def __init__(self, tag: str | None) -> None:
+        self.tag = tag
+        self.future = asyncio.get_running_loop().create_future()
+        self.enqueued = time.monotonic()
+
+
+class ProcessLimiter:
+    """Semaphore with per-tag widths and a FIFO or priority queue."""
+
+    def __init__(self, width: int, tag_widths: dict[str, int], order: str = "fifo") -> None:
+        self.width = width
+        self.tag_widths = tag_widths
+        self.order = order
+        self.stats = {ALL: QueueStats(width)}
+        self._queue: list[tuple[tuple[int, ...], _Waiter]] = []
+        self._seq = itertools.count()
+
+    def _stats(self, tag: str | None) -> list[QueueStats]:
+        if tag is None:
+            return [self.stats[ALL]]
+        if tag not in self.stats:
+            self.stats[tag] = QueueStats(self.tag_widths.get(tag))
+        return [self.stats[ALL], self.stats[tag]]
+
+    def _fits(self, tag: str | None) -> bool:
+        return all(s.width is None or s.running < s.width for s in self._stats(tag))
+
+    def _start(self, tag: str | None, wait: float) -> None:
+        for stats in self._stats(tag):
+            stats.start(wait)
+
+    def _dispatch(self) -> None:
+        """Start the waiting runs in order while there are free slots."""
+
+        self._queue.sort(key=lambda entry: entry[0])
+        waiting = []
+        for key, waiter in self._queue:
+            if self._fits(waiter.tag):
+                for stats in self._stats(waiter.tag):
+                    stats.queued -= 1
+                self._start(waiter.tag, time.monotonic() - waiter.enqueued)
+                waiter.future.set_result(None)
+            else:
+                waiting.append((key, waiter))
+        self._queue = waiting
+
+    def _release(self, tag: str | None) -> None:
+        for stats in self._stats(tag):
+            stats.running -= 1
+        self._dispatch()
+
+    async def _acquire(self, tag: str | None, priority: int) -> None:
+        if not self._queue and self._fits(tag):
+            self._start(tag, 0.0)
+            return
+
+        waiter = _Waiter(tag)
+        key = (-priority, next(self._seq)) if self.order == "priority" else (next(self._seq),)
+        self._queue.append((key, waiter))
+        for stats in self._stats(tag):
+            stats.enqueue()
+        self._dispatch()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                self._release(tag)  # started and cancelled at the same time
+            else:
+                self._queue.remove((key, waiter))
+                for stats in self._stats(tag):
+                    stats.queued -= 1
+            raise
+
+    @asynccontextmanager
+    async def slot(self, tag: str | None = None, priority: int = 0) -> AsyncIterator[float]:
+        """Wait for a free slot, yield the seconds waited."""
+
+        start = time.monotonic()
+        await self._acquire(tag, priority)
+        try:
+            yield time.monotonic() - start
+        finally:
+            self._release(tag)
+
+
+uv_limiter = ProcessLimiter(UV_CONCURRENCY, UV_TAG_CONCURRENCY, UV_QUEUE_ORDER)
@@ -1,9 +1,12 @@
 # cspell: words autoinit
 import datetime
 import inspect
+import json
 import logging
+import multiprocessing
 import os
 import re
+import traceback
 from typing import TYPE_CHECKING
 
 LOG_FORMAT = (
@@ -12,20 +15,33 @@ LOG_FORMAT = (
     "<cyan>{name}:{line}</cyan>\t{message}"
 )
 os.environ["LOGURU_FORMAT"] = LOG_FORMAT
+# Format of the log files, records of a job run are tagged with the job id and run id
+TEXT_FORMAT = LOG_FORMAT.replace("{message}", "{extra[job_tag]}{message}") + "\n{exception}"
 
 from loguru import logger as server_log
 
-from .config import LOG_PATH
+from .config import LOG_COMPRESSION, LOG_PATH, LOG_RETENTION, LOG_STRUCTURED, SCHEDULER_DAEMON
+from .log_archive import compress_log
 
 if TYPE_CHECKING:
     from loguru import Record
 
 PARSE_PATTERN = re.compile(
     r"\[\s*(?P<pid>\d+)\] (?P<time>[\d\s:-]+) \| "
+    r"(?P<level>\w+)\s*\| (?P<name>.*?):(?P<line>\d+)\s"
+    r"(?:\[job (?P<job_id>[^\n]+?) (?P<run_id>[0-9a-f]+)\] )?"
     # (?=\n\[|\Z): message match until next line start or end
-    r"(?P<level>\w+)\s*\| (?P<name>.*?):(?P<line>\d+)\s(?P<message>.*?)(?=\n\[|\Z)",
+    r"(?P<message>.*?)(?=\n\[|\Z)",
     flags=re.S,  # match multiple lines
 )
+# Fields of a record written by `structured_format` in their order, the message is the last field
+# so the other fields can still be parsed when a huge record is truncated
+STRUCTURED_PATTERN = re.compile(
+    r'\{"pid": (?P<pid>\d+), "time": "(?P<time>[^"]*)", "level": "(?P<level>\w+)", '
+    r'"module": "(?P<name>[^"]*)", "line": (?P<line>\d+), '
+    r'"job_id": (?P<job_id>null|"(?:[^"\\]|\\.)*"), "run_id": (?P<run_id>null|"[0-9a-f]*"), '
+    r'"message": '
+)
 
 
 def filter_server_record(record: "Record") -> bool:
@@ -34,22 +50,101 @@ def filter_server_record(record: "Record") -> bool:
     return bool(record["name"] and record["name"].startswith(("apscheduler.", "src.")))
 
 
-server_log.add(
-    # Log file for WebUI and apscheduler
-    LOG_PATH / "scheduler.log",
-    diagnose=False,
-    enqueue=True,
-    filter=filter_server_record,
-    rotation="100 MB",
-)
-server_log.add(
-    # Log file for jobs (rotated daily)
-    LOG_PATH / "jobs.{time:YYYY-MM-DD}.log",
-    diagnose=False,
-    enqueue=True,
-    filter=lambda record: not filter_server_record(record),
-    rotation=datetime.time(0, 0),
-)
+def text_format(record: "Record") -> str:
+    """Format function of loguru, `LOG_FORMAT` with the job and run id of the record."""
+
+    extra = record["extra"]
+    # The run id is only bound by the executors in src/executors.py, together with the job id
+    extra["job_tag"] = f"[job {extra['job_id']} {extra['run_id']}] " if "run_id" in extra else ""
+    return TEXT_FORMAT
+
+
+def structured_format(record: "Record") -> str:
+    """Format function of loguru, write the record as one JSON line(newlines are escaped)."""
+
+    message = record["message"]
+    if record["exception"]:
+        message += "\n" + "".join(traceback.format_exception(*record["exception"])).rstrip()
+    fields = {
+        "pid": record["process"].id,
+        "time": record["time"].strftime("%Y-%m-%d %H:%M:%S"),
+        "level": record["level"].name,
+        "module": record["name"] or "",
+        "line": record["line"],
+        "job_id": record["extra"].get("job_id"),
+        "run_id": record["extra"].get("run_id"),
+        "message": message,
+    }
+    # Structured fields bound by `logger.bind(fields=...)`, e.g. the result of a `uv_run`
+    if extra_fields := record["extra"].get("fields"):
+        fields["fields"] = extra_fields
+    record["extra"]["structured"] = json.dumps(fields, ensure_ascii=False, default=str)
+    return "{extra[structured]}\n"
+
+
+# Ids of the log file sinks, and whether this process rotates, compresses and expires the files
+_sink_ids: list[int] = []
+_owner = False
+
+
+def add_log_files(owner: bool) -> None:
+    """
+    Add the log file sinks, replacing the ones added before.
+
+    Args:
+        owner (bool): Rotate, compress and expire the log files. With `SCHEDULER_DAEMON` only the
+            daemon does, a WebUI process appends its records to the scheduler log and reopens it
+            once the daemon has rotated it(the records of jobs are written by the daemon).
+    """
+
+    global _owner
+    for sink_id in _sink_ids:
+        server_log.remove(sink_id)
+    _sink_ids.clear()
+    _owner = owner
+    formats = {".log": text_format}
+    if LOG_STRUCTURED:
+        # Same records in JSON lines, parsed by WebUI without scanning the text format
+        formats[".jsonl"] = structured_format
+    rotating = {
+        "retention": LOG_RETENTION,
+        "compression": compress_log if LOG_COMPRESSION else None,
+    }
+    for suffix, format_ in formats.items():
+        _sink_ids.append(
+            server_log.add(
+                # Log file for WebUI and apscheduler
+                LOG_PATH / f"scheduler{suffix}",
+                format=format_,
+                diagnose=False,
+                enqueue=True,
+                filter=filter_server_record,
+                **({"rotation": "100 MB", **rotating} if owner else {"watch": True}),
+            )
+        )
+        if owner:
+            _sink_ids.append(
+                server_log.add(
+                    # Log file for jobs (rotated daily)
+                    LOG_PATH / f"jobs.{{time:YYYY-MM-DD}}{suffix}",
+                    format=format_,
+                    diagnose=False,
+                    enqueue=True,
+                    filter=lambda record: not filter_server_record(record),
+                    rotation=datetime.time(0, 0),
+                    **rotating,
+                )
+            )
+
+
+def owns_log_files() -> bool:
+    return _owner
+
+
+# The scheduler daemon takes the log files over once it starts, see `daemon.py`. The processes of
+# a process pool send their records to the scheduler process, see `src/executors.py`.
+if multiprocessing.parent_process() is None:
+    add_log_files(owner=not SCHEDULER_DAEMON)
 
 
 # Intercept standard logging messages to use Loguru
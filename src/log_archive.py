@@ -0,0 +1,193 @@
+"""
+Compressed archives of the rotated log files, and transparent reading of plain or compressed logs.
+
+A rotated log is compressed block by block: each block of about `LOG_COMPRESSION_BLOCK` bytes
+(cut at the end of a line) is an independent gzip member or zstd frame, so the archive is still
+a valid `.gz`/`.zst` file for the usual tools. The uncompressed and compressed start offset of
+each block are saved in `LOG_INDEX_PATH / "{name}.blocks"`, reading an uncompressed range only
+decompresses the blocks covering it.
+"""
+
+import gzip
+import os
+import threading
+import zlib
+from array import array
+from bisect import bisect_right
+from pathlib import Path
+
+from .config import LOG_COMPRESSION, LOG_COMPRESSION_BLOCK, LOG_INDEX_PATH
+
+COMPRESSED_SUFFIXES = (".gz", ".zst")
+# Held while a compressed log and its sidecar files are put in place of the rotated log, the
+# sidecar files of the removed logs are pruned under it
+compression_lock = threading.Lock()
+# Threads compressing the rotated logs, joined on shutdown so no partial archive is left
+_compressions: set[threading.Thread] = set()
+
+
+def is_compressed(path: Path) -> bool:
+    return path.suffix in COMPRESSED_SUFFIXES
+
+
+def _compress_block(data: bytes, suffix: str) -> bytes:
+    if suffix == ".gz":
+        return gzip.compress(data, mtime=0)
+    import zstandard  # type: ignore
+
+    return zstandard.ZstdCompressor().compress(data)
+
+
+def _decompress_block(data: bytes, suffix: str) -> bytes:
+    if suffix == ".gz":
+        return zlib.decompress(data, wbits=31)
+    import zstandard  # type: ignore
+
+    return zstandard.ZstdDecompressor().decompress(data)
+
+
+class PlainLog:
+    """Random access reader of a plain log file."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._file = path.open("rb")
+
+    @property
+    def inode(self) -> int:
+        return os.fstat(self._file.fileno()).st_ino
+
+    @property
+    def size(self) -> int:
+        return os.fstat(self._file.fileno()).st_size
+
+    def read(self, offset: int, size: int) -> bytes:
+        self._file.seek(offset)
+        return self._file.read(size)
+
+    def close(self) -> None:
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+
+class CompressedLog(PlainLog):
+    """Random access reader of a block compressed log file, offsets are uncompressed offsets."""
+
+    def __init__(self, path: Path) -> None:
+        super().__init__(path)
+        self._starts = array("Q")  # uncompressed start of each block and the total size at last
+        self._positions = array("Q")  # compressed start of each block and the file size at last
+        self._cache: tuple[int, bytes] = (-1, b"")  # last decompressed block
+        try:
+            blocks = array("Q")
+            with (LOG_INDEX_PATH / f"{path.name}.blocks").open("rb") as f:
+                blocks.frombytes(f.read())
+            self._starts, self._positions = blocks[0::2], blocks[1::2]
+        except OSError:
+            self._scan_blocks()
+
+    def _scan_blocks(self) -> None:
+        """Find the blocks of an archive without block table, e.g. compressed by other tools."""
+
+        data = self._file.read()
+        self._starts, self._positions = array("Q", [0]), array("Q", [0])
+        if self.path.suffix == ".gz":
+            # Each gzip member is a block
+            position, start = 0, 0
+            while position < len(data):
+                decompressor = zlib.decompressobj(wbits=31)
+                start += len(decompressor.decompress(data[position:]))
+                position = len(data) - len(decompressor.unused_data)
+                self._starts.append(start)
+                self._positions.append(position)
+        else:
+            # Treat the whole archive as one block
+            self._starts.append(len(_decompress_block(data, self.path.suffix)))
+            self._positions.append(len(data))
+
+    @property
+    def size(self) -> int:
+        return self._starts[-1]
+
+    def _block(self, block: int) -> bytes:
+        if self._cache[0] != block:
+            position = self._positions[block]
+            self._file.seek(position)
+            data = self._file.read(self._positions[block + 1] - position)
+            self._cache = (block, _decompress_block(data, self.path.suffix))
+        return self._cache[1]
+
+    def read(self, offset: int, size: int) -> bytes:
+        chunks = []
+        block = bisect_right(self._starts, offset) - 1
+        end = min(offset + size, self.size)
+        while offset < end and block < len(self._starts) - 1:
+            start = self._starts[block]
+            chunk = self._block(block)[offset - start : end - start]
+            chunks.append(chunk)
+            offset += len(chunk)
+            block += 1
+        return b"".join(chunks)
+
+
+def open_log(path: Path) -> PlainLog:
+    """Open a plain or compressed log file for random access."""
+
+    return CompressedLog(path) if is_compressed(path) else PlainLog(path)
+
+
+def _compress(path: Path, suffix: str) -> None:
+    try:
+        _write_archive(path, suffix)
+    finally:
+        _compressions.discard(threading.current_thread())
+
+
+def _write_archive(path: Path, suffix: str) -> None:
+    target = path.with_name(path.name + suffix)
+    tmp = target.with_name(target.name + ".tmp")
+    blocks = array("Q")
+    with path.open("rb") as src, tmp.open("wb") as dst:
+        start, rest = 0, b""
+        while data := rest + src.read(LOG_COMPRESSION_BLOCK):
+            # Cut the block at the end of the last complete line
+            end = data.rfind(b"\n") + 1 or len(data)
+            blocks.extend((start, dst.tell()))
+            dst.write(_compress_block(data[:end], suffix))
+            start, rest = start + end, data[end:]
+        blocks.extend((start, dst.tell()))
+
+    # Offsets of records are not changed, reuse the index of the plain file
+    from .log_index import move_index
+
+    LOG_INDEX_PATH.mkdir(parents=True, exist_ok=True)
+    with compression_lock:
+        (LOG_INDEX_PATH / f"{target.name}.blocks").write_bytes(blocks.tobytes())
+        os.replace(tmp, target)
+        move_index(path, target)
+    path.unlink()
+
+
+def compress_log(path: str) -> None:
+    """
+    Compression function of the loguru sinks, compress the rotated log file in a background
+    thread so the logging is not blocked.
+    """
+
+    suffix = f".{LOG_COMPRESSION}"
+    # Not a daemon thread, the interpreter waits for it at exit
+    thread = threading.Thread(target=_compress, args=(Path(path), suffix), name="log-compression")
+    _compressions.add(thread)
+    thread.start()
+
+
+def wait_compressions() -> None:
+    """Wait for the rotated logs being compressed."""
+
+    for thread in list(_compressions):
+        thread.join()
@@ -0,0 +1,505 @@
+"""
+Persistent sidecar index for the log files written by `src/log.py`.
+
+For every record the index keeps its byte offset in the log file and a key pointing into a
+small table of distinct `(pid, level, module, job id)` tuples, so a page of records can be located
+without parsing the whole file. The index is stored next to the logs in `LOG_INDEX_PATH`:
+
+- `{name}.off`: offsets of the records (array of unsigned 64-bit integers)
+- `{name}.key`: key of each record (array of unsigned 32-bit integers)
+- `{name}.json`: inode and indexed size of the log file, the record count, the key table and
+  the record count of each key
+
+It is built incrementally: only the bytes appended since the last refresh are scanned. Offsets are
+uncompressed offsets, the same index serves a log file after it is compressed, see
+`src/log_archive.py`. Structured logs(`*.jsonl`, see `structured_format`) have one record per line,
+they are indexed and parsed line by line instead of scanning the text format.
+"""
+
+import json
+import os
+import re
+import threading
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from collections.abc import Callable, Iterable, Iterator
+from contextlib import contextmanager
+from pathlib import Path
+
+from .config import LOG_INDEX_PATH, LOG_PATH
+from .log import PARSE_PATTERN, STRUCTURED_PATTERN
+from .log_archive import COMPRESSED_SUFFIXES, compression_lock, open_log
+
+try:
+    import fcntl
+except ImportError:  # Windows, only the threads of one process are locked out
+    fcntl = None
+
+# Header of a record, must be kept in sync with `LOG_FORMAT` and `PARSE_PATTERN`
+RECORD_HEADER = re.compile(
+    rb"^\[\s*(?P<pid>\d+)\] [\d :-]+ \| (?P<level>\w+)\s*\| (?P<name>[^\n]*?):\d+\s"
+    rb"(?:\[job (?P<job_id>[^\n]+?) [0-9a-f]+\] )?",
+    flags=re.M,
+)
+# Beginning of a line of the structured logs, must be kept in sync with `STRUCTURED_PATTERN`
+STRUCTURED_HEADER = re.compile(
+    rb'^\{"pid": (?P<pid>\d+), "time": "[^"]*", "level": "(?P<level>\w+)", '
+    rb'"module": "(?P<name>[^"]*)", "line": \d+, "job_id": (?P<job_id>null|"(?:[^"\\]|\\.)*")',
+    flags=re.M,
+)
+STRUCTURED_SUFFIX = ".jsonl"
+SCAN_CHUNK = 4 * 1024 * 1024
+INDEX_CACHE_SIZE = 8
+SIDECAR_SUFFIXES = (".off", ".key", ".json", ".blocks")
+JOB_LOG_PATTERN = re.compile(r".+\.(log|jsonl)(\.gz|\.zst)?")
+SCHEDULER_LOG_PATTERN = re.compile(r"scheduler(\.[\d_-]+)?\.(log|jsonl)(\.gz|\.zst)?")
+# Records larger than this are truncated when read, avoid loading a huge traceback into memory
+MAX_RECORD_SIZE = 64 * 1024
+
+# Bumped when the format of the sidecar files changes, older indexes are rebuilt
+INDEX_VERSION = 2
+# Lock of the sidecar files across the processes indexing the same logs(the WebUI workers and
+# the daemon)
+INDEX_LOCK = LOG_INDEX_PATH / "index.lock"
+
+Key = tuple[int, str, str, str]
+_decoder = json.JSONDecoder()
+_sidecar_lock = threading.Lock()
+
+
+@contextmanager
+def _lock_sidecars() -> Iterator[None]:
+    with _sidecar_lock:
+        LOG_INDEX_PATH.mkdir(parents=True, exist_ok=True)
+        if fcntl is None:
+            yield
+            return
+        with open(INDEX_LOCK, "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            yield
+
+
+def is_structured(path: Path) -> bool:
+    return STRUCTURED_SUFFIX in path.suffixes
+
+
+def _decode_message(text: str) -> str | None:
+    """Decode the JSON string of a message, which may be cut by the truncation."""
+
+    try:
+        return _decoder.raw_decode(text)[0]
+    except ValueError:
+        pass
+    # Drop the incomplete escape sequence at the end, at most 5 characters of "\uXXXX"
+    for end in range(len(text), max(len(text) - 6, 0), -1):
+        try:
+            return json.loads(f'{text[:end]}"')
+        except ValueError:
+            continue
+    return None
+
+
+def _parse_structured(text: str, truncated: str) -> dict[str, str] | None:
+    try:
+        fields = json.loads(text)
+        record: dict[str, str] = {
+            "pid": str(fields["pid"]),
+            "time": fields["time"],
+            "level": fields["level"],
+            "name": fields["module"],
+            "line": str(fields["line"]),
+            "message": fields["message"],
+        }
+        job_id, run_id = fields.get("job_id"), fields.get("run_id")
+    except (ValueError, KeyError, TypeError):
+        # Truncated record, parse the fields before the message and the part of the message
+        if not (match := STRUCTURED_PATTERN.match(text)):
+            return None
+        record = match.groupdict()
+        job_id, run_id = json.loads(record.pop("job_id")), json.loads(record.pop("run_id"))
+        if (message := _decode_message(text[match.end() :])) is None:
+            return None
+        record["message"] = message + truncated
+    if job_id is not None:
+        record["job_id"] = job_id
+    if run_id is not None:
+        record["run_id"] = run_id
+    return record
+
+
+def parse_record(
+    data: bytes, size: int | None = None, structured: bool = False
+) -> dict[str, str] | None:
+    """
+    Parse the raw bytes of one record, records larger than `MAX_RECORD_SIZE` are truncated.
+    `size` is the full size of the record if only its beginning was read, `structured` is
+    whether the record is a line of the structured logs.
+    """
+
+    size = len(data) if size is None else size
+    text = data[:MAX_RECORD_SIZE].decode(errors="replace")
+    truncated = ""
+    if size > MAX_RECORD_SIZE:
+        truncated = f"\n... ({size - MAX_RECORD_SIZE} bytes truncated)"
+    if structured:
+        return _parse_structured(text, truncated)
+    if not (match := PARSE_PATTERN.match(text + truncated)):
+        return None
+    record = {key: value for key, value in match.groupdict().items() if value is not None}
+    # The whole remaining text belongs to the message, even lines starting with "["
+    return record | {"message": (text + truncated)[match.start("message") :]}
+
+
+class LogIndex:
+    """Offsets and `(pid, level, module)` keys of all records in a log file."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.structured = is_structured(path)
+        self.lock = threading.Lock()
+        self.inode = 0
+        self.size = 0  # bytes of the log file covered by the index
+        self.offsets = array("Q")
+        self.keys = array("I")
+        self.key_table: list[Key] = []
+        self.key_counts = array("Q")  # record count of each key
+        self._key_codes: dict[Key, int] = {}
+        self._persisted = 0  # records already written to the sidecar files
+        self._load()
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def _sidecar(self, suffix: str) -> Path:
+        return LOG_INDEX_PATH / f"{self.path.name}{suffix}"
+
+    def _reset(self, inode: int = 0) -> None:
+        self.inode, self.size, self._persisted = inode, 0, 0
+        self.offsets, self.keys = array("Q"), array("I")
+        self.key_table, self.key_counts, self._key_codes = [], array("Q"), {}
+
+    def _saved_meta(self) -> dict | None:
+        try:
+            meta = json.loads(self._sidecar(".json").read_text())
+        except (OSError, ValueError):
+            return None
+        return meta if meta.get("version") == INDEX_VERSION else None
+
+    def _load(self) -> None:
+        try:
+            with _lock_sidecars():
+                if (meta := self._saved_meta()) is None:
+                    return
+                count = meta["count"]
+                offsets, keys = array("Q"), array("I")
+                key_counts = array("Q", meta["key_counts"])
+                with self._sidecar(".off").open("rb") as f:
+                    offsets.fromfile(f, count)
+                with self._sidecar(".key").open("rb") as f:
+                    keys.fromfile(f, count)
+        except (OSError, ValueError, KeyError, EOFError):
+            return  # missing or broken sidecar, rebuild from scratch
+
+        self.inode, self.size = meta["inode"], meta["size"]
+        self.offsets, self.keys, self._persisted = offsets, keys, count
+        self.key_table = [tuple(key) for key in meta["key_table"]]  # type: ignore
+        self.key_counts = key_counts
+        self._key_codes = {key: code for code, key in enumerate(self.key_table)}
+
+    def _save(self) -> None:
+        try:
+            with _lock_sidecars():
+                self._write_sidecars()
+        except OSError:
+            pass  # index still works in memory
+
+    def _write_sidecars(self) -> None:
+        # Another process may have saved the same file since, more or fewer of its records
+        meta = self._saved_meta()
+        saved = meta.get("count", 0) if meta and meta.get("inode") == self.inode else 0
+        if saved >= len(self.offsets):
+            self._persisted = len(self.offsets)
+            return
+        start = min(self._persisted, saved)
+        mode = "r+b" if start else "wb"
+        for suffix, values in ((".off", self.offsets), (".key", self.keys)):
+            with self._sidecar(suffix).open(mode) as f:
+                # Overwrite the records beyond `start`, the ones of a failed save included
+                f.seek(start * values.itemsize)
+                values[start:].tofile(f)
+                f.truncate()
+        # Metadata is written last, records beyond `count` are ignored when loading
+        meta = {
+            "version": INDEX_VERSION,
+            "inode": self.inode,
+            "size": self.size,
+            "count": len(self.offsets),
+            "key_table": self.key_table,
+            "key_counts": self.key_counts.tolist(),
+        }
+        tmp = self._sidecar(".json.tmp")
+        tmp.write_text(json.dumps(meta))
+        os.replace(tmp, self._sidecar(".json"))
+        self._persisted = len(self.offsets)
+
+    def _key_code(self, pid: bytes, level: bytes, name: bytes, job_id: bytes | None) -> int:
+        if job_id is None or job_id == b"null":
+            job = ""
+        elif self.structured:
+            job = json.loads(job_id)
+        else:
+            job = job_id.decode(errors="replace")
+        key = (int(pid), level.decode(), name.decode(errors="replace"), job)
+        if (code := self._key_codes.get(key)) is None:
+            code = self._key_codes[key] = len(self.key_table)
+            self.key_table.append(key)
+            self.key_counts.append(0)
+        self.key_counts[code] += 1
+        return code
+
+    def refresh(self) -> "LogIndex":
+        """Index the records appended since the last refresh."""
+
+        with self.lock:
+            try:
+                f = open_log(self.path)
+            except FileNotFoundError:
+                return self
+            with f:
+                inode, size = f.inode, f.size
+                if inode != self.inode or size < self.size:
+                    # The file was rotated or replaced
+                    self._reset(inode)
+                if size == self.size:
+                    return self
+
+                while chunk := f.read(self.size, SCAN_CHUNK):
+                    # Only scan complete lines, a partial line is scanned on next refresh
+                    end = chunk.rfind(b"\n") + 1
+                    if not end:
+                        if len(chunk) < SCAN_CHUNK:
+                            break
+                        end = len(chunk)  # a single huge line
+                    header = STRUCTURED_HEADER if self.structured else RECORD_HEADER
+                    for match in header.finditer(chunk, 0, end):
+                        self.offsets.append(self.size + match.start())
+                        key = match.group("pid", "level", "name", "job_id")
+                        self.keys.append(self._key_code(*key))
+                    self.size += end
+            self._save()
+        return self
+
+    def _match_codes(self, level: str, module: str, job_id: str) -> set[int]:
+        return {
+            code
+            for code, (_, key_level, name, key_job_id) in enumerate(self.key_table)
+            if (not level or level == key_level)
+            and module in name
+            and (not job_id or job_id == key_job_id)
+        }
+
+    def count(self, level: str = "", module: str = "", job_id: str = "") -> int:
+        """Count the records matching the level(exactly), module(substring) and job id(exactly)."""
+
+        return sum(self.key_counts[code] for code in self._match_codes(level, module, job_id))
+
+    def select(
+        self, level: str = "", module: str = "", job_id: str = "", reverse: bool = False
+    ) -> Iterable[int]:
+        """Lazily yield positions of the records matching the level, module and job id."""
+
+        codes = self._match_codes(level, module, job_id)
+        positions = range(len(self.offsets))
+        if reverse:
+            positions = positions[::-1]
+        if len(codes) == len(self.key_table):
+            return positions
+        return (pos for pos in positions if self.keys[pos] in codes)
+
+    def position(self, offset: int) -> int:
+        """Position of the record starting at the offset."""
+
+        return bisect_left(self.offsets, offset)
+
+    def span(self, pos: int) -> tuple[int, int]:
+        """Start and end offset of the record at the position."""
+
+        end = self.offsets[pos + 1] if pos + 1 < len(self.offsets) else self.size
+        return self.offsets[pos], end
+
+    def read(self, positions: Iterable[int]) -> Iterator[dict[str, str]]:
+        """Lazily read and parse the records at the given positions."""
+
+        with open_log(self.path) as f:
+            for pos in positions:
+                start, end = self.span(pos)
+                data = f.read(start, min(end - start, MAX_RECORD_SIZE))
+                if record := parse_record(data, end - start, self.structured):
+                    yield record
+
+
+class LogTail:
+    """
+    Follow a log file from an offset and read the records appended to it.
+
+    `resolve` returns the file which should be followed, e.g. the newest daily job log. When it
+    returns another file, or the followed file was renamed(size rotation) or truncated, the rest
+    of the current file is drained and the new file is followed from its beginning.
+    """
+
+    def __init__(self, path: Path, offset: int, resolve: Callable[[], Path] | None = None) -> None:
+        self.resolve = resolve or (lambda: path)
+        self._open(path, offset)
+
+    def _open(self, path: Path, offset: int = 0) -> None:
+        self.path = path
+        self.structured = is_structured(path)
+        self._file = path.open("rb")
+        self._file.seek(offset)
+        self._inode = os.fstat(self._file.fileno()).st_ino
+        self._buffer = b""  # last record may be still being written
+
+    def close(self) -> None:
+        self._file.close()
+
+    def _rotated(self) -> Path | None:
+        target = self.resolve()
+        try:
+            stat = target.stat()
+        except FileNotFoundError:
+            return None
+        if target != self.path or stat.st_ino != self._inode or stat.st_size < self._file.tell():
+            return target
+        return None
+
+    def read(self) -> list[dict[str, str]]:
+        """Read the records appended since the last call, costs O(new bytes)."""
+
+        appended = self._file.read()
+        data = self._buffer + appended
+        # The last record is complete if nothing was appended since the previous read
+        complete = not appended and data.endswith(b"\n")
+        structured = self.structured
+        if target := self._rotated():
+            # Drain the old file, everything left in it is complete
+            data += self._file.read()
+            complete = True
+            self._file.close()
+            self._open(target)
+
+        if structured:
+            # Each line is a record, only the last line may be incomplete
+            end = len(data) if complete else data.rfind(b"\n") + 1
+            data, self._buffer = data[:end], data[end:]
+            return [
+                record
+                for line in data.splitlines()
+                if (record := parse_record(line, structured=True)) is not None
+            ]
+
+        starts = [match.start() for match in RECORD_HEADER.finditer(data)]
+        if complete:
+            ends, self._buffer = [*starts[1:], len(data)], b""
+        else:
+            ends, self._buffer = starts[1:], data[starts[-1] :] if starts else data
+        if len(self._buffer) > SCAN_CHUNK and not starts:
+            self._buffer = b""  # not a log file of loguru
+        return [
+            record
+            for start, end in zip(starts, ends)
+            if (record := parse_record(data[start:end])) is not None
+        ]
+
+
+_log_files: tuple[int, list[Path]] = (0, [])
+
+
+def _base_name(path: Path) -> str:
+    """Name of the log file without the format and compression suffix."""
+
+    name = path.name
+    for suffix in COMPRESSED_SUFFIXES:
+        name = name.removesuffix(suffix)
+    return name.rsplit(".", 1)[0]
+
+
+def _list_log_files() -> list[Path]:
+    """
+    All plain and compressed log files in `LOG_PATH`, newest first. A text log is hidden if
+    the structured log of the same records exists.
+    """
+    global _log_files
+
+    # Files are only listed again when the directory is changed (file added, removed or renamed)
+    mtime = LOG_PATH.stat().st_mtime_ns
+    if mtime != _log_files[0]:
+        files = [file for file in LOG_PATH.iterdir() if JOB_LOG_PATTERN.fullmatch(file.name)]
+        structured = {_base_name(file) for file in files if is_structured(file)}
+        files = sorted(
+            (file for file in files if is_structured(file) or _base_name(file) not in structured),
+            reverse=True,
+        )
+        _log_files = (mtime, files)
+    return _log_files[1]
+
+
+def job_log_files() -> list[Path]:
+    """Job log files in `LOG_PATH`, newest first."""
+
+    return [file for file in _list_log_files() if not SCHEDULER_LOG_PATTERN.fullmatch(file.name)]
+
+
+def scheduler_log_files() -> list[Path]:
+    """Log files of APScheduler and WebUI in `LOG_PATH`, newest first."""
+
+    return [file for file in _list_log_files() if SCHEDULER_LOG_PATTERN.fullmatch(file.name)]
+
+
+def move_index(src: Path, dst: Path) -> None:
+    """Move the index of a log file to another file with the same content, e.g. after compressed."""
+
+    with _indexes_lock:
+        _indexes.pop(src, None)
+    # Not while another process saves or loads the sidecar files
+    with _lock_sidecars():
+        try:
+            meta = json.loads((LOG_INDEX_PATH / f"{src.name}.json").read_text())
+            for suffix in (".off", ".key"):
+                os.replace(
+                    LOG_INDEX_PATH / f"{src.name}{suffix}", LOG_INDEX_PATH / f"{dst.name}{suffix}"
+                )
+        except (OSError, ValueError):
+            return  # not indexed yet
+        meta["inode"] = dst.stat().st_ino
+        (LOG_INDEX_PATH / f"{dst.name}.json").write_text(json.dumps(meta))
+        (LOG_INDEX_PATH / f"{src.name}.json").unlink()
+
+
+def prune_indexes() -> None:
+    """Remove the sidecar files of the removed log files, e.g. removed by the retention."""
+
+    if not LOG_INDEX_PATH.exists():
+        return
+    # Not while the sidecar files of a compressed log are written before it's in place
+    with compression_lock:
+        for sidecar in LOG_INDEX_PATH.iterdir():
+            name, suffix = os.path.splitext(sidecar.name)
+            if suffix in SIDECAR_SUFFIXES and not (LOG_PATH / name).exists():
+                sidecar.unlink(missing_ok=True)
+
+
+_indexes: OrderedDict[Path, LogIndex] = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def get_log_index(path: Path) -> LogIndex:
+    """Get the up-to-date index of a log file, recently used indexes are kept in memory."""
+
+    with _indexes_lock:
+        if (index := _indexes.pop(path, None)) is None:
+            index = LogIndex(path)
+        _indexes[path] = index
+        while len(_indexes) > INDEX_CACHE_SIZE:
+            _indexes.popitem(last=False)
+    return index.refresh()
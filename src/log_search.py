@@ -0,0 +1,311 @@
+"""
+Full-text search across all job log files.
+
+The message and module of each job log record are tokenized into a SQLite FTS5 table (an inverted
+index) stored in `LOG_INDEX_PATH / "search.db"`. The rowid refers to the file and offset of the
+record in table `records` and the record itself is read from the log file when displayed. With
+SQLite 3.43+ the table is contentless(`contentless_delete=1`) and only keeps the tokens, older
+versions can't delete the tokens of a contentless table, the module and message are kept in
+`records` as its external content. The tokens of a removed log file are deleted with its records.
+
+The index is updated incrementally with the record offsets of `LogIndex`: each file remembers
+how many of its records were indexed. Files are recorded by their name without the compression
+suffix, a compressed log keeps the offsets of its records and is not indexed again, a file
+replaced by another one(a new inode) is indexed again and a file whose size and inode are
+unchanged since it was fully indexed is skipped. A background
+thread catches up every `LOG_SEARCH_INTERVAL` seconds and every search catches up first, so new
+records are found as soon as loguru writes them.
+"""
+
+import sqlite3
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import closing, contextmanager
+from pathlib import Path
+
+from .config import LOG_INDEX_PATH, LOG_PATH, LOG_SEARCH_INTERVAL
+from .log import owns_log_files, server_log
+from .log_archive import COMPRESSED_SUFFIXES, is_compressed, open_log
+from .log_index import (
+    MAX_RECORD_SIZE,
+    get_log_index,
+    is_structured,
+    job_log_files,
+    parse_record,
+    prune_indexes,
+)
+
+try:
+    import fcntl
+except ImportError:  # Windows, only the threads of one process are locked out
+    fcntl = None
+
+SEARCH_DB = LOG_INDEX_PATH / "search.db"
+SEARCH_LOCK = LOG_INDEX_PATH / "search.lock"
+# Records written in the last seconds may be still incomplete
+SETTLE_TIME = 5
+BATCH_SIZE = 5000
+
+# Tokens of a contentless table can be deleted since SQLite 3.43
+CONTENTLESS_DELETE = sqlite3.sqlite_version_info >= (3, 43, 0)
+# Version of the schema in `PRAGMA user_version`, the index is rebuilt when it changes
+SEARCH_VERSION = 3 if CONTENTLESS_DELETE else 2
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY, name TEXT UNIQUE, count INTEGER, size INTEGER, inode INTEGER
+);
+-- AUTOINCREMENT: the rowid increases with the time of the records
+CREATE TABLE IF NOT EXISTS records (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, file_id INTEGER, offset INTEGER, size INTEGER,
+    name TEXT, message TEXT
+);
+CREATE INDEX IF NOT EXISTS records_file ON records(file_id);
+CREATE VIRTUAL TABLE IF NOT EXISTS tokens USING fts5(
+    name, message, {"content='', contentless_delete=1" if CONTENTLESS_DELETE else
+    "content='records', content_rowid='id'"}
+);
+"""
+
+_update_lock = threading.Lock()
+_stop = threading.Event()
+
+
+@contextmanager
+def connect() -> Iterator[sqlite3.Connection]:
+    LOG_INDEX_PATH.mkdir(parents=True, exist_ok=True)
+    with closing(sqlite3.connect(SEARCH_DB, timeout=30)) as db:
+        db.execute("PRAGMA journal_mode=WAL")
+        _migrate(db)
+        db.executescript(SCHEMA)
+        yield db
+
+
+def _migrate(db: sqlite3.Connection) -> None:
+    """Drop the index of another schema version, it's rebuilt from the log files."""
+
+    if db.execute("PRAGMA user_version").fetchone()[0] == SEARCH_VERSION:
+        return
+    db.execute("BEGIN IMMEDIATE")
+    if db.execute("PRAGMA user_version").fetchone()[0] != SEARCH_VERSION:
+        for table in ("tokens", "records", "files"):
+            db.execute(f"DROP TABLE IF EXISTS {table}")
+        db.execute(f"PRAGMA user_version = {SEARCH_VERSION}")
+    db.commit()
+
+
+def _log_name(path: Path) -> str:
+    """Name of the log file without compression suffix."""
+
+    return path.stem if path.suffix in COMPRESSED_SUFFIXES else path.name
+
+
+def _log_path(name: str) -> Path | None:
+    for suffix in ("", *COMPRESSED_SUFFIXES):
+        if (path := LOG_PATH / f"{name}{suffix}").exists():
+            return path
+    return None
+
+
+def _remove_file(db: sqlite3.Connection, file_id: int) -> None:
+    if CONTENTLESS_DELETE:
+        db.execute(
+            "DELETE FROM tokens WHERE rowid IN (SELECT id FROM records WHERE file_id = ?)",
+            (file_id,),
+        )
+    else:
+        # The tokens of an external content table are deleted with the values they were
+        # inserted with
+        db.execute(
+            "INSERT INTO tokens (tokens, rowid, name, message) "
+            "SELECT 'delete', id, name, message FROM records WHERE file_id = ?",
+            (file_id,),
+        )
+    db.execute("DELETE FROM records WHERE file_id = ?", (file_id,))
+
+
+def _index_file(
+    db: sqlite3.Connection, path: Path, file: tuple[int, int, int | None] | None
+) -> None:
+    """Index the new records of the file, `file` is its id, indexed count and inode if known."""
+
+    stat = path.stat()
+    index = get_log_index(path)
+    if file is None:
+        file_id = db.execute(
+            "INSERT INTO files (name, count) VALUES (?, 0)", (_log_name(path),)
+        ).lastrowid
+        count = 0
+    else:
+        file_id, count, inode = file
+        # The inode of a log changes when it's compressed, the offsets of its records don't
+        replaced = inode is not None and inode != stat.st_ino and not is_compressed(path)
+        if replaced or count > len(index):
+            # The file was replaced, index it again
+            _remove_file(db, file_id)
+            count = 0
+
+    end = len(index)
+    if end and time.time() - stat.st_mtime < SETTLE_TIME:
+        end -= 1  # the last record may be still being written
+    for batch_start in range(count, end, BATCH_SIZE):
+        positions = range(batch_start, min(batch_start + BATCH_SIZE, end))
+        for pos, record in zip(positions, index.read(positions)):
+            start, stop = index.span(pos)
+            # The external content of the tokens, not needed by a contentless table
+            text = (None, None) if CONTENTLESS_DELETE else (record["name"], record["message"])
+            rowid = db.execute(
+                "INSERT INTO records (file_id, offset, size, name, message) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (file_id, start, stop - start, *text),
+            ).lastrowid
+            db.execute(
+                "INSERT INTO tokens (rowid, name, message) VALUES (?, ?, ?)",
+                (rowid, record["name"], record["message"]),
+            )
+        count = positions.stop
+        # Commit each batch, a large file is indexed across several updates if interrupted
+        db.execute("UPDATE files SET count = ? WHERE id = ?", (count, file_id))
+        db.commit()
+    # Skip the file until it changes once all of its records are indexed
+    size = stat.st_size if count == len(index) else None
+    db.execute(
+        "UPDATE files SET count = ?, size = ?, inode = ? WHERE id = ?",
+        (count, size, stat.st_ino, file_id),
+    )
+    db.commit()
+
+
+@contextmanager
+def _update_index_lock(wait: bool) -> Iterator[bool]:
+    """Lock of the updates across threads and processes(the WebUI workers and the daemon)."""
+
+    if not _update_lock.acquire(blocking=wait):
+        yield False
+        return
+    try:
+        if fcntl is None:
+            yield True
+            return
+        LOG_INDEX_PATH.mkdir(parents=True, exist_ok=True)
+        with open(SEARCH_LOCK, "w") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | (0 if wait else fcntl.LOCK_NB))
+            except BlockingIOError:
+                yield False
+                return
+            yield True
+    finally:
+        _update_lock.release()
+
+
+def update_search_index(wait: bool = True) -> None:
+    """
+    Index the job log records written since the last update.
+
+    Args:
+        wait (bool): Wait for the running update, otherwise return immediately.
+    """
+
+    with _update_index_lock(wait) as locked:
+        if not locked:
+            return
+        with connect() as db:
+            files = {
+                name: (file_id, count, (size, inode))
+                for file_id, name, count, size, inode in db.execute(
+                    "SELECT id, name, count, size, inode FROM files"
+                )
+            }
+            # Oldest first, the rowid increases with the time of the records. While a log is
+            # being compressed both files exist, the compressed one is kept.
+            paths = {_log_name(path): path for path in reversed(job_log_files())}
+            for name in files.keys() - paths.keys():
+                _remove_file(db, files[name][0])
+                db.execute("DELETE FROM files WHERE id = ?", (files[name][0],))
+            db.commit()
+            for name, path in paths.items():
+                if (file := files.get(name)) is None:
+                    _index_file(db, path, None)
+                    continue
+                file_id, count, (size, inode) = file
+                stat = path.stat()
+                if (size, inode) != (stat.st_size, stat.st_ino):
+                    _index_file(db, path, (file_id, count, inode))
+        # The log files are removed by the process expiring them
+        if owns_log_files():
+            prune_indexes()
+
+
+def _match_expression(query: str) -> str:
+    """Quote each word of the query, the trailing '*' of a word means a prefix query."""
+
+    terms = []
+    for word in query.split():
+        prefix = word.endswith("*")
+        word = word.rstrip("*").replace('"', '""')
+        if word:
+            terms.append(f'"{word}"*' if prefix else f'"{word}"')
+    return " ".join(terms)
+
+
+def search_logs(query: str, limit: int, offset: int = 0) -> tuple[int, list[dict[str, str]]]:
+    """
+    Search the job log records containing all words of the query, newest first.
+
+    Returns:
+        tuple[int, list[dict[str, str]]]: Total count of the matched records and the parsed
+            records in the range, with the `file`, `offset` and `position`(in the file) of each
+            record.
+    """
+
+    if not (expression := _match_expression(query)):
+        return 0, []
+    # Catch up with the newest records, skip if the background thread is updating
+    update_search_index(wait=False)
+    with connect() as db:
+        (total,) = db.execute(
+            "SELECT count(*) FROM tokens JOIN records ON records.id = tokens.rowid "
+            "WHERE tokens MATCH ?",
+            (expression,),
+        ).fetchone()
+        rows = db.execute(
+            "SELECT files.name, records.offset, records.size FROM tokens "
+            "JOIN records ON records.id = tokens.rowid JOIN files ON files.id = records.file_id "
+            "WHERE tokens MATCH ? ORDER BY tokens.rowid DESC LIMIT ? OFFSET ?",
+            (expression, limit, offset),
+        ).fetchall()
+
+    records = []
+    for name, start, size in rows:
+        if not (path := _log_path(name)):
+            continue  # removed after searching
+        with open_log(path) as f:
+            data = f.read(start, min(size, MAX_RECORD_SIZE))
+        record = parse_record(data, size, structured=is_structured(path))
+        if record:
+            position = get_log_index(path).position(start)
+            records.append(
+                record | {"file": path.name, "offset": str(start), "position": str(position)}
+            )
+    return total, records
+
+
+def _run_indexer() -> None:
+    while not _stop.wait(LOG_SEARCH_INTERVAL):
+        try:
+            update_search_index()
+        except Exception:
+            server_log.exception("Failed to update the search index of job logs")
+
+
+def start_indexer() -> None:
+    """Start the background thread keeping the search index up to date."""
+
+    _stop.clear()
+    threading.Thread(target=_run_indexer, name="log-search-indexer", daemon=True).start()
+
+
+def stop_indexer() -> None:
+    _stop.set()
@@ -0,0 +1,150 @@
+"""
+Monitor of the event loop shared by the scheduler, the `AsyncIOExecutor` jobs and the WebUI.
+
+The loop lag is the delay of a timer sampled every `LOOP_LAG_INTERVAL` seconds, it's how long any
+ready callback waits before running. Slow callbacks are found by timing `asyncio.Handle._run`,
+the single place where the loop runs a callback(a step of a task, a timer...), for the handles of
+the monitored loop only, the other loops of the process(e.g. of a worker thread) run their
+callbacks untimed. The original method is restored once the monitor is stopped. A callback taking
+longer than `LOOP_SLOW_CALLBACK` seconds is recorded with its owner: the job of a coroutine job
+step(set by `src/executors.py`), the request of a route step(set by `LoopOwnerMiddleware`), or
+else the name of the coroutine or the function. Loops not using `asyncio.Handle`(uvloop) only
+get the lag.
+"""
+
+import asyncio
+import time
+from collections import deque
+from collections.abc import Callable
+from functools import partial
+from typing import Any
+
+from .config import LOOP_LAG_INTERVAL, LOOP_LAG_WINDOW, LOOP_SLOW_CALLBACK
+from .executors import loop_owner
+from .log import server_log
+
+# Recent slow callbacks kept for the dashboard and owners of slow callbacks counted
+SLOW_CALLBACK_HISTORY = 100
+MAX_OWNERS = 1000
+
+# (unix time, seconds) of the lag samples in the window
+lag_samples: deque[tuple[float, float]] = deque(maxlen=int(LOOP_LAG_WINDOW / LOOP_LAG_INTERVAL))
+# (unix time, owner, seconds) of the recent slow callbacks
+slow_callbacks: deque[tuple[float, str, float]] = deque(maxlen=SLOW_CALLBACK_HISTORY)
+# Count, total seconds, max seconds and unix time of the last slow callback by owner
+slow_owners: dict[str, list[float]] = {}
+
+_original_run = asyncio.Handle._run
+_lag_task: asyncio.Task | None = None
+_monitored_loop: asyncio.AbstractEventLoop | None = None
+
+
+def _owner(handle: asyncio.Handle) -> str:
+    callback = handle._callback  # type: ignore
+    while isinstance(callback, partial):
+        callback = callback.func
+    if isinstance(task := getattr(callback, "__self__", None), asyncio.Task):
+        # Only a task step, other callbacks(e.g. scheduler wakeups called by a request) inherit
+        # the context of whoever scheduled them
+        if owner := handle._context.get(loop_owner):  # type: ignore
+            return owner
+        coro = task.get_coro()
+        return f"task {getattr(coro, '__qualname__', task.get_name())}"
+    return getattr(callback, "__qualname__", None) or repr(callback)
+
+
+def _record_slow_callback(handle: asyncio.Handle, seconds: float) -> None:
+    owner = _owner(handle)
+    now = time.time()
+    slow_callbacks.append((now, owner, seconds))
+    if (stats := slow_owners.pop(owner, None)) is None:
+        stats = [0, 0.0, 0.0, 0.0]
+        if len(slow_owners) >= MAX_OWNERS:
+            del slow_owners[next(iter(slow_owners))]
+    stats[0] += 1
+    stats[1] += seconds
+    stats[2] = max(stats[2], seconds)
+    stats[3] = now
+    slow_owners[owner] = stats  # the most recent last
+    server_log.warning(f"Event loop blocked for {seconds:.3f}s by {owner}")
+
+
+def _timed_run(self: asyncio.Handle) -> None:
+    if self._loop is not _monitored_loop:  # type: ignore
+        return _original_run(self)
+    start = time.perf_counter()
+    _original_run(self)
+    if (seconds := time.perf_counter() - start) >= LOOP_SLOW_CALLBACK:  # type: ignore
+        _record_slow_callback(self, seconds)
+
+
+async def _sample_lag() -> None:
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + LOOP_LAG_INTERVAL
+        await asyncio.sleep(LOOP_LAG_INTERVAL)
+        lag_samples.append((time.time(), max(loop.time() - expected, 0.0)))
+
+
+def start_loop_monitor() -> None:
+    """Start sampling the lag of the running loop and timing the callbacks."""
+
+    global _lag_task, _monitored_loop
+
+    _monitored_loop = asyncio.get_running_loop()
+    if LOOP_SLOW_CALLBACK is not None:
+        asyncio.Handle._run = _timed_run  # type: ignore
+    _lag_task = _monitored_loop.create_task(_sample_lag(), name="loop-lag-monitor")
+
+
+def stop_loop_monitor() -> None:
+    global _lag_task, _monitored_loop
+
+    if asyncio.Handle._run is _timed_run:  # type: ignore
+        asyncio.Handle._run = _original_run  # type: ignore
+    _monitored_loop = None
+    if _lag_task is not None:
+        _lag_task.cancel()
+        _lag_task = None
+
+
+def lag_summary(samples: list[float]) -> dict[str, float]:
+    """Average, 50th/95th/99th percentile and max of the lag samples."""
+
+    if not samples:
+        return dict.fromkeys(("avg", "p50", "p95", "p99", "max"), 0.0)
+    samples = sorted(samples)
+    last = len(samples) - 1
+    return {
+        "avg": sum(samples) / len(samples),
+        "p50": samples[round(last * 0.5)],
+        "p95": samples[round(last * 0.95)],
+        "p99": samples[round(last * 0.99)],
+        "max": samples[-1],
+    }
+
+
+def lag_by_minute(minutes: int) -> list[tuple[float, list[float]]]:
+    """Lag samples of each of the last minutes with samples, newest first."""
+
+    by_minute: dict[float, list[float]] = {}
+    for sampled, lag in reversed(lag_samples):
+        minute = sampled // 60 * 60
+        if minute not in by_minute and len(by_minute) == minutes:
+            break
+        by_minute.setdefault(minute, []).append(lag)
+    return list(by_minute.items())
+
+
+class LoopOwnerMiddleware:
+    """ASGI middleware marking the callbacks of each request as owned by its route."""
+
+    def __init__(self, app: Any) -> None:
+        self.app = app
+
+    async def __call__(self, scope: dict, receive: Callable, send: Callable) -> None:
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        # Not reset, a request runs in its own task and the owner is read after each step of it
+        loop_owner.set(f"{scope['method']} {scope['path']}")
+        await self.app(scope, receive, send)
@@ -0,0 +1,285 @@
+"""
+Export of all jobs to a JSON or YAML manifest, and import of a manifest applying only its
+differences with the jobs in the job stores.
+
+An import compares each job of the manifest with the cached `JobInfo` snapshot of the live job
+(`src/job_query.py`), so an unchanged manifest neither loads nor writes any job. The jobs to add,
+update or remove are written in batches of `BULK_BATCH` per job store transaction by the bulk
+action machinery(`src/bulk.py`), with the same progress. An updated job keeps its next run time
+unless its trigger is changed or it's paused or resumed. Jobs not in the manifest are only
+removed with `prune`.
+"""
+
+import sys
+from collections import defaultdict
+from datetime import datetime
+from functools import partial
+from typing import TYPE_CHECKING, Literal
+
+from apscheduler.events import EVENT_JOB_ADDED, EVENT_JOB_MODIFIED, EVENT_JOB_REMOVED, JobEvent
+from apscheduler.job import Job
+from pydantic import ValidationError
+
+from .bulk import dispatch_events, record_batch, run_in_thread, start_task, write_jobs
+from .config import BULK_BATCH
+from .exceptions import OperationFailed
+from .job_query import load_jobs, query_job_infos
+from .scheduler import remember_written_jobs, scheduler
+from .schema import (
+    BulkProgress,
+    JobInfo,
+    JobManifest,
+    JobQuery,
+    ManifestChange,
+    ManifestJob,
+    ManifestPlan,
+)
+from .store_thread import flush
+from .uv import uv_run
+
+try:
+    import yaml
+
+    # The C implementation if PyYAML is built with libyaml
+    YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+    YamlDumper = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+except ImportError:
+    yaml = None
+
+if TYPE_CHECKING:
+    from apscheduler.triggers.base import BaseTrigger
+
+ManifestFormat = Literal["json", "yaml"]
+
+# Changes listed by a dry run
+MAX_PLAN_CHANGES = 1000
+
+# Definition of each job built from its snapshot, valid while the snapshot is cached
+_definitions: dict[tuple[str, str], tuple[JobInfo, ManifestJob]] = {}
+
+
+class Diff:
+    """Jobs to write by job store alias."""
+
+    def __init__(self) -> None:
+        self.added: dict[str, list[ManifestJob]] = defaultdict(list)
+        self.updated: dict[str, list[tuple[ManifestJob, bool]]] = defaultdict(list)
+        self.removed: dict[str, list[str]] = defaultdict(list)
+        self.unchanged = 0
+        self.errors: list[str] = []
+
+    def count(self) -> int:
+        return sum(
+            len(jobs)
+            for changes in (self.added, self.updated, self.removed)
+            for jobs in changes.values()
+        )
+
+
+def dump_manifest(jobs: list[ManifestJob], format: ManifestFormat) -> str:
+    manifest = JobManifest(jobs=jobs)
+    if format == "json":
+        return manifest.model_dump_json(indent=2)
+    if yaml is None:
+        raise OperationFailed("PyYAML is not installed, export the manifest as JSON")
+    return yaml.dump(
+        manifest.model_dump(mode="json"), Dumper=YamlDumper, sort_keys=False, allow_unicode=True
+    )
+
+
+def load_manifest(text: str | bytes) -> JobManifest:
+    """Parse a JSON or YAML manifest."""
+
+    try:
+        return JobManifest.model_validate_json(text)
+    except ValidationError as e:
+        if e.errors()[0]["type"] != "json_invalid":
+            raise
+    if yaml is None:
+        raise OperationFailed("Invalid JSON manifest, PyYAML is not installed for YAML")
+    try:
+        data = yaml.load(text, Loader=YamlLoader)
+    except yaml.YAMLError as e:
+        raise OperationFailed(f"Invalid manifest: {e}") from e
+    return JobManifest.model_validate(data)
+
+
+def live_jobs() -> list[ManifestJob]:
+    """All jobs of the job stores, from the cached snapshots when possible."""
+
+    global _definitions
+
+    _, infos = query_job_infos(JobQuery(), sys.maxsize)
+    definitions = {}
+    for info in infos:
+        key = (info.jobstore, info.id)
+        if (cached := _definitions.get(key)) is None or cached[0] is not info:
+            cached = (info, ManifestJob.from_info(info))
+        definitions[key] = cached
+    _definitions = definitions  # without the removed jobs
+    return [job for _, job in definitions.values()]
+
+
+def export_jobs() -> list[ManifestJob]:
+    return sorted(live_jobs(), key=lambda job: job.id)
+
+
+def _changed_fields(job: ManifestJob, live: ManifestJob) -> list[str]:
+    fields = ManifestJob.model_fields
+    return [field for field in fields if getattr(job, field) != getattr(live, field)]
+
+
+def diff_jobs(jobs: list[ManifestJob], prune: bool) -> tuple[Diff, list[ManifestChange]]:
+    """Jobs of the manifest to add, update and remove, and the first changes for a dry run."""
+
+    diff, changes = Diff(), []
+    live = {job.id: job for job in live_jobs()}
+
+    def change(job_id: str, kind: str, jobstore: str, fields: list[str] | None = None) -> None:
+        if len(changes) < MAX_PLAN_CHANGES:
+            changes.append(
+                ManifestChange(
+                    id=job_id, change=kind, jobstore=jobstore, fields=", ".join(fields or ())
+                )
+            )
+
+    for job in jobs:
+        if job.jobstore not in scheduler._jobstores:
+            diff.errors.append(f"Job {job.id}: job store {job.jobstore} not exists")
+            continue
+        if job.executor not in scheduler._executors:
+            diff.errors.append(f"Job {job.id}: executor {job.executor} not exists")
+            continue
+        if (live_job := live.pop(job.id, None)) is None:
+            diff.added[job.jobstore].append(job)
+            change(job.id, "add", job.jobstore)
+        elif live_job.jobstore != job.jobstore:
+            # Moved to another job store
+            diff.removed[live_job.jobstore].append(job.id)
+            diff.added[job.jobstore].append(job)
+            change(job.id, "remove", live_job.jobstore)
+            change(job.id, "add", job.jobstore)
+        elif job != live_job and (fields := _changed_fields(job, live_job)):
+            # The next run time is kept if only other fields are changed
+            rescheduled = bool({"trigger", "trigger_params", "paused"} & set(fields))
+            diff.updated[job.jobstore].append((job, rescheduled))
+            change(job.id, "update", job.jobstore, fields)
+        else:
+            diff.unchanged += 1
+    if prune:
+        for job_id, live_job in live.items():
+            diff.removed[live_job.jobstore].append(job_id)
+            change(job_id, "remove", live_job.jobstore)
+    return diff, changes
+
+
+def plan_import(jobs: list[ManifestJob], prune: bool) -> ManifestPlan:
+    diff, changes = diff_jobs(jobs, prune)
+    return ManifestPlan(
+        added=sum(map(len, diff.added.values())),
+        updated=sum(map(len, diff.updated.values())),
+        removed=sum(map(len, diff.removed.values())),
+        unchanged=diff.unchanged,
+        changes=changes,
+        errors=diff.errors[:MAX_PLAN_CHANGES],
+    )
+
+
+def _build_job(job: ManifestJob, alias: str, trigger: "BaseTrigger", next_run_time) -> Job:
+    func, args = job.func, tuple(job.args)
+    if func == "uv_run":
+        func, args = uv_run, (job.uv_script, *args)
+    new_job = Job(
+        scheduler,
+        id=job.id,
+        name=job.name,
+        func=func,
+        args=args,
+        kwargs=job.kwargs,
+        trigger=trigger,
+        executor=job.executor,
+        coalesce=job.coalesce,
+        max_instances=job.max_instances,
+        misfire_grace_time=job.misfire_grace_time,
+        next_run_time=next_run_time,
+    )
+    new_job._jobstore_alias = alias
+    return new_job
+
+
+def _write_batch(
+    alias: str,
+    added: list[ManifestJob],
+    updated: list[tuple[ManifestJob, bool]],
+    removed: list[str],
+) -> tuple[list[JobEvent], list[str]]:
+    """Write a batch of the changes of a job store, return the events and the errors."""
+
+    new_jobs, updated_jobs, errors = [], [], []
+    with scheduler._jobstores_lock:
+        if (store := scheduler._jobstores.get(alias)) is None:
+            count = len(added) + len(updated) + len(removed)
+            return [], [f"Job store {alias} was removed"] * count
+        now = datetime.now(scheduler.timezone)
+        # After the runs written behind by the I/O thread of the store
+        flush(store)
+        # The next run time of the live job, it may have run since the diff
+        current = load_jobs(store, [job.id for job, _ in updated]) if updated else {}
+        changes = [(job, False, False) for job in added]
+        changes += [(job, True, rescheduled) for job, rescheduled in updated]
+        for job, update, rescheduled in changes:
+            try:
+                trigger = job.get_trigger()
+                if job.paused:
+                    next_run_time = None
+                elif update and not rescheduled and job.id in current:
+                    next_run_time = current[job.id].next_run_time
+                elif (next_run_time := trigger.get_next_fire_time(None, now)) is None:
+                    errors.append(f"Job {job.id}: the trigger never fires")
+                    continue
+                new_job = _build_job(job, alias, trigger, next_run_time)
+            except Exception as e:
+                errors.append(f"Job {job.id}: {e}")
+                continue
+            # Removed since the diff, added again
+            (updated_jobs if job.id in current else new_jobs).append(new_job)
+        try:
+            write_jobs(store, new_jobs, updated_jobs, removed)
+            remember_written_jobs([*new_jobs, *updated_jobs])
+        except Exception as e:
+            return [], [f"Batch of {alias} failed: {e!r}"] * (len(changes) + len(removed))
+    events = [JobEvent(EVENT_JOB_REMOVED, job_id, alias) for job_id in removed]
+    events += [JobEvent(EVENT_JOB_ADDED, job.id, alias) for job in new_jobs]
+    events += [JobEvent(EVENT_JOB_MODIFIED, job.id, alias) for job in updated_jobs]
+    return events, errors
+
+
+async def _run_import(jobs: list[ManifestJob], prune: bool, progress: BulkProgress) -> None:
+    diff, _ = await run_in_thread(diff_jobs, jobs, prune)
+    progress.selected = diff.count()
+    record_batch(progress, 0, diff.errors)
+
+    async def write(alias: str, added=(), updated=(), removed=()) -> None:
+        events, errors = await run_in_thread(
+            _write_batch, alias, list(added), list(updated), list(removed)
+        )
+        await dispatch_events(events)
+        record_batch(progress, len(events), errors)
+
+    # Removed first, the moved jobs are removed from their old job store before being added
+    for alias, job_ids in diff.removed.items():
+        for start in range(0, len(job_ids), BULK_BATCH):
+            await write(alias, removed=job_ids[start : start + BULK_BATCH])
+    for alias, new_jobs in diff.added.items():
+        for start in range(0, len(new_jobs), BULK_BATCH):
+            await write(alias, added=new_jobs[start : start + BULK_BATCH])
+    for alias, updated_jobs in diff.updated.items():
+        for start in range(0, len(updated_jobs), BULK_BATCH):
+            await write(alias, updated=updated_jobs[start : start + BULK_BATCH])
+
+
+def start_import(jobs: list[ManifestJob], prune: bool) -> str:
+    """Start applying the manifest on the running loop, return the id of its progress."""
+
+    return start_task("import", partial(_run_import, jobs, prune))
+
@@ -0,0 +1,258 @@
+"""
+Metrics of the scheduler in the Prometheus text format, served by `/metrics`.
+
+Counters, summaries and histograms are fed by the event listeners in `src/scheduler.py` and by
+the timed methods of the job stores. A histogram has fixed buckets and one preallocated list of
+counts per label set, so an observation is a `bisect` and two additions. The listeners run on the
+loop or in the threads of the pool executors and the store calls in any thread, each metric is
+updated under its own lock. The run time and lateness of each job are summaries(count and sum),
+their histograms are per executor unless `METRICS_JOB_BUCKETS`. Gauges(executor saturation, the uv
+script queue) are read when the metrics are rendered.
+"""
+
+import asyncio
+import threading
+import time
+from bisect import bisect_left
+from collections.abc import Callable, Iterable, Iterator
+from functools import wraps
+
+from apscheduler.jobstores.base import BaseJobStore
+
+from .config import METRICS_JOB_BUCKETS
+
+DURATION_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900, 3600)
+LATENESS_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+STORE_CALL_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1)
+# Job store methods called by the scheduler and the WebUI
+STORE_METHODS = (
+    "lookup_job",
+    "get_due_jobs",
+    "get_next_run_time",
+    "get_all_jobs",
+    "add_job",
+    "update_job",
+    "remove_job",
+)
+
+Labels = tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(names: Labels, values: Labels, extra: str = "") -> str:
+    labels = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        labels.append(extra)
+    return "{" + ",".join(labels) + "}" if labels else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Labels) -> None:
+        self.name, self.help, self.labels = name, help, labels
+        self._values: dict[Labels, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels: Labels, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            values = list(self._values.items())
+        for labels, value in values:
+            yield f"{self.name}{format_labels(self.labels, labels)} {value}"
+
+
+class Summary:
+    """Count and sum of the values of each label set, without quantiles."""
+
+    def __init__(self, name: str, help: str, labels: Labels) -> None:
+        self.name, self.help, self.labels = name, help, labels
+        self._series: dict[Labels, list[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels: Labels, value: float) -> None:
+        with self._lock:
+            if (series := self._series.get(labels)) is None:
+                series = self._series[labels] = [0, 0.0]
+            series[0] += 1
+            series[1] += value
+
+    def totals(self) -> dict[Labels, tuple[int, float]]:
+        with self._lock:
+            return {labels: (int(count), total) for labels, (count, total) in self._series.items()}
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} summary"
+        for labels, (count, total) in self.totals().items():
+            yield f"{self.name}_sum{format_labels(self.labels, labels)} {total}"
+            yield f"{self.name}_count{format_labels(self.labels, labels)} {count}"
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: Labels, buckets: tuple[float, ...]) -> None:
+        self.name, self.help, self.labels = name, help, labels
+        self.buckets = buckets
+        # Count of each bucket, the values above the last bucket, then the sum of the values
+        self._series: dict[Labels, list[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels: Labels, value: float) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            if (series := self._series.get(labels)) is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def totals(self) -> dict[Labels, tuple[int, float]]:
+        """Count and sum of the values of each label set."""
+
+        with self._lock:
+            return {
+                labels: (sum(series[:-1]), series[-1]) for labels, series in self._series.items()
+            }
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            all_series = [(labels, list(series)) for labels, series in self._series.items()]
+        for labels, series in all_series:
+            count = 0
+            for bound, bucket in zip((*self.buckets, "+Inf"), series):
+                count += bucket
+                le = format_labels(self.labels, labels, f'le="{bound}"')
+                yield f"{self.name}_bucket{le} {count}"
+            yield f"{self.name}_sum{format_labels(self.labels, labels)} {series[-1]}"
+            yield f"{self.name}_count{format_labels(self.labels, labels)} {count}"
+
+
+def gauge(name: str, help: str, labels: Labels, values: Iterable[tuple[Labels, float]]):
+    yield f"# HELP {name} {help}"
+    yield f"# TYPE {name} gauge"
+    for label_values, value in values:
+        yield f"{name}{format_labels(labels, label_values)} {value}"
+
+
+job_events = Counter(
+    "apscheduler_job_events_total",
+    "Job events: submitted, executed, error, missed and max_instances(not run, too many running)",
+    ("job", "executor", "event"),
+)
+job_duration = Summary(
+    "apscheduler_job_duration_seconds",
+    "Run time of the jobs, from the submission to the executor to the execution event",
+    ("job", "executor"),
+)
+job_lateness = Summary(
+    "apscheduler_job_lateness_seconds",
+    "Delay between the scheduled run time and the submission to the executor",
+    ("job", "executor"),
+)
+# Buckets per job(jobs × buckets series) or per executor
+BUCKET_LABELS: Labels = ("job", "executor") if METRICS_JOB_BUCKETS else ("executor",)
+duration_buckets = Histogram(
+    "apscheduler_job_duration_buckets_seconds",
+    "Run time of the jobs, from the submission to the executor to the execution event",
+    BUCKET_LABELS,
+    DURATION_BUCKETS,
+)
+lateness_buckets = Histogram(
+    "apscheduler_job_lateness_buckets_seconds",
+    "Delay between the scheduled run time and the submission to the executor",
+    BUCKET_LABELS,
+    LATENESS_BUCKETS,
+)
+store_calls = Histogram(
+    "apscheduler_jobstore_call_seconds",
+    "Latency of the job store calls",
+    ("store", "method"),
+    STORE_CALL_BUCKETS,
+)
+loop_blocks = Histogram(
+    "apscheduler_jobstore_loop_block_seconds",
+    "Time the event loop waited for the calls of the job stores",
+    ("store",),
+    STORE_CALL_BUCKETS,
+)
+
+def _job_labels(job_id: str, executor: str) -> tuple[Labels, Labels]:
+    return (job_id, executor), (job_id, executor) if METRICS_JOB_BUCKETS else (executor,)
+
+
+def observe_submission(job_id: str, executor: str, run_times: list, now) -> None:
+    job_events.inc((job_id, executor, "submitted"))
+    labels, bucket_labels = _job_labels(job_id, executor)
+    for run_time in run_times:
+        lateness = max((now - run_time).total_seconds(), 0)
+        job_lateness.observe(labels, lateness)
+        lateness_buckets.observe(bucket_labels, lateness)
+
+
+def observe_execution(job_id: str, executor: str, event: str, duration: float | None) -> None:
+    """Count an execution event, observe the run time of executed or failed runs."""
+
+    job_events.inc((job_id, executor, event))
+    if duration is not None:
+        labels, bucket_labels = _job_labels(job_id, executor)
+        job_duration.observe(labels, duration)
+        duration_buckets.observe(bucket_labels, duration)
+
+
+def on_loop() -> bool:
+    """Called by a callback of the running event loop."""
+
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+def _timed(method: Callable, labels: Labels) -> Callable:
+    @wraps(method)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            store_calls.observe(labels, elapsed)
+            if on_loop():
+                loop_blocks.observe(labels[:1], elapsed)
+
+    return wrapper
+
+
+def instrument_jobstore(alias: str, store: BaseJobStore) -> None:
+    """Time the calls of the job store, by wrapping the methods of the instance."""
+
+    if getattr(store, "_timed_alias", None) == alias:
+        return
+    for method in STORE_METHODS:
+        # The bound method of the class, in case the store was instrumented with another alias
+        bound = getattr(type(store), method).__get__(store)
+        setattr(store, method, _timed(bound, (alias, method)))
+    store._timed_alias = alias  # type: ignore
+
+
+def render_metrics(*gauges: Iterable[str]) -> str:
+    metrics = (
+        job_events,
+        job_duration,
+        job_lateness,
+        duration_buckets,
+        lateness_buckets,
+        store_calls,
+        loop_blocks,
+    )
+    lines = [line for metric in metrics for line in metric.render()]
+    lines.extend(line for gauge_lines in gauges for line in gauge_lines)
+    return "\n".join(lines) + "\n"
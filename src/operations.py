@@ -0,0 +1,437 @@
+"""
+Operations of the WebUI on the scheduler, run by the process running it, see `src/rpc.py`.
+
+They take and return picklable values(models, strings, numbers...), never the jobs, job stores or
+executors themselves, which only exist in the scheduler process.
+"""
+
+import asyncio
+import threading
+import time
+from collections.abc import AsyncIterator, Iterator
+from datetime import datetime
+from importlib import import_module, reload
+from pathlib import Path
+from typing import Any, Literal
+
+from . import bulk, manifest, timeline
+from .cluster import NODE, cluster_state, job_bucket
+from .config import BULK_PROGRESS_INTERVAL
+from .exceptions import InvalidAction, OperationFailed
+from .executors import cancel_job_runs
+from .job_query import get_job_info, query_job_infos
+from .limiter import uv_limiter
+from .loop_monitor import lag_by_minute, lag_samples, lag_summary, slow_callbacks, slow_owners
+from .metrics import (
+    STORE_METHODS,
+    gauge,
+    job_duration,
+    job_lateness,
+    loop_blocks,
+    render_metrics,
+    store_calls,
+)
+from .rpc import operation
+from .scheduler import prepare_jobstore, scheduler
+from .schema import (
+    BulkJobParam,
+    BulkProgress,
+    ExecutorInfo,
+    JobInfo,
+    JobQuery,
+    JobStoreInfo,
+    JobStoreStats,
+    JobTiming,
+    LimiterStats,
+    LoopLagStats,
+    ManifestJob,
+    ManifestPlan,
+    NewJobParam,
+    SlowCallback,
+    SlowCallbackStats,
+    Timeline,
+    TriggerParam,
+    TriggerType,
+)
+from .uv import uv_available, uv_run
+
+# Minutes of the lag shown one by one
+LAG_MINUTES = 15
+
+# The job stores are added and removed in the worker threads, one at a time
+_job_store_lock = threading.Lock()
+
+
+@operation
+def job_stores() -> dict[str, str]:
+    """Class name of each job store by alias."""
+
+    return {alias: store.__class__.__name__ for alias, store in scheduler._jobstores.items()}
+
+
+@operation
+def executors() -> dict[str, str]:
+    """Class name of each executor by alias."""
+
+    return {alias: executor.__class__.__name__ for alias, executor in scheduler._executors.items()}
+
+
+def _store_latency(alias: str, calls: dict[tuple, tuple[int, float]]) -> str:
+    """Mean latency of each method called on the job store."""
+
+    means = []
+    for method in STORE_METHODS:
+        count, total = calls.get((alias, method), (0, 0.0))
+        if count:
+            means.append(f"{method} {total / count * 1000:.2f} ms")
+    return ", ".join(means)
+
+
+@operation
+def job_store_infos() -> list[JobStoreStats]:
+    calls, blocks = store_calls.totals(), loop_blocks.totals()
+    infos = []
+    for alias, store in scheduler._jobstores.items():
+        count, total = blocks.get((alias,), (0, 0.0))
+        infos.append(
+            JobStoreStats.model_validate(
+                {
+                    "alias": alias,
+                    "store": store,
+                    "latency": _store_latency(alias, calls),
+                    "loop_blocked": f"{total * 1000:.1f} ms in {count} calls" if count else "",
+                }
+            )
+        )
+    return infos
+
+
+@operation(blocking=True)
+def add_job_store(new_store: JobStoreInfo) -> str:
+    alias = new_store.alias
+    with _job_store_lock:
+        if new_store.alias in scheduler._jobstores:
+            return f"Job store({alias=}) already exists"
+        job_store = new_store.get_store()
+        # Coordinated before the scheduler processes its jobs
+        if scheduler.running:
+            prepare_jobstore(alias, job_store)
+        scheduler.add_jobstore(job_store, alias=alias)
+    return "New job store added successfully"
+
+
+@operation(blocking=True)
+def remove_job_store(alias: str) -> str:
+    with _job_store_lock:
+        if alias not in scheduler._jobstores:
+            return f"Job store({alias=}) not exists"
+        if alias == "default":
+            return "Cannot remove default job store"
+        scheduler.remove_jobstore(alias)
+    return f"Job store({alias=}) removed successfully"
+
+
+@operation
+def executor_infos() -> list[ExecutorInfo]:
+    return [
+        ExecutorInfo.model_validate({"alias": alias, "executor": executor})
+        for alias, executor in scheduler._executors.items()
+    ]
+
+
+@operation
+def add_executor(new_executor: ExecutorInfo) -> str:
+    alias = new_executor.alias
+    if new_executor.alias in scheduler._jobstores:
+        return f"Executor({alias=}) already exists."
+    executor = new_executor.get_executor()
+    scheduler.add_executor(executor, alias=new_executor.alias)
+    return f"New executor({alias=}) added successfully."
+
+
+@operation
+def remove_executor(alias: str) -> str:
+    if alias not in scheduler._executors:
+        return f"Executor({alias=}) not exists."
+    if alias == "default":
+        return "Cannot remove default executor."
+    scheduler.remove_executor(alias)
+    return f"Executor({alias=}) removed successfully."
+
+
+@operation
+def limiter_stats() -> tuple[str, list[LimiterStats]]:
+    """Order of the uv script queue and the stats of all runs and of each tag."""
+
+    stats = [
+        LimiterStats.model_validate({"tag": tag} | tag_stats.as_dict())
+        for tag, tag_stats in uv_limiter.stats.items()
+    ]
+    return uv_limiter.order, stats
+
+
+@operation(blocking=True)
+def find_jobs(query: JobQuery, page_size: int) -> tuple[int, list[JobInfo]]:
+    # Only the jobs of the page which are not cached are loaded from the job stores
+    return query_job_infos(query, page_size)
+
+
+@operation(blocking=True)
+def job_detail(id: str) -> tuple[JobInfo, str] | None:
+    """Snapshot of the job and the path of its script, None if the job doesn't exist."""
+
+    if not (job := scheduler.get_job(id)):
+        return None
+    if job.func is uv_run:
+        path = Path(job.args[0])
+    else:
+        path = Path(*job.func.__module__.split(".")).with_suffix(".py")
+    return get_job_info(job), str(path)
+
+
+@operation(blocking=True)
+def job_owner(id: str, jobstore: str) -> str | None:
+    """Bucket of the job and the node running it, None if the job store isn't coordinated."""
+
+    if (state := cluster_state().get(jobstore)) is None:
+        return None
+    nodes, owners = state
+    bucket = job_bucket(id)
+    owner = owners.get(bucket)
+    if owner is None:
+        return f"Bucket {bucket} isn't leased by any of the {len(nodes)} nodes, the job waits"
+    mine = " (this node)" if owner == NODE else ""
+    return f"Bucket {bucket}, run by node {owner}{mine} of the {len(nodes)} nodes"
+
+
+@operation(blocking=True)
+def add_job(job_info: NewJobParam) -> str:
+    """Add the job, return its id."""
+
+    trigger = job_info.get_trigger(job_info.id, job_info.jobstore)
+    if (func := job_info.func) == "uv_run":
+        if not uv_available:
+            raise OperationFailed("uv is not available. Please install it to use uv_run job.")
+        if not (script := job_info.uv_script) or not Path(script).exists():
+            raise OperationFailed(f"Script '{script}' is not exists")
+        func = uv_run
+        job_info.args = (script, *job_info.args)
+
+    job = scheduler.add_job(
+        func,
+        trigger=trigger,
+        args=job_info.args,
+        kwargs=job_info.kwargs,
+        coalesce=job_info.coalesce,
+        max_instances=job_info.max_instances,
+        misfire_grace_time=job_info.misfire_grace_time,
+        name=job_info.name,
+        id=job_info.id,
+        executor=job_info.executor,
+        jobstore=job_info.jobstore,
+    )
+    return job.id
+
+
+@operation(blocking=True)
+def modify_job(
+    id: str, changes: dict[str, Any], trigger: tuple[TriggerType, TriggerParam] | None = None
+) -> None:
+    """Modify the job, its trigger is replaced and the job rescheduled if the params changed."""
+
+    changes = dict(changes)
+    if trigger is not None and (job := scheduler.get_job(id)):
+        trigger_type, params = trigger
+        current = get_job_info(job)
+        if (trigger_type, params.model_dump()) != (
+            current.trigger,
+            current.trigger_params.model_dump(),
+        ):
+            new_trigger = params.get_trigger(
+                trigger_type, job.next_run_time, id, job._jobstore_alias
+            )
+            changes["trigger"] = new_trigger
+            if job.next_run_time is not None:
+                now = datetime.now(scheduler.timezone)
+                if (next_run_time := new_trigger.get_next_fire_time(None, now)) is None:
+                    raise OperationFailed("The new trigger never fires")
+                changes["next_run_time"] = next_run_time
+    scheduler.modify_job(id, **changes)
+
+
+@operation(blocking=True)
+def job_action(action: Literal["pause", "resume", "reload", "remove", "cancel"], id: str) -> str:
+    """Apply the action to the job, return the name of the job."""
+
+    job = scheduler.get_job(id)
+    if not job:
+        raise OperationFailed("Job not found", status_code=404)
+
+    match action:
+        case "pause":
+            scheduler.pause_job(id)
+        case "resume":
+            scheduler.resume_job(id)
+        case "remove":
+            scheduler.remove_job(id)
+        case "reload":
+            module = import_module(job.func.__module__)
+            reload(module)
+        case "cancel":
+            # Coroutine jobs(e.g. uv_run) of AsyncIOExecutor, uv_run kills the script
+            if not cancel_job_runs(id):
+                raise OperationFailed("No running instance can be cancelled", status_code=409)
+        case _:
+            raise InvalidAction(action)
+    return job.name
+
+
+@operation
+def start_bulk(param: BulkJobParam) -> str:
+    """Start the bulk action, return its id."""
+
+    return bulk.start_bulk(param)
+
+
+@operation
+def bulk_progress(task_id: str) -> BulkProgress | None:
+    return bulk.bulk_progress(task_id)
+
+
+@operation(blocking=True)
+def export_jobs() -> list[ManifestJob]:
+    return manifest.export_jobs()
+
+
+@operation(blocking=True)
+def plan_import(jobs: list[ManifestJob], prune: bool) -> ManifestPlan:
+    """Changes the import of the manifest would apply(dry run)."""
+
+    return manifest.plan_import(jobs, prune)
+
+
+@operation
+def start_import(jobs: list[ManifestJob], prune: bool) -> str:
+    """Start applying the manifest, return the id of its progress like `start_bulk`."""
+
+    return manifest.start_import(jobs, prune)
+
+
+@operation(blocking=True)
+def job_timeline(hours: int) -> Timeline:
+    return timeline.build_timeline(hours)
+
+
+async def follow_bulk(task_id: str) -> AsyncIterator[BulkProgress | None]:
+    """Progress of the bulk action every `BULK_PROGRESS_INTERVAL` seconds until it finishes."""
+
+    while True:
+        progress = await bulk_progress(task_id)
+        yield progress
+        if progress is None or progress.finished:
+            return
+        await asyncio.sleep(BULK_PROGRESS_INTERVAL)
+
+
+def executor_gauges() -> Iterator[str]:
+    executors = list(scheduler._executors.items())
+    running = {alias: sum(executor._instances.values()) for alias, executor in executors}
+    # Only the pools have a limit, the AsyncIOExecutor runs any number of jobs
+    max_workers = {
+        alias: pool._max_workers
+        for alias, executor in executors
+        if (pool := getattr(executor, "_pool", None))
+    }
+    yield from gauge(
+        "apscheduler_executor_running_jobs",
+        "Running job instances of the executor",
+        ("executor",),
+        (((alias,), count) for alias, count in running.items()),
+    )
+    yield from gauge(
+        "apscheduler_executor_max_workers",
+        "Workers of the thread or process pool of the executor",
+        ("executor",),
+        (((alias,), count) for alias, count in max_workers.items()),
+    )
+    yield from gauge(
+        "apscheduler_executor_saturation",
+        "Running job instances per worker of the thread or process pool of the executor",
+        ("executor",),
+        (((alias,), running[alias] / count) for alias, count in max_workers.items()),
+    )
+
+
+def uv_queue_gauges() -> Iterator[str]:
+    stats = {tag: tag_stats.as_dict() for tag, tag_stats in uv_limiter.stats.items()}
+    for name, help in (
+        ("running", "Running uv scripts"),
+        ("queued", "uv scripts waiting for a slot"),
+        ("avg_wait", "Average seconds waited for a slot"),
+        ("max_wait", "Longest seconds waited for a slot"),
+        ("started", "Started uv scripts since the WebUI started"),
+    ):
+        yield from gauge(
+            f"uv_queue_{name}",
+            f"{help}, of all jobs(tag=\"*\") or the jobs with the tag",
+            ("tag",),
+            (((tag,), tag_stats[name]) for tag, tag_stats in stats.items()),
+        )
+
+
+@operation
+def scheduler_metrics() -> str:
+    # The metrics are locked, the listeners of pool executors update them in the pool threads
+    return render_metrics(executor_gauges(), uv_queue_gauges())
+
+
+def _time(timestamp: float) -> datetime:
+    return datetime.fromtimestamp(timestamp, scheduler.timezone)
+
+
+def loop_lag_stats() -> list[LoopLagStats]:
+    now = time.time()
+    stats = []
+    for period, seconds in (("Last minute", 60), ("Last 10 minutes", 600), ("Window", None)):
+        lags = [lag for sampled, lag in lag_samples if seconds is None or now - sampled < seconds]
+        stats.append(LoopLagStats(period=period, samples=len(lags), **lag_summary(lags)))
+    for minute, lags in lag_by_minute(LAG_MINUTES):
+        period = _time(minute).strftime("%H:%M")
+        stats.append(LoopLagStats(period=period, samples=len(lags), **lag_summary(lags)))
+    return stats
+
+
+def job_timings() -> list[JobTiming]:
+    durations = job_duration.totals()
+    timings = []
+    for (job, executor), (count, lateness) in job_lateness.totals().items():
+        duration_count, duration = durations.get((job, executor), (0, 0.0))
+        blocked = slow_owners.get(f"job {job}")
+        timings.append(
+            JobTiming(
+                job=job,
+                executor=executor,
+                runs=count,
+                avg_lateness=lateness / count if count else 0.0,
+                avg_duration=duration / duration_count if duration_count else None,
+                loop_blocked=blocked[1] if blocked else 0.0,
+            )
+        )
+    # The jobs blocking the loop first, they delay all other jobs
+    return sorted(timings, key=lambda t: (t.loop_blocked, t.avg_lateness), reverse=True)
+
+
+@operation
+def monitor_stats() -> dict[str, list]:
+    """Loop lag, slow callbacks by owner, recent slow callbacks and job timings."""
+
+    owners = [
+        SlowCallbackStats(owner=owner, count=count, total=total, max=max_, last=_time(last))
+        for owner, (count, total, max_, last) in slow_owners.items()
+    ]
+    owners.sort(key=lambda stats: stats.total, reverse=True)
+    recent = [
+        SlowCallback(time=_time(called), owner=owner, duration=duration)
+        for called, owner, duration in reversed(slow_callbacks)
+    ]
+    return {"lag": loop_lag_stats(), "owners": owners, "recent": recent, "jobs": job_timings()}
@@ -1,29 +1,36 @@
-import re
 from importlib import import_module
 
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import Response, StreamingResponse
+from pydantic import ValidationError
 from fastui.forms import SelectOption, SelectSearchResponse
 
-from ..config import LOG_PATH
-from ..scheduler import scheduler
+from .. import operations
+from ..config import TIMELINE_MAX_HOURS
+from ..exceptions import OperationFailed
+from ..log_index import job_log_files
+from ..log_search import search_logs
+from ..manifest import ManifestFormat, dump_manifest, load_manifest
+from ..schema import BulkJobParam, LogRecord, LogSearchResult, ManifestPlan, Timeline
+from ..worker import run_in_worker
 
 router = APIRouter(prefix="/api", tags=["job"])
 
 
 @router.get("/job-stores", description="Get available job stores")
-def get_job_stores() -> SelectSearchResponse:
+async def get_job_stores() -> SelectSearchResponse:
     stores = [
-        SelectOption(value=name, label=f"{name}({store.__class__.__name__})")
-        for name, store in scheduler._jobstores.items()
+        SelectOption(value=name, label=f"{name}({class_name})")
+        for name, class_name in (await operations.job_stores()).items()
     ]
     return SelectSearchResponse(options=stores)
 
 
 @router.get("/executors", description="Get available job stores")
-def get_executors() -> SelectSearchResponse:
+async def get_executors() -> SelectSearchResponse:
     executors = [
-        SelectOption(value=name, label=f"{name}({executor.__class__.__name__})")
-        for name, executor in scheduler._executors.items()
+        SelectOption(value=name, label=f"{name}({class_name})")
+        for name, class_name in (await operations.executors()).items()
     ]
     return SelectSearchResponse(options=executors)
 
@@ -41,11 +48,84 @@ def get_available_job_stores() -> SelectSearchResponse:
     return SelectSearchResponse(options=stores)
 
 
-@router.get("/available-logs", description="Get available log file")
-def get_available_job_logs(q: str = "") -> SelectSearchResponse:
-    logs = [
+def list_job_logs(q: str = "") -> list[SelectOption]:
+    return [
         SelectOption(value=file.name, label=file.name)
-        for file in sorted(LOG_PATH.glob("*.log"), reverse=True)
-        if q in file.name and not re.match(r"scheduler(\.[\d_-]+)?\.log", file.name)
+        for file in job_log_files()
+        if q in file.name
     ]
-    return SelectSearchResponse(options=logs)
+
+
+@router.get("/available-logs", description="Get available log file")
+async def get_available_job_logs(q: str = "") -> SelectSearchResponse:
+    return SelectSearchResponse(options=await run_in_worker(list_job_logs, q))
+
+
+@router.get("/log-search", description="Search job log records containing all words of q")
+async def search_job_logs(q: str, limit: int = 100, offset: int = 0) -> LogSearchResult:
+    total, records = await run_in_worker(search_logs, q, limit, offset)
+    return LogSearchResult(
+        total=total, records=[LogRecord.model_validate(record) for record in records]
+    )
+
+
+async def progress_lines(task_id: str):
+    """Progress of a bulk action or an import as JSON lines."""
+
+    async for progress in operations.follow_bulk(task_id):
+        if progress is not None:
+            yield progress.model_dump_json() + "\n"
+
+
+@router.post(
+    "/jobs/bulk",
+    description="Apply an action to the selected jobs, stream the progress as JSON lines",
+)
+async def bulk_jobs(param: BulkJobParam) -> StreamingResponse:
+    try:
+        task_id = await operations.start_bulk(param)
+    except OperationFailed as e:
+        raise HTTPException(status_code=e.status_code, detail=e.message) from e
+    return StreamingResponse(progress_lines(task_id), media_type="application/x-ndjson")
+
+
+@router.get("/jobs/manifest", description="Export all jobs as a JSON or YAML manifest")
+async def export_manifest(format: ManifestFormat = "json") -> Response:
+    jobs = await operations.export_jobs()
+    try:
+        text = await run_in_worker(dump_manifest, jobs, format)
+    except OperationFailed as e:
+        raise HTTPException(status_code=e.status_code, detail=e.message) from e
+    return Response(
+        text,
+        media_type="application/json" if format == "json" else "application/yaml",
+        headers={"Content-Disposition": f'attachment; filename="jobs.{format}"'},
+    )
+
+
+@router.post(
+    "/jobs/manifest",
+    description="Import a JSON or YAML manifest, return the changes of a dry run or stream the "
+    "progress as JSON lines",
+    response_model=None,
+)
+async def import_manifest(
+    request: Request, dry_run: bool = False, prune: bool = False
+) -> ManifestPlan | StreamingResponse:
+    try:
+        jobs = (await run_in_worker(load_manifest, await request.body())).jobs
+    except OperationFailed as e:
+        raise HTTPException(status_code=e.status_code, detail=e.message) from e
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(include_url=False)) from e
+    if dry_run:
+        return await operations.plan_import(jobs, prune)
+    task_id = await operations.start_import(jobs, prune)
+    return StreamingResponse(progress_lines(task_id), media_type="application/x-ndjson")
+
+
+@router.get(
+    "/jobs/timeline", description="Fires of the jobs in each minute of the next hours"
+)
+async def job_timeline(hours: int = Query(24, ge=1, le=TIMELINE_MAX_HOURS)) -> Timeline:
+    return await operations.job_timeline(hours)
@@ -8,7 +8,7 @@ from fastui.components.forms import FormFieldInput
 from fastui.events import PageEvent
 from fastui.forms import fastui_form
 
-from ..scheduler import scheduler
+from .. import operations
 from ..schema import ExecutorInfo
 from ..shared import Components, frame_page
 
@@ -16,11 +16,9 @@ router = APIRouter(prefix="/job/executor", tags=["executor"])
 
 
 @router.get("", response_model=FastUI, response_model_exclude_none=True)
-def store() -> Components:
-    executors = [
-        ExecutorInfo.model_validate({"alias": alias, "executor": executor})
-        for alias, executor in scheduler._executors.items()
-    ]
+async def store() -> Components:
+    executors = await operations.executor_infos()
+    queue_order, limiter_stats = await operations.limiter_stats()
 
     return frame_page(
         c.Heading(text="Executor"),
@@ -60,6 +58,12 @@ def store() -> Components:
                 DisplayLookup(field="max_worker"),
             ],
         ),
+        c.Heading(text="UV Script Queue", level=3),
+        c.Paragraph(
+            text=f"Runs of uv scripts are started in {queue_order} order, "
+            "the width of a tag limits the runs of the jobs with the tag."
+        ),
+        c.Table(data=limiter_stats),
     )
 
 
@@ -67,19 +71,9 @@ def store() -> Components:
 async def new_executor(
     new_executor: Annotated[ExecutorInfo, fastui_form(ExecutorInfo)],
 ) -> c.Paragraph:
-    alias = new_executor.alias
-    if new_executor.alias in scheduler._jobstores:
-        return c.Paragraph(text=f"Executor({alias=}) already exists.")
-    executor = new_executor.get_executor()
-    scheduler.add_executor(executor, alias=new_executor.alias)
-    return c.Paragraph(text=f"New executor({alias=}) added successfully.")
+    return c.Paragraph(text=await operations.add_executor(new_executor))
 
 
 @router.post("/remove", response_model=FastUI, response_model_exclude_none=True)
 async def remove_executor(alias: Annotated[str, Form()]) -> c.Paragraph:
-    if alias not in scheduler._executors:
-        return c.Paragraph(text=f"Executor({alias=}) not exists.")
-    if alias == "default":
-        return c.Paragraph(text="Cannot remove default executor.")
-    scheduler.remove_executor(alias)
-    return c.Paragraph(text=f"Executor({alias=}) removed successfully.")
+    return c.Paragraph(text=await operations.remove_executor(alias))
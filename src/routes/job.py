@@ -1,34 +1,141 @@
 from genericpath import exists
-from importlib import import_module, reload
 from pathlib import Path
 from typing import Annotated, Literal
+from urllib.parse import quote
 from uuid import uuid4
 
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
 from fastui import AnyComponent, FastUI
 from fastui import components as c
 from fastui.components.display import DisplayLookup
+from fastui.components.forms import FormFieldInput, FormFieldSelect
 from fastui.events import BackEvent, GoToEvent, PageEvent
 from fastui.forms import fastui_form
+from pydantic import ValidationError
 
-from ..exceptions import InvalidAction
-from ..scheduler import scheduler
-from ..schema import JobInfo, ModifyJobParam, NewJobParam
+from .. import operations
+from ..config import RUN_HISTORY_RAW_DAYS
+from ..exceptions import OperationFailed
+from ..manifest import load_manifest
+from ..run_history import query_runs, summarize_runs
+from ..schema import (
+    BulkJobParam,
+    BulkProgress,
+    JobInfo,
+    JobQuery,
+    ManifestChange,
+    ManifestImportParam,
+    ModifyJobParam,
+    NewJobParam,
+    RunRecord,
+    RunSummary,
+)
 from ..shared import Components, confirm_modal, error, frame_page, h_stack, reload_event
-from ..uv import uv_available, uv_run
+from ..spread import spread_offset
+from ..worker import run_in_worker
 
 router = APIRouter(prefix="/job", tags=["job"])
 
+PAGE_JOB = 50
+PAGE_RUN = 20
+
+
+def select_options(*values: str) -> list[dict[str, str]]:
+    return [{"value": value, "label": value} for value in values]
+
+
+def job_filter_form(query: JobQuery, job_stores: list[str]) -> c.Form:
+    return c.Form(
+        form_fields=[
+            FormFieldInput(title="ID", name="id", initial=query.id, placeholder="ID prefix"),
+            FormFieldInput(
+                title="Name", name="name", initial=query.name, placeholder="Name prefix"
+            ),
+            FormFieldSelect(
+                title="Trigger",
+                name="trigger",
+                placeholder="Filter by trigger",
+                options=select_options("Cron", "Date", "Interval"),
+                initial=query.trigger or None,
+            ),
+            FormFieldSelect(
+                title="Job Store",
+                name="store",
+                placeholder="Filter by job store",
+                options=select_options(*job_stores),
+                initial=query.store or None,
+            ),
+            FormFieldSelect(
+                title="State",
+                name="state",
+                placeholder="Filter by state",
+                options=select_options("scheduled", "paused"),
+                initial=query.state or None,
+            ),
+            FormFieldSelect(
+                title="Sort By",
+                name="sort",
+                options=select_options("next_run_time", "name", "executor"),
+                initial=query.sort,
+            ),
+            FormFieldSelect(
+                title="Order",
+                name="order",
+                options=select_options("asc", "desc"),
+                initial=query.order,
+            ),
+        ],
+        submit_url=".",
+        method="GOTO",
+        submit_on_change=True,
+        display_mode="inline",
+    )
+
 
 @router.get("/", response_model=FastUI, response_model_exclude_none=True)
-async def jobs() -> Components:
-    jobs = scheduler.get_jobs()
+async def jobs(query: Annotated[JobQuery, Query()]) -> Components:
+    total, job_infos = await operations.find_jobs(query, PAGE_JOB)
+    job_stores = await operations.job_stores()
 
     return frame_page(
         c.Heading(text="Job"),
         c.Div(
-            components=[c.Button(text="New Job", on_click=PageEvent(name="new_job"))],
-            class_name="mb-3",
+            components=[
+                c.Button(text="New Job", on_click=PageEvent(name="new_job")),
+                c.Button(
+                    text="Bulk Action",
+                    on_click=PageEvent(name="bulk_action"),
+                    named_style="secondary",
+                ),
+                c.Button(
+                    text="Import",
+                    on_click=PageEvent(name="import_manifest"),
+                    named_style="secondary",
+                ),
+                c.Button(
+                    text="Export",
+                    on_click=GoToEvent(url="/api/jobs/manifest?format=yaml", target="_blank"),
+                    named_style="secondary",
+                ),
+            ],
+            class_name="d-flex gap-3 mb-3",
+        ),
+        c.Modal(
+            title="Bulk Action",
+            open_trigger=PageEvent(name="bulk_action"),
+            body=[
+                c.Paragraph(
+                    text="Apply the action to the jobs matching all of the ids, "
+                    "the name pattern, the job store and the executor which are given."
+                ),
+                c.ModelForm(
+                    submit_url="/job/bulk",
+                    model=BulkJobParam,
+                    # Jobs of the current filters by default
+                    initial={"name": f"{query.name}*" if query.name else "", "store": query.store},
+                ),
+            ],
         ),
         c.Modal(
             title="New Job",
@@ -42,8 +149,21 @@ async def jobs() -> Components:
                 ),
             ],
         ),
+        c.Modal(
+            title="Import Jobs",
+            open_trigger=PageEvent(name="import_manifest"),
+            body=[
+                c.Paragraph(
+                    text="Add, update or remove the jobs to match an exported manifest, "
+                    "unchanged jobs are not written."
+                ),
+                c.ModelForm(submit_url="/job/manifest", model=ManifestImportParam),
+            ],
+        ),
+        job_filter_form(query, list(job_stores)),
+        c.Paragraph(text=f"{total} jobs found."),
         c.Table(
-            data=[JobInfo.model_validate(job) for job in jobs],
+            data=job_infos,
             data_model=JobInfo,
             columns=[
                 DisplayLookup(field="id", on_click=GoToEvent(url="/detail/{id}")),
@@ -53,49 +173,117 @@ async def jobs() -> Components:
                 DisplayLookup(field="next_run_time"),
             ],
         ),
+        c.Pagination(page=query.page, page_size=PAGE_JOB, total=total or 1),
     )
 
 
 @router.post("/", response_model=FastUI, response_model_exclude_none=True)
 async def new_job(job_info: Annotated[NewJobParam, fastui_form(NewJobParam)]) -> Components:
-    trigger = job_info.get_trigger()
-    if (func := job_info.func) == "uv_run":
-        if not uv_available:
-            return [error("uv is not available. Please install it to use uv_run job.")]
-        if not (script := job_info.uv_script) or not Path(script).exists():
-            return [error(f"Script '{script}' is not exists")]
-        func = uv_run
-        job_info.args = (script, *job_info.args)
-
-    job = scheduler.add_job(
-        func,
-        trigger=trigger,
-        args=job_info.args,
-        kwargs=job_info.kwargs,
-        coalesce=job_info.coalesce,
-        max_instances=job_info.max_instances,
-        misfire_grace_time=job_info.misfire_grace_time,
-        name=job_info.name,
-        id=job_info.id,
-        executor=job_info.executor,
-        jobstore=job_info.jobstore,
-    )
+    try:
+        job_id = await operations.add_job(job_info)
+    except OperationFailed as e:
+        return [error(e.message, status_code=e.status_code)]
     return [
-        c.Paragraph(text=f"Created new job(id={job.id})"),
+        c.Paragraph(text=f"Created new job(id={job_id})"),
         h_stack(c.Button(text="Ok", on_click=reload_event("/")), class_name="gap-3 mb-3"),
     ]
 
 
+@router.post("/bulk", response_model=FastUI, response_model_exclude_none=True)
+async def bulk_action(param: Annotated[BulkJobParam, fastui_form(BulkJobParam)]) -> Components:
+    try:
+        task_id = await operations.start_bulk(param)
+    except OperationFailed as e:
+        return [error(e.message, status_code=e.status_code)]
+    return [c.ServerLoad(path=f"/bulk/{task_id}", sse=True, sse_retry=5000)]
+
+
+@router.post("/manifest", response_model=FastUI, response_model_exclude_none=True)
+async def import_manifest(request: Request) -> Components:
+    # Not `fastui_form`, which closes the uploaded file before the route reads it
+    async with request.form() as form:
+        try:
+            param = ManifestImportParam.model_validate(dict(form))
+        except ValidationError as e:
+            raise HTTPException(
+                status_code=422,
+                detail={"form": e.errors(include_input=False, include_url=False)},
+            ) from e
+        text = await param.manifest.read()
+    try:
+        jobs = (await run_in_worker(load_manifest, text)).jobs
+    except OperationFailed as e:
+        return [error(e.message, status_code=e.status_code)]
+    except ValidationError as e:
+        return [error(f"Invalid manifest: {e}", status_code=422)]
+    if param.apply:
+        task_id = await operations.start_import(jobs, param.prune)
+        return [c.ServerLoad(path=f"/bulk/{task_id}", sse=True, sse_retry=5000)]
+
+    plan = await operations.plan_import(jobs, param.prune)
+    components: Components = [
+        c.Paragraph(
+            text=f"{plan.added} jobs to add, {plan.updated} to update, {plan.removed} to remove, "
+            f"{plan.unchanged} unchanged."
+        )
+    ]
+    if plan.errors:
+        components.append(c.Code(text="\n".join(plan.errors), language="text"))
+    if plan.changes:
+        components.append(c.Table(data=plan.changes, data_model=ManifestChange))
+    return components
+
+
+def bulk_progress_components(progress: BulkProgress | None) -> Components:
+    if progress is None:
+        return [error("Bulk action not found", status_code=404)]
+    components: Components = [
+        c.Details(
+            data=progress,
+            fields=[
+                DisplayLookup(field=field)
+                for field in ("action", "selected", "done", "failed", "elapsed", "finished")
+            ],
+        )
+    ]
+    if progress.errors:
+        components.append(c.Code(text="\n".join(progress.errors), language="text"))
+    if progress.finished:
+        components.append(h_stack(c.Button(text="Ok", on_click=reload_event("/"))))
+    return components
+
+
+@router.get("/bulk/{task_id}")
+async def bulk_action_progress(task_id: str) -> StreamingResponse:
+    """Server-sent events of the progress, rendered by the `ServerLoad` of `bulk_action`."""
+
+    async def events():
+        async for progress in operations.follow_bulk(task_id):
+            page = FastUI(root=bulk_progress_components(progress))
+            yield f"data: {page.model_dump_json(by_alias=True, exclude_none=True)}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+def spread_note(id: str, job: JobInfo) -> list[c.Paragraph]:
+    if not (spread := int(job.trigger_params.spread or 0)):
+        return []
+    return [
+        c.Paragraph(
+            text=f"Runs {spread_offset(id, spread)}s after its schedule, the jobs with the same "
+            f"schedule are spread over {spread}s by their ids."
+        )
+    ]
+
+
 @router.get("/detail/{id}", response_model=FastUI, response_model_exclude_none=True)
-async def job_detail(id: str) -> Components:
-    job = scheduler.get_job(id)
-    if not job:
+async def job_detail(id: str, page: Annotated[int, Query(ge=1)] = 1) -> Components:
+    if not (detail := await operations.job_detail(id)):
         return [c.FireEvent(event=GoToEvent(url="/"))]
-    job_model = JobInfo.model_validate(job)
-    if job.func is uv_run:
-        path = Path(job.args[0])
-    else:
-        path = Path(*job.func.__module__.split(".")).with_suffix(".py")
+    job_model, path = detail
+    owner = await operations.job_owner(id, job_model.jobstore)
+    total, runs = await run_in_worker(query_runs, id, PAGE_RUN, (page - 1) * PAGE_RUN)
+    summary = await run_in_worker(summarize_runs, id)
     return frame_page(
         c.Link(components=[c.Text(text="Back")], on_click=BackEvent()),
         c.Heading(text="Job Detail"),
@@ -108,7 +296,7 @@ async def job_detail(id: str) -> Components:
                     named_style="secondary",
                 ),
                 c.Modal(
-                    title=str(path),
+                    title=path,
                     body=[
                         c.ServerLoad(
                             path=f"/view/{path}", load_trigger=PageEvent(name="load-script")
@@ -117,6 +305,11 @@ async def job_detail(id: str) -> Components:
                     open_trigger=PageEvent(name="view"),
                     class_name="modal-xl",
                 ),
+                c.Button(
+                    text="View Logs",
+                    on_click=GoToEvent(url=f"/log/job/{quote(id, safe='')}"),
+                    named_style="secondary",
+                ),
                 c.Button(text="Pause", on_click=PageEvent(name="pause_job")),
                 confirm_modal(title="Pause Job", submit_url=f"/pause/{id}"),
                 c.Button(text="Resume", on_click=PageEvent(name="resume_job")),
@@ -133,6 +326,8 @@ async def job_detail(id: str) -> Components:
                     ],
                     open_trigger=PageEvent(name="modify_job"),
                 ),
+                c.Button(text="Cancel Running", on_click=PageEvent(name="cancel_running_job")),
+                confirm_modal(title="Cancel Running Job", submit_url=f"/cancel/{id}"),
                 c.Button(text="Reload", on_click=PageEvent(name="reload_job")),
                 confirm_modal(title="Reload Job", submit_url=f"/reload/{id}"),
                 c.Button(
@@ -143,6 +338,20 @@ async def job_detail(id: str) -> Components:
             class_name="d-flex flex-start gap-3 mb-3",
         ),
         c.Details(data=job_model),
+        *([c.Paragraph(text=owner)] if owner else []),
+        *spread_note(id, job_model),
+        c.Heading(text="Run History", level=3),
+        *(
+            [c.Table(data=[RunSummary(**row) for row in summary], data_model=RunSummary)]
+            if summary
+            else [c.Paragraph(text="No run recorded.")]
+        ),
+        c.Paragraph(
+            text=f"{total} runs in the last {RUN_HISTORY_RAW_DAYS} days, "
+            "older runs are only counted in the summary above."
+        ),
+        c.Table(data=[RunRecord(**run) for run in runs], data_model=RunRecord),
+        c.Pagination(page=page, page_size=PAGE_RUN, total=total or 1),
     )
 
 
@@ -152,7 +361,12 @@ async def modify_job(
 ) -> Components:
     modify_kwargs = job_info.model_dump(exclude={"trigger", "trigger_params"})
     modify_kwargs = dict(filter(lambda x: x[1], modify_kwargs.items()))
-    scheduler.modify_job(id, **modify_kwargs)
+    try:
+        await operations.modify_job(
+            id, modify_kwargs, (job_info.trigger, job_info.trigger_params)
+        )
+    except OperationFailed as e:
+        return [error(e.message, status_code=e.status_code)]
 
     return [
         c.Paragraph(text="Job config after modified"),
@@ -165,32 +379,22 @@ async def modify_job(
 
 
 @router.post("/{action}/{id}", response_model=FastUI, response_model_exclude_none=True)
-async def pause_job(action: Literal["pause", "resume", "reload", "remove"], id: str) -> Components:
-    job = scheduler.get_job(id)
-    if not job:
-        return [error("Job not found", status_code=404)]
-
-    match action:
-        case "pause":
-            scheduler.pause_job(id)
-        case "resume":
-            scheduler.resume_job(id)
-        case "remove":
-            scheduler.remove_job(id)
-        case "reload":
-            module = import_module(job.func.__module__)
-            reload(module)
-        case _:
-            raise InvalidAction(action)
+async def pause_job(
+    action: Literal["pause", "resume", "reload", "remove", "cancel"], id: str
+) -> Components:
+    try:
+        name = await operations.job_action(action, id)
+    except OperationFailed as e:
+        return [error(e.message, status_code=e.status_code)]
 
     return [
-        c.Paragraph(text=f"Job({id=}, name='{job.name}'), {action=} success."),
+        c.Paragraph(text=f"Job({id=}, name='{name}'), {action=} success."),
         h_stack(c.Button(text="Ok", on_click=reload_event(f"/detail/{id}"))),
     ]
 
 
 @router.get("/view/{path:path}", response_model=FastUI, response_model_exclude_none=True)
-def edit_job_script(path: Path) -> AnyComponent:
-    if not path.exists():
+async def edit_job_script(path: Path) -> AnyComponent:
+    if not await run_in_worker(path.exists):
         return error(f"Module {path} not found", status_code=404)
-    return c.Code(text=path.read_text(), language="python")
+    return c.Code(text=await run_in_worker(path.read_text), language="python")
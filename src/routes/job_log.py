@@ -1,6 +1,12 @@
+import asyncio
+from collections import deque
+from collections.abc import AsyncIterator
+from itertools import islice
 from typing import Annotated, Literal, cast
+from urllib.parse import quote, urlencode
 
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
 from fastui import FastUI
 from fastui import components as c
 from fastui.components.forms import FormFieldInput, FormFieldSelect, FormFieldSelectSearch
@@ -9,14 +15,23 @@ from fastui.forms import SelectOption
 from pydantic import Field
 
 from ..config import LOG_PATH
-from ..log import PARSE_PATTERN
 from ..log import server_log as logger
+from ..log_archive import is_compressed
+from ..log_index import LogTail, get_log_index, job_log_files, scheduler_log_files
+from ..log_search import search_logs
 from ..shared import Components, error, frame_page
-from .api import get_available_job_logs
+from ..worker import run_in_worker
+from .api import list_job_logs
 
 router = APIRouter(prefix="/job/log", tags=["job_log"])
 
 PAGE_LINE = 1000
+PAGE_SEARCH = 100
+# Records shown in follow mode, and the interval(seconds) of checking new records
+TAIL_LINE = 200
+TAIL_INTERVAL = 1
+# Send a comment to detect closed connections after these many idle intervals
+TAIL_KEEPALIVE = 15
 
 
 def parse_log_message(text: str) -> str:
@@ -26,13 +41,200 @@ def parse_log_message(text: str) -> str:
     return f"`{messages[0]}`"
 
 
-def get_log_content(log_file: str, level: str, module: str) -> list[str]:
-    return [
-        f"**[{line['pid']}] {line['time']}** *{line['level']}* "
+def format_record(line: dict[str, str]) -> str:
+    job = ""
+    if job_id := line.get("job_id"):
+        # Link to the records of the job, the run id tells apart the records of each run
+        job = f"[{job_id}#{line.get('run_id', '')}](/log/job/{quote(job_id, safe='')}) "
+    return (
+        f"**[{line['pid']}] {line['time']}** *{line['level']}* {job}"
         f"**`{line['name']}:{line['line']}`**: {parse_log_message(line['message'])}"
-        for line in logger.parse(LOG_PATH / log_file, pattern=PARSE_PATTERN)
-        if (not level or level == line["level"]) and module in line["name"]
-    ]
+    )
+
+
+def search_hit_query(record: dict[str, str]) -> str:
+    """Query of the log page containing a record found by search."""
+
+    page = int(record["position"]) // PAGE_LINE + 1
+    return urlencode({"log_file": record["file"], "page": page})
+
+
+def get_log_content(log_file: str, level: str, module: str, page: int) -> tuple[int, str]:
+    """
+    Get the total count of matched records and the formatted records of the page.
+    Records are read lazily, the reading stops after the last record of the page.
+    """
+
+    index = get_log_index(LOG_PATH / log_file)
+    positions = islice(index.select(level, module), (page - 1) * PAGE_LINE, page * PAGE_LINE)
+    contents = map(format_record, index.read(positions))
+    return index.count(level, module), "\n\n".join(contents)
+
+
+def get_job_log_content(job_id: str, level: str, page: int) -> tuple[int, str]:
+    """
+    Get the total count and the formatted records of the page of a job in all job log files,
+    newest first. Records are counted by the indexes, only the records of the page are read.
+    """
+
+    total, contents = 0, []
+    start, stop = (page - 1) * PAGE_LINE, page * PAGE_LINE
+    for log_file in job_log_files():
+        index = get_log_index(log_file)
+        count = index.count(level, job_id=job_id)
+        if count and total < stop and total + count > start:
+            positions = islice(
+                index.select(level, job_id=job_id, reverse=True),
+                max(start - total, 0),
+                stop - total,
+            )
+            contents.extend(map(format_record, index.read(positions)))
+        total += count
+    return total, "\n\n".join(contents)
+
+
+def open_log_tail(
+    kind: Literal["jobs", "scheduler"], log_file: str, level: str, module: str
+) -> tuple[list[str], LogTail | None]:
+    """
+    Get the last `TAIL_LINE` matched records and start following the log file from its end.
+    Compressed logs are archives which will never be appended, they are not followed.
+    """
+
+    resolve = None
+    if kind == "jobs" and (logs := job_log_files()) and log_file == logs[0].name:
+        # Following the newest job log, switch to the next one after daily rotation
+        resolve = lambda: job_log_files()[0]  # noqa: E731
+    # The size rotation of scheduler.log is detected by LogTail with the inode of the file
+    index = get_log_index(LOG_PATH / log_file)
+    positions = list(islice(index.select(level, module, reverse=True), TAIL_LINE))
+    contents = list(map(format_record, index.read(reversed(positions))))
+    if is_compressed(index.path):
+        return contents, None
+    return contents, LogTail(index.path, index.size, resolve)
+
+
+def sse_message(contents: deque[str]) -> str:
+    message = FastUI(
+        root=[c.Markdown(text="\n\n".join(contents), class_name="border rounded p-2 mb-2")]
+    )
+    return f"data: {message.model_dump_json(by_alias=True, exclude_none=True)}\n\n"
+
+
+async def tail_log_events(
+    kind: Literal["jobs", "scheduler"], log_file: str, level: str, module: str
+) -> AsyncIterator[str]:
+    contents, tail = await run_in_worker(open_log_tail, kind, log_file, level, module)
+    lines = deque(contents, maxlen=TAIL_LINE)
+    try:
+        yield sse_message(lines)
+        idle = 0
+        while True:
+            await asyncio.sleep(TAIL_INTERVAL)
+            try:
+                records = await run_in_worker(tail.read) if tail else []
+            except HTTPException:
+                records = []  # Workers are busy, retry on next interval
+            records = [
+                record
+                for record in records
+                if (not level or level == record["level"]) and module in record["name"]
+            ]
+            if records:
+                lines.extend(map(format_record, records))
+                yield sse_message(lines)
+                idle = 0
+            elif (idle := idle + 1) >= TAIL_KEEPALIVE:
+                yield ": keep-alive\n\n"
+                idle = 0
+    finally:
+        if tail:
+            tail.close()
+
+
+def log_tabs() -> c.LinkList:
+    return c.LinkList(
+        links=[
+            c.Link(
+                components=[c.Text(text="Job Logs")],
+                on_click=GoToEvent(url="/log/jobs"),
+                active="/log/jobs",
+            ),
+            c.Link(
+                components=[c.Text(text="APScheduler&WebUI")],
+                on_click=GoToEvent(url="/log/scheduler"),
+                active="/log/scheduler",
+            ),
+            c.Link(
+                components=[c.Text(text="Search")],
+                on_click=GoToEvent(url="/log/search"),
+                active="/log/search",
+            ),
+        ],
+        mode="tabs",
+        class_name="+ mb-4",
+    )
+
+
+# Must be registered before "/{kind}"
+@router.get("/search", response_model=FastUI, response_model_exclude_none=True)
+async def search_log(q: str = "", page: Annotated[int, Field(ge=1)] = 1) -> Components:
+    total, records = await run_in_worker(search_logs, q, PAGE_SEARCH, (page - 1) * PAGE_SEARCH)
+    contents = (
+        f"[{record['file']}](/log/jobs?{search_hit_query(record)}) {format_record(record)}"
+        for record in records
+    )
+    return frame_page(
+        c.Heading(text="Logs"),
+        log_tabs(),
+        c.Form(
+            form_fields=[
+                FormFieldInput(
+                    title="Search",
+                    name="q",
+                    initial=q,
+                    placeholder="Words in job logs, end with '*' to match prefix",
+                ),
+            ],
+            submit_url=".",
+            method="GOTO",
+            display_mode="inline",
+        ),
+        c.Paragraph(text=f"{total} records found."),
+        c.Pagination(page=page, page_size=PAGE_SEARCH, total=total or 1),
+        c.Markdown(text="\n\n".join(contents), class_name="border rounded p-2 mb-2"),
+        c.Pagination(page=page, page_size=PAGE_SEARCH, total=total or 1),
+    )
+
+
+# Must be registered before "/{kind}/tail", a job id may be "tail"
+@router.get("/job/{job_id:path}", response_model=FastUI, response_model_exclude_none=True)
+async def get_job_log(
+    job_id: str, level: str = "", page: Annotated[int, Field(ge=1)] = 1
+) -> Components:
+    total, contents = await run_in_worker(get_job_log_content, job_id, level, page)
+    return frame_page(
+        c.Heading(text="Logs"),
+        log_tabs(),
+        c.Heading(text=f"Job {job_id}", level=4),
+        c.Form(
+            form_fields=[
+                FormFieldSelect(
+                    title="Level",
+                    name="level",
+                    placeholder="Filter by level",
+                    options=[{"value": level, "label": level} for level in logger._core.levels],  # type: ignore
+                ),
+            ],
+            submit_url=".",
+            method="GOTO",
+            submit_on_change=True,
+            display_mode="inline",
+        ),
+        c.Pagination(page=page, page_size=PAGE_LINE, total=total or 1),
+        c.Markdown(text=contents, class_name="border rounded p-2 mb-2"),
+        c.Pagination(page=page, page_size=PAGE_LINE, total=total or 1),
+    )
 
 
 @router.get("/{kind}", response_model=FastUI, response_model_exclude_none=True)
@@ -42,10 +244,11 @@ async def get_log(
     level: str = "",
     module: str = "",
     page: Annotated[int, Field(ge=1)] = 1,
+    follow: bool = False,
 ) -> Components:
     if kind == "jobs":
         if not log_file:
-            field_initial = cast(SelectOption, get_available_job_logs().options[0])
+            field_initial = cast(SelectOption, (await run_in_worker(list_job_logs))[0])
             log_file = field_initial["value"]
         else:
             field_initial = SelectOption(value=log_file, label=log_file)
@@ -56,7 +259,7 @@ async def get_log(
             initial=field_initial,
         )
     else:
-        log_files = sorted(LOG_PATH.glob("scheduler.*log"))
+        log_files = await run_in_worker(scheduler_log_files)
         log_file = log_file or log_files[0].name
         log_file_field = FormFieldSelect(
             title="Log File",
@@ -76,28 +279,29 @@ async def get_log(
         log_file_field,
     ]
 
-    if not (LOG_PATH / log_file).exists():
+    if not await run_in_worker((LOG_PATH / log_file).exists):
         return [error(title="File not found", description=f"Log file {log_file} not found.")]
 
-    contents = get_log_content(log_file, level, module)
+    query = {"log_file": log_file, "level": level, "module": module}
+    if follow:
+        # New records are pushed by server-sent events
+        log_components = [
+            c.ServerLoad(path=f"/log/{kind}/tail?{urlencode(query)}", sse=True),
+        ]
+    else:
+        total, contents = await run_in_worker(get_log_content, log_file, level, module, page)
+        log_components = [
+            c.Pagination(page=page, page_size=PAGE_LINE, total=total or 1),
+            c.Markdown(
+                text=contents,
+                class_name="border rounded p-2 mb-2",
+            ),
+            c.Pagination(page=page, page_size=PAGE_LINE, total=total or 1),
+        ]
+
     return frame_page(
         c.Heading(text="Logs"),
-        c.LinkList(
-            links=[
-                c.Link(
-                    components=[c.Text(text="Job Logs")],
-                    on_click=GoToEvent(url="/log/jobs"),
-                    active="/log/jobs",
-                ),
-                c.Link(
-                    components=[c.Text(text="APScheduler&WebUI")],
-                    on_click=GoToEvent(url="/log/scheduler"),
-                    active="/log/scheduler",
-                ),
-            ],
-            mode="tabs",
-            class_name="+ mb-4",
-        ),
+        log_tabs(),
         c.Form(
             form_fields=form_fields,
             submit_url=".",
@@ -106,10 +310,30 @@ async def get_log(
             submit_on_change=True,
             display_mode="inline",
         ),
-        c.Pagination(page=page, page_size=PAGE_LINE, total=len(contents) or 1),
-        c.Markdown(
-            text="\n\n".join(contents[(page - 1) * PAGE_LINE : page * PAGE_LINE]),
-            class_name="border rounded p-2 mb-2",
+        c.Div(
+            components=[
+                c.Button(
+                    text="Stop Following" if follow else "Follow",
+                    named_style="secondary" if follow else "primary",
+                    on_click=GoToEvent(
+                        url=f"/log/{kind}", query=query | ({} if follow else {"follow": "true"})
+                    ),
+                ),
+            ],
+            class_name="mb-3",
         ),
-        c.Pagination(page=page, page_size=PAGE_LINE, total=len(contents) or 1),
+        *log_components,
+    )
+
+
+@router.get("/{kind}/tail")
+async def tail_log(
+    kind: Literal["jobs", "scheduler"], log_file: str, level: str = "", module: str = ""
+) -> StreamingResponse:
+    """Stream the appended records of a log file as server-sent events."""
+
+    if not await run_in_worker((LOG_PATH / log_file).exists):
+        raise HTTPException(status_code=404, detail=f"Log file {log_file} not found.")
+    return StreamingResponse(
+        tail_log_events(kind, log_file, level, module), media_type="text/event-stream"
     )
@@ -8,7 +8,7 @@ from fastui.components.forms import FormFieldInput
 from fastui.events import PageEvent
 from fastui.forms import fastui_form
 
-from ..scheduler import scheduler
+from .. import operations
 from ..schema import JobStoreInfo
 from ..shared import Components, frame_page
 
@@ -16,11 +16,8 @@ router = APIRouter(prefix="/job/store", tags=["job_store"])
 
 
 @router.get("", response_model=FastUI, response_model_exclude_none=True)
-def store() -> Components:
-    job_stores = [
-        JobStoreInfo.model_validate({"alias": alias, "store": store})
-        for alias, store in scheduler._jobstores.items()
-    ]
+async def store() -> Components:
+    job_stores = await operations.job_store_infos()
 
     return frame_page(
         c.Heading(text="Store"),
@@ -55,11 +52,19 @@ def store() -> Components:
         c.Table(
             data=job_stores,
             columns=[
-                DisplayLookup(field="alias", table_width_percent=20),
-                DisplayLookup(field="type_", table_width_percent=20),
+                DisplayLookup(field="alias", table_width_percent=10),
+                DisplayLookup(field="type_", table_width_percent=10),
+                DisplayLookup(field="io_thread", table_width_percent=10),
+                DisplayLookup(field="latency", table_width_percent=30),
+                DisplayLookup(field="loop_blocked", table_width_percent=15),
                 DisplayLookup(field="detail"),
             ],
         ),
+        c.Paragraph(
+            text="Latency is the mean time of the calls of each method since the start, Loop "
+            "Blocked the time the event loop waited for the store. Stores with an I/O thread "
+            "load the due jobs off the loop and write the runs behind."
+        ),
     )
 
 
@@ -67,19 +72,9 @@ def store() -> Components:
 async def new_job_store(
     new_store: Annotated[JobStoreInfo, fastui_form(JobStoreInfo)],
 ) -> c.Paragraph:
-    alias = new_store.alias
-    if new_store.alias in scheduler._jobstores:
-        return c.Paragraph(text=f"Job store({alias=}) already exists")
-    job_store = new_store.get_store()
-    scheduler.add_jobstore(job_store, alias=alias)
-    return c.Paragraph(text="New job store added successfully")
+    return c.Paragraph(text=await operations.add_job_store(new_store))
 
 
 @router.post("/remove", response_model=FastUI, response_model_exclude_none=True)
 async def remove_job_store(alias: Annotated[str, Form()]) -> c.Paragraph:
-    if alias not in scheduler._jobstores:
-        return c.Paragraph(text=f"Job store({alias=}) not exists")
-    if alias == "default":
-        return c.Paragraph(text="Cannot remove default job store")
-    scheduler.remove_jobstore(alias)
-    return c.Paragraph(text=f"Job store({alias=}) removed successfully")
+    return c.Paragraph(text=await operations.remove_job_store(alias))
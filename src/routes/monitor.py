@@ -0,0 +1,43 @@
+from fastapi import APIRouter
+from fastui import FastUI
+from fastui import components as c
+
+from .. import operations
+from ..config import LOOP_LAG_INTERVAL, LOOP_SLOW_CALLBACK
+from ..operations import LAG_MINUTES
+from ..schema import JobTiming, LoopLagStats, SlowCallback, SlowCallbackStats
+from ..shared import Components, frame_page
+
+router = APIRouter(prefix="/job/monitor", tags=["monitor"])
+
+
+@router.get("", response_model=FastUI, response_model_exclude_none=True)
+async def monitor() -> Components:
+    stats = await operations.monitor_stats()
+
+    return frame_page(
+        c.Heading(text="Monitor"),
+        c.Heading(text="Event Loop Lag", level=3),
+        c.Paragraph(
+            text=f"Delay of a timer sampled every {LOOP_LAG_INTERVAL}s on the event loop of the "
+            "scheduler(shared by the jobs of AsyncIOExecutor and the WebUI unless the scheduler "
+            f"runs as a daemon), then of each of the last {LAG_MINUTES} minutes."
+        ),
+        c.Table(data=stats["lag"], data_model=LoopLagStats),
+        c.Heading(text="Slow Callbacks", level=3),
+        c.Paragraph(
+            text=f"Callbacks blocking the event loop for {LOOP_SLOW_CALLBACK}s or longer, "
+            "by the job, request or function they ran for."
+            if LOOP_SLOW_CALLBACK is not None
+            else "Disabled by LOOP_SLOW_CALLBACK."
+        ),
+        c.Table(data=stats["owners"], data_model=SlowCallbackStats),
+        c.Table(data=stats["recent"], data_model=SlowCallback),
+        c.Heading(text="Job Lateness", level=3),
+        c.Paragraph(
+            text="Delay between the scheduled run time and the submission to the executor, "
+            "run time and time blocking the event loop of each job since the start. Jobs "
+            "blocking the loop should be moved to a thread or process pool executor."
+        ),
+        c.Table(data=stats["jobs"], data_model=JobTiming),
+    )
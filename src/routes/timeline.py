@@ -0,0 +1,93 @@
+import math
+from datetime import timedelta
+
+from fastapi import APIRouter, Query
+from fastui import FastUI
+from fastui import components as c
+from fastui.events import GoToEvent
+
+from .. import operations
+from ..config import TIMELINE_MAX_FIRES, TIMELINE_MAX_HOURS
+from ..schema import Timeline, TimelineHour, TimelinePeak, format_date
+from ..shared import Components, frame_page
+
+router = APIRouter(prefix="/job/timeline", tags=["timeline"])
+
+HORIZONS = (6, 24, 72, 168)
+# A minute without any fire, then the fires relative to the busiest minute
+LEVELS = "▁▂▃▄▅▆▇█"
+# Ids of the jobs listed in the note of the capped jobs
+CAPPED_JOBS = 10
+
+
+def hour_rows(timeline: Timeline) -> list[TimelineHour]:
+    top = max(timeline.per_minute, default=0) or 1
+    rows = []
+    for hour in range(timeline.hours):
+        minutes = timeline.per_minute[hour * 60 : hour * 60 + 60]
+        rows.append(
+            TimelineHour(
+                hour=timeline.start + timedelta(hours=hour),
+                fires=sum(minutes),
+                peak=max(minutes),
+                minutes="".join(
+                    LEVELS[math.ceil(fires / top * (len(LEVELS) - 1))] for fires in minutes
+                ),
+            )
+        )
+    return rows
+
+
+def capped_note(capped: list[str]) -> list[c.Paragraph]:
+    if not capped:
+        return []
+    more = f" and {len(capped) - CAPPED_JOBS} more" if len(capped) > CAPPED_JOBS else ""
+    return [
+        c.Paragraph(
+            text=f"Only the first {TIMELINE_MAX_FIRES} fires in the hours are counted for the "
+            f"jobs firing more often: {', '.join(capped[:CAPPED_JOBS])}{more}"
+        )
+    ]
+
+
+@router.get("", response_model=FastUI, response_model_exclude_none=True)
+async def timeline(hours: int = Query(24, ge=1, le=TIMELINE_MAX_HOURS)) -> Components:
+    timeline = await operations.job_timeline(hours)
+    fires = sum(timeline.per_minute)
+    summary = (
+        f"{timeline.jobs} scheduled jobs fire {fires} times in the {hours} hours from "
+        f"{format_date(timeline.start)}."
+    )
+    if timeline.peaks:
+        peak = timeline.peaks[0]
+        summary += f" The busiest minute is {format_date(peak.minute)} with {peak.fires} fires."
+
+    return frame_page(
+        c.Heading(text="Timeline"),
+        c.Div(
+            components=[
+                c.Button(
+                    text=f"{horizon} hours",
+                    on_click=GoToEvent(url="/timeline", query={"hours": horizon}),
+                    named_style="primary" if horizon == hours else "secondary",
+                )
+                for horizon in HORIZONS
+                if horizon <= TIMELINE_MAX_HOURS
+            ],
+            class_name="d-flex gap-3 mb-3",
+        ),
+        c.Paragraph(text=summary),
+        *capped_note(timeline.capped),
+        c.Heading(text="Busiest Minutes", level=3),
+        c.Paragraph(
+            text="Minutes with the most fires, with their most common triggers and first jobs. "
+            "Jobs firing in the same minute compete for the executors, spread their triggers."
+        ),
+        c.Table(data=timeline.peaks, data_model=TimelinePeak),
+        c.Heading(text="Fires per Minute", level=3),
+        c.Paragraph(
+            text="Each character of an hour is a minute: ▁ without any fire, up to █ for the "
+            "busiest minute."
+        ),
+        c.Table(data=hour_rows(timeline), data_model=TimelineHour),
+    )
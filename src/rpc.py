@@ -0,0 +1,131 @@
+"""
+Operations of the WebUI on the scheduler, run in the WebUI process or by the scheduler daemon.
+
+By default the scheduler runs in the WebUI process(`main.py`). With `SCHEDULER_DAEMON = True` it
+runs in a separate process started by `daemon.py`, and the WebUI processes(any number of uvicorn
+workers) send the functions decorated by `operation`(see `src/operations.py`) to it over the Unix
+socket `SCHEDULER_SOCKET`. Jobs are then fired once however many WebUI processes run, and the load
+of the WebUI doesn't delay them.
+
+A request is the pickle of `(name, args, kwargs)`, a response the pickle of `(True, result)` or
+`(False, exception)`, each prefixed by its 4-byte length. The socket is only accessible by its
+owner, pickles are trusted.
+"""
+
+import asyncio
+import os
+import pickle
+import struct
+from collections.abc import Awaitable, Callable
+from functools import partial, wraps
+from typing import ParamSpec, TypeVar
+
+from fastapi import HTTPException
+
+from .config import SCHEDULER_DAEMON, SCHEDULER_RPC_TIMEOUT, SCHEDULER_SOCKET
+from .exceptions import OperationFailed
+from .log import server_log
+from .worker import run_in_worker
+
+P = ParamSpec("P")
+T = TypeVar("T")
+
+HEADER = struct.Struct(">I")
+
+_operations: dict[str, Callable[..., Awaitable]] = {}
+# The operations run locally in the daemon, otherwise sent to it when `SCHEDULER_DAEMON` is set
+_serving = False
+
+
+def operation(
+    func: Callable[P, T] | None = None, *, blocking: bool = False
+) -> Callable[P, Awaitable[T]]:
+    """
+    Make an async operation of the function, sent to the scheduler daemon if it's used.
+
+    Args:
+        blocking (bool): Run in the WebUI worker pool(`src/worker.py`) instead of on the loop,
+            e.g. the operation loads jobs from the job stores.
+    """
+
+    if func is None:
+        return partial(operation, blocking=blocking)  # type: ignore
+
+    @wraps(func)
+    async def wrapper(*args: P.args, **kwargs: P.kwargs) -> T:
+        if SCHEDULER_DAEMON and not _serving:
+            return await _call(func.__name__, args, kwargs)
+        if blocking:
+            return await run_in_worker(func, *args, **kwargs)
+        return func(*args, **kwargs)
+
+    _operations[func.__name__] = wrapper
+    return wrapper
+
+
+async def _read_frame(reader: asyncio.StreamReader):
+    (size,) = HEADER.unpack(await reader.readexactly(HEADER.size))
+    return pickle.loads(await reader.readexactly(size))
+
+
+def _write_frame(writer: asyncio.StreamWriter, obj) -> None:
+    data = pickle.dumps(obj)
+    writer.write(HEADER.pack(len(data)) + data)
+
+
+async def _call(name: str, args: tuple, kwargs: dict):
+    try:
+        reader, writer = await asyncio.open_unix_connection(SCHEDULER_SOCKET)
+    except (FileNotFoundError, ConnectionRefusedError) as e:
+        raise HTTPException(status_code=503, detail="Scheduler daemon is not running") from e
+    try:
+        _write_frame(writer, (name, args, kwargs))
+        await writer.drain()
+        ok, result = await asyncio.wait_for(_read_frame(reader), SCHEDULER_RPC_TIMEOUT)
+    except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError) as e:
+        raise HTTPException(status_code=504, detail=f"Scheduler daemon didn't reply: {e!r}") from e
+    finally:
+        writer.close()
+    if not ok:
+        raise result
+    return result
+
+
+def _picklable_error(exc: Exception) -> Exception:
+    try:
+        pickle.loads(pickle.dumps(exc))
+    except Exception:
+        return OperationFailed(repr(exc), 500)
+    return exc
+
+
+async def _serve_client(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    try:
+        while True:
+            try:
+                name, args, kwargs = await _read_frame(reader)
+            except asyncio.IncompleteReadError:
+                return
+            try:
+                response = (True, await _operations[name](*args, **kwargs))
+            except Exception as e:
+                if not isinstance(e, (OperationFailed, HTTPException)):
+                    server_log.opt(exception=e).warning(f"Operation {name} failed")
+                response = (False, _picklable_error(e))
+            _write_frame(writer, response)
+            await writer.drain()
+    finally:
+        writer.close()
+
+
+async def serve_operations() -> asyncio.AbstractServer:
+    """Serve the operations on `SCHEDULER_SOCKET`, in the daemon."""
+
+    global _serving
+
+    _serving = True
+    SCHEDULER_SOCKET.unlink(missing_ok=True)
+    server = await asyncio.start_unix_server(_serve_client, SCHEDULER_SOCKET)
+    os.chmod(SCHEDULER_SOCKET, 0o600)
+    server_log.info(f"Serve the scheduler operations on {SCHEDULER_SOCKET}")
+    return server
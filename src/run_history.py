@@ -0,0 +1,252 @@
+"""
+Append-only history of the job runs.
+
+The event listeners in `src/scheduler.py` only put a tuple into a queue, a background thread
+writes the queued runs to the SQLite database `RUN_HISTORY_PATH` in one transaction every
+`RUN_HISTORY_FLUSH_INTERVAL` seconds, so the event loop never waits for the disk.
+
+Each run keeps its scheduled run time, lateness(scheduled run time to the submission to the
+executor), duration(submission to the execution event), status and a short detail(the return
+value or the exception). Runs older than `RUN_HISTORY_RAW_DAYS` are compacted into hourly rollups
+per job and status(count, total and max of the duration and lateness), which are kept for
+`RUN_HISTORY_ROLLUP_DAYS`, so the table of runs stays small however long the scheduler runs.
+"""
+
+import queue
+import sqlite3
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import closing, contextmanager
+from datetime import datetime
+from typing import Any, Literal
+
+from .config import (
+    RUN_HISTORY_FLUSH_INTERVAL,
+    RUN_HISTORY_PATH,
+    RUN_HISTORY_RAW_DAYS,
+    RUN_HISTORY_ROLLUP_DAYS,
+)
+from .log import server_log
+
+RunStatus = Literal["executed", "error", "missed", "max_instances"]
+
+# Characters of the return value or exception kept per run
+DETAIL_LIMIT = 500
+COMPACT_INTERVAL = 3600
+COMPACT_BATCH = 50000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY, job_id TEXT, scheduled REAL, status TEXT,
+    lateness REAL, duration REAL, detail TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_job ON runs(job_id, scheduled);
+CREATE INDEX IF NOT EXISTS runs_scheduled ON runs(scheduled);
+-- Runs compacted by the hour(unix time // 3600) of their scheduled run time
+-- The duration or lateness of some runs are unknown(NULL), they are counted separately
+CREATE TABLE IF NOT EXISTS rollups (
+    job_id TEXT, hour INTEGER, status TEXT, count INTEGER,
+    duration_count INTEGER, total_duration REAL, max_duration REAL,
+    lateness_count INTEGER, total_lateness REAL, max_lateness REAL,
+    PRIMARY KEY (job_id, hour, status)
+);
+CREATE INDEX IF NOT EXISTS rollups_hour ON rollups(hour);
+"""
+
+COMPACT_SQL = """
+INSERT INTO rollups
+SELECT job_id, CAST(scheduled / 3600 AS INTEGER) AS hour, status, count(*),
+    count(duration), total(duration), max(duration),
+    count(lateness), total(lateness), max(lateness)
+FROM runs WHERE id IN (SELECT id FROM compacted)
+GROUP BY job_id, hour, status
+ON CONFLICT (job_id, hour, status) DO UPDATE SET
+    count = count + excluded.count,
+    duration_count = duration_count + excluded.duration_count,
+    total_duration = total_duration + excluded.total_duration,
+    max_duration = max(
+        coalesce(max_duration, excluded.max_duration),
+        coalesce(excluded.max_duration, max_duration)
+    ),
+    lateness_count = lateness_count + excluded.lateness_count,
+    total_lateness = total_lateness + excluded.total_lateness,
+    max_lateness = max(
+        coalesce(max_lateness, excluded.max_lateness),
+        coalesce(excluded.max_lateness, max_lateness)
+    )
+"""
+
+_queue: queue.SimpleQueue[tuple] = queue.SimpleQueue()
+_stop = threading.Event()
+_writer: threading.Thread | None = None
+
+
+@contextmanager
+def connect() -> Iterator[sqlite3.Connection]:
+    RUN_HISTORY_PATH.parent.mkdir(parents=True, exist_ok=True)
+    with closing(sqlite3.connect(RUN_HISTORY_PATH, timeout=30)) as db:
+        db.execute("PRAGMA journal_mode=WAL")
+        db.executescript(SCHEMA)
+        yield db
+
+
+def _detail(value: Any) -> str | None:
+    if value is None:
+        return None
+    if isinstance(value, BaseException):
+        value = f"{type(value).__name__}: {value}"
+    elif not isinstance(value, str):
+        value = repr(value)
+    return value if len(value) <= DETAIL_LIMIT else value[: DETAIL_LIMIT - 3] + "..."
+
+
+def record_run(
+    job_id: str,
+    run_time: datetime,
+    status: RunStatus,
+    detail: Any = None,
+    submitted: float | None = None,
+) -> None:
+    """Queue a finished, missed or skipped run for the writer thread, `submitted` is its
+    submission time(`time.time()`) if it was submitted."""
+
+    now = time.time()
+    scheduled = run_time.timestamp()
+    if status in ("missed", "max_instances"):
+        lateness, duration = max(now - scheduled, 0), None
+    elif submitted is not None:
+        lateness, duration = max(submitted - scheduled, 0), now - submitted
+    else:
+        lateness = duration = None  # submitted before a restart
+    _queue.put((job_id, scheduled, status, lateness, duration, _detail(detail)))
+
+
+def _flush(db: sqlite3.Connection) -> int:
+    runs = []
+    while True:
+        try:
+            runs.append(_queue.get_nowait())
+        except queue.Empty:
+            break
+    if runs:
+        with db:
+            db.executemany(
+                "INSERT INTO runs (job_id, scheduled, status, lateness, duration, detail) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                runs,
+            )
+    return len(runs)
+
+
+def compact_history(db: sqlite3.Connection, now: float | None = None) -> int:
+    """Move the runs older than `RUN_HISTORY_RAW_DAYS` into the rollups, drop old rollups."""
+
+    now = time.time() if now is None else now
+    cutoff = now - RUN_HISTORY_RAW_DAYS * 86400
+    compacted = 0
+    # In batches, so the first compaction of a large history doesn't hold a long transaction
+    while True:
+        with db:
+            db.execute("CREATE TEMP TABLE IF NOT EXISTS compacted (id INTEGER PRIMARY KEY)")
+            db.execute("DELETE FROM compacted")
+            count = db.execute(
+                "INSERT INTO compacted SELECT id FROM runs WHERE scheduled < ? LIMIT ?",
+                (cutoff, COMPACT_BATCH),
+            ).rowcount
+            if count:
+                db.execute(COMPACT_SQL)
+                db.execute("DELETE FROM runs WHERE id IN (SELECT id FROM compacted)")
+        compacted += count
+        if count < COMPACT_BATCH:
+            break
+    with db:
+        hour = int(now - RUN_HISTORY_ROLLUP_DAYS * 86400) // 3600
+        db.execute("DELETE FROM rollups WHERE hour < ?", (hour,))
+    return compacted
+
+
+def _run_writer() -> None:
+    with connect() as db:
+        last_compaction = float("-inf")
+        while True:
+            stopping = _stop.wait(RUN_HISTORY_FLUSH_INTERVAL)
+            try:
+                _flush(db)
+                if not stopping and time.monotonic() - last_compaction > COMPACT_INTERVAL:
+                    last_compaction = time.monotonic()
+                    if count := compact_history(db):
+                        server_log.debug(f"Compact {count} runs of the run history")
+            except Exception:
+                server_log.exception("Failed to write the run history")
+            if stopping:
+                return
+
+
+def start_history_writer() -> None:
+    """Start the background thread writing the queued runs."""
+
+    global _writer
+
+    _stop.clear()
+    _writer = threading.Thread(target=_run_writer, name="run-history-writer", daemon=True)
+    _writer.start()
+
+
+def stop_history_writer() -> None:
+    """Write the remaining runs and stop the writer thread."""
+
+    _stop.set()
+    if _writer is not None:
+        _writer.join()
+
+
+def query_runs(job_id: str, limit: int, offset: int = 0) -> tuple[int, list[dict]]:
+    """
+    Recent runs of a job, newest first.
+
+    Returns:
+        tuple[int, list[dict]]: Count of the runs which are not compacted yet and the runs in the
+            range, `scheduled` is a unix time.
+    """
+
+    with connect() as db:
+        db.row_factory = sqlite3.Row
+        (total,) = db.execute("SELECT count(*) FROM runs WHERE job_id = ?", (job_id,)).fetchone()
+        rows = db.execute(
+            "SELECT scheduled, status, lateness, duration, detail FROM runs WHERE job_id = ? "
+            "ORDER BY scheduled DESC, id DESC LIMIT ? OFFSET ?",
+            (job_id, limit, offset),
+        ).fetchall()
+    return total, [dict(row) for row in rows]
+
+
+def summarize_runs(job_id: str) -> list[dict]:
+    """Count, average and max duration and lateness of all runs of a job by status."""
+
+    with connect() as db:
+        db.row_factory = sqlite3.Row
+        rows = db.execute(
+            """
+            SELECT status, sum(count) AS count,
+                total(total_duration) / max(sum(duration_count), 1) AS avg_duration,
+                max(max_duration) AS max_duration,
+                total(total_lateness) / max(sum(lateness_count), 1) AS avg_lateness,
+                max(max_lateness) AS max_lateness
+            FROM (
+                SELECT status, count(*) AS count, count(duration) AS duration_count,
+                    total(duration) AS total_duration, max(duration) AS max_duration,
+                    count(lateness) AS lateness_count, total(lateness) AS total_lateness,
+                    max(lateness) AS max_lateness
+                FROM runs WHERE job_id = ? GROUP BY status
+                UNION ALL
+                SELECT status, sum(count), sum(duration_count), total(total_duration),
+                    max(max_duration), sum(lateness_count), total(total_lateness),
+                    max(max_lateness)
+                FROM rollups WHERE job_id = ? GROUP BY status
+            )
+            GROUP BY status ORDER BY status
+            """,
+            (job_id, job_id),
+        ).fetchall()
+    return [dict(row) for row in rows]
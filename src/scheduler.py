@@ -1,12 +1,19 @@
+import asyncio
+import threading
+import time
+from collections.abc import Iterable
+from datetime import datetime
 from functools import partial
-from typing import TYPE_CHECKING, Literal
+from typing import TYPE_CHECKING, Literal, NamedTuple
 
 from apscheduler.events import (
+    EVENT_ALL_JOBS_REMOVED,
     EVENT_EXECUTOR_ADDED,
     EVENT_EXECUTOR_REMOVED,
     EVENT_JOB_ADDED,
     EVENT_JOB_ERROR,
     EVENT_JOB_EXECUTED,
+    EVENT_JOB_MAX_INSTANCES,
     EVENT_JOB_MISSED,
     EVENT_JOB_MODIFIED,
     EVENT_JOB_REMOVED,
@@ -18,15 +25,193 @@ from apscheduler.events import (
     JobSubmissionEvent,
     SchedulerEvent,
 )
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.schedulers.asyncio import AsyncIOScheduler, run_in_event_loop
+from apscheduler.schedulers.base import STATE_RUNNING, STATE_STOPPED
 
+from .cluster import coordinate_jobstore, uncoordinate_jobstore
 from .config import SCHEDULER_CONFIG
 from .log import server_log
+from .metrics import (
+    instrument_jobstore,
+    job_events,
+    observe_execution,
+    observe_submission,
+    on_loop,
+)
+from .run_history import RunStatus, record_run
+from .store_thread import io_threads, thread_jobstore
 
 if TYPE_CHECKING:
     from apscheduler.job import Job
+    from apscheduler.jobstores.base import BaseJobStore
+    from apscheduler.triggers.base import BaseTrigger
+
+
+# Seconds until a wakeup is retried when the lock of the job stores is held by another thread,
+# e.g. a bulk action writing a batch
+BUSY_RETRY = 0.05
+
+
+class Scheduler(AsyncIOScheduler):
+    """
+    Loads the due jobs of the job stores with an I/O thread(`src/store_thread.py`) on their
+    threads before processing them on the loop, other stores are called on the loop as before.
+    A wakeup doesn't wait on the loop for the lock of the job stores, it's retried after
+    `BUSY_RETRY` while another thread holds it. The metadata of an added or modified job is kept
+    for its event, instead of loading the job again.
+    """
+
+    _wakeup_task: asyncio.Task | None = None
+    _wakeup_again = False
+
+    @run_in_event_loop
+    def wakeup(self):
+        if self._wakeup_task is not None:
+            # Processed again once the running wakeup is done
+            self._wakeup_again = True
+            return
+        self._stop_timer()
+        if io_threads(self._jobstores.values()):
+            self._wakeup_task = self._eventloop.create_task(self._prefetch_and_process())
+        else:
+            self._start_timer(self._process_jobs())
+
+    def _real_add_job(self, job, jobstore_alias, replace_existing):
+        if not hasattr(job, "next_run_time"):
+            # Same as APScheduler, before the job is remembered
+            now = datetime.now(self.timezone)
+            job._modify(next_run_time=job.trigger.get_next_fire_time(None, now))
+        remember_written_jobs([job])
+        try:
+            super()._real_add_job(job, jobstore_alias, replace_existing)
+        finally:
+            # Taken by the event, unless the job wasn't added
+            _written_meta.pop(job.id, None)
+
+    def modify_job(self, job_id, jobstore=None, **changes):
+        # Same as APScheduler, with the job remembered before its event
+        with self._jobstores_lock:
+            job, jobstore = self._lookup_job(job_id, jobstore)
+            job._modify(**changes)
+            if jobstore:
+                self._lookup_jobstore(jobstore).update_job(job)
+            remember_written_jobs([job])
+        self._dispatch_event(JobEvent(EVENT_JOB_MODIFIED, job_id, jobstore))
+        # The next run time of the job may have been changed
+        if self.state == STATE_RUNNING:
+            self.wakeup()
+        return job
+
+    def _process_jobs(self):
+        if not self._jobstores_lock.acquire(blocking=False):
+            return BUSY_RETRY
+        try:
+            return super()._process_jobs()
+        finally:
+            self._jobstores_lock.release()
+
+    async def _prefetch_and_process(self) -> None:
+        wait_seconds = None
+        try:
+            self._wakeup_again = True
+            while self._wakeup_again:
+                self._wakeup_again = False
+                threads = io_threads(self._jobstores.values())
+                if self.state == STATE_RUNNING:
+                    now = datetime.now(self.timezone)
+                    await asyncio.gather(*(thread.prefetch(now) for thread in threads))
+                if self.state == STATE_STOPPED:
+                    return
+                try:
+                    wait_seconds = self._process_jobs()
+                finally:
+                    for thread in threads:
+                        thread.processed()
+        except Exception:
+            server_log.exception("Failed to process the jobs")
+            wait_seconds = self.jobstore_retry_interval
+        finally:
+            self._wakeup_task = None
+        if self.state != STATE_STOPPED:
+            self._start_timer(wait_seconds)
+
+
+scheduler = Scheduler(**SCHEDULER_CONFIG)
+
+
+class JobMeta(NamedTuple):
+    name: str
+    trigger: "BaseTrigger"
+    next_run_time: datetime | None
+    executor: str
+
+
+# Metadata of the jobs for the event listeners, so events don't query the job stores(a network
+# round-trip and unpickling for SQLAlchemy/Redis/MongoDB) on the event loop. Entries are replaced
+# by the add/modify events with the written jobs, dropped by the remove events, and loaded again
+# on next use.
+_job_meta: dict[str, JobMeta] = {}
+# Metadata of the jobs written by `Scheduler.add_job`/`modify_job` and the bulk actions
+# (`src/bulk.py`), taken by the events of the jobs instead of loading each job again
+_written_meta: dict[str, JobMeta] = {}
+# Metadata of the removed jobs for the execution events of their last runs(e.g. a date job), which
+# would miss the job stores, the oldest are dropped beyond this
+_removed_meta: dict[str, JobMeta] = {}
+MAX_REMOVED_META = 1000
+
+
+class PendingRun(NamedTuple):
+    submitted: float  # time.time()
+    executor: str
 
-scheduler = AsyncIOScheduler(**SCHEDULER_CONFIG)
+
+# Submitted runs waiting for their execution events by job id and scheduled run time, for the
+# metrics and the run history. The listeners run on the loop or in the threads of the pool
+# executors. The oldest are dropped beyond this, e.g. the runs of a broken process pool never get
+# an event.
+_pending_runs: dict[tuple[str, datetime], PendingRun] = {}
+_pending_lock = threading.Lock()
+MAX_PENDING_RUNS = 10000
+
+
+def get_job_meta(job_id: str) -> JobMeta | None:
+    if (meta := _job_meta.get(job_id) or _removed_meta.get(job_id)) is not None:
+        return meta
+    # None instead of waiting on the loop for another thread holding the lock of the job stores
+    if not scheduler._jobstores_lock.acquire(blocking=not on_loop()):
+        return None
+    try:
+        job = scheduler.get_job(job_id)
+    finally:
+        scheduler._jobstores_lock.release()
+    if job is not None:
+        meta = _job_meta[job_id] = JobMeta(
+            job.name, job.trigger, job.next_run_time, job.executor
+        )
+    return meta
+
+
+def remember_written_jobs(jobs: "Iterable[Job]") -> None:
+    """Keep the metadata of the written jobs for their add/modify events."""
+
+    for job in jobs:
+        _written_meta[job.id] = JobMeta(job.name, job.trigger, job.next_run_time, job.executor)
+
+
+def job_name(job_id: str) -> str:
+    return meta.name if (meta := get_job_meta(job_id)) else ""
+
+
+def prepare_jobstore(alias: str, store: "BaseJobStore") -> None:
+    """
+    Instrument, coordinate and thread the store for the running scheduler, in this order as each
+    one rebinds the methods of the store. Coordinating a store queries its database, a new store
+    is prepared in a worker thread before it's added.
+    """
+
+    instrument_jobstore(alias, store)
+    coordinate_jobstore(alias, store)
+    thread_jobstore(alias, store)
 
 
 def listen_executor_or_jobstore_event(
@@ -36,31 +221,104 @@ def listen_executor_or_jobstore_event(
 ) -> None:
     obj = f"{event.alias}[{mapper[event.alias]}]" if event.alias in mapper else event.alias
     server_log.debug(f"{action} {obj}")
+    if action == "Add job store":
+        # Already done by the `add_job_store` operation, before the store is added
+        if scheduler.running:
+            prepare_jobstore(event.alias, mapper[event.alias])
+        else:
+            instrument_jobstore(event.alias, mapper[event.alias])
+    elif action == "Remove job store":
+        uncoordinate_jobstore(event.alias)
 
 
 def listen_job_event(
     event: JobEvent, action: Literal["Add job", "Remove job", "Modify job", "Submit job"]
 ) -> None:
-    job: Job | None = scheduler.get_job(event.job_id)
-    server_log.debug(f"{action}: {job.name if job else ''}[{event.job_id}]")
+    if action == "Remove job":
+        # The job is already removed from the store, use the cached name
+        meta = _job_meta.pop(event.job_id, None)
+        if meta is not None:
+            _removed_meta[event.job_id] = meta
+            while len(_removed_meta) > MAX_REMOVED_META:
+                del _removed_meta[next(iter(_removed_meta))]
+        server_log.debug("{}: {}[{}]", action, meta.name if meta else "", event.job_id)
+        return
+    _removed_meta.pop(event.job_id, None)
+    if (meta := _written_meta.pop(event.job_id, None)) is not None:
+        _job_meta[event.job_id] = meta
+    else:
+        _job_meta.pop(event.job_id, None)
+    # Lazy arguments are only evaluated if the level is enabled by a sink
+    server_log.opt(lazy=True).debug(
+        "{}: {}[{}]", lambda: action, lambda: job_name(event.job_id), lambda: event.job_id
+    )
+
+
+def listen_all_jobs_removed_event(event: SchedulerEvent) -> None:
+    _job_meta.clear()
+    _removed_meta.clear()
+    server_log.debug("Remove all jobs{}", f" from {event.alias}" if event.alias else "")
 
 
 def listen_job_execution_event(
     event: JobExecutionEvent,
     action: Literal["Executed job", "Missed job", "Error job"],
 ) -> None:
-    message = f"{action}: {event.job_id}[{scheduler.get_job(event.job_id)}]"
+    status: RunStatus = action.split()[0].lower()  # type: ignore
+    with _pending_lock:
+        pending = _pending_runs.pop((event.job_id, event.scheduled_run_time), None)
+    if pending is not None:
+        executor, submitted = pending.executor, pending.submitted
+    else:
+        meta = get_job_meta(event.job_id)
+        executor, submitted = meta.executor if meta else "", None
+    duration = time.time() - submitted if submitted is not None else None
+    observe_execution(event.job_id, executor, status, duration)
+    record_run(
+        event.job_id,
+        event.scheduled_run_time,
+        status,
+        event.exception or event.retval,
+        submitted,
+    )
     if event.exception:
-        server_log.opt(exception=event.exception).error(message)
+        server_log.opt(exception=event.exception).error(
+            "{}: {}[{}]", action, event.job_id, job_name(event.job_id)
+        )
     else:
-        server_log.debug(message)
+        server_log.opt(lazy=True).debug(
+            "{}: {}[{}]", lambda: action, lambda: event.job_id, lambda: job_name(event.job_id)
+        )
 
 
 def listen_job_submission_event(event: JobSubmissionEvent) -> None:
-    job: Job | None = scheduler.get_job(event.job_id)
-    if not job:
+    if (meta := get_job_meta(event.job_id)) is None:
         return
-    server_log.debug(f"Submit job: {job.name}[{event.job_id}], next run at {job.next_run_time}")
+    now = datetime.now(scheduler.timezone)
+    observe_submission(event.job_id, meta.executor, event.scheduled_run_times, now)
+    pending = PendingRun(time.time(), meta.executor)
+    with _pending_lock:
+        for run_time in event.scheduled_run_times:
+            _pending_runs[(event.job_id, run_time)] = pending
+        while len(_pending_runs) > MAX_PENDING_RUNS:
+            del _pending_runs[next(iter(_pending_runs))]
+    # Same as the scheduler computing the next run time after submitting(except for the jitter)
+    next_run_time = meta.trigger.get_next_fire_time(event.scheduled_run_times[-1], now)
+    _job_meta[event.job_id] = meta._replace(next_run_time=next_run_time)
+    server_log.opt(lazy=True).debug(
+        "Submit job: {}[{}], next run at {}",
+        lambda: meta.name,
+        lambda: event.job_id,
+        lambda: next_run_time,
+    )
+
+
+def listen_max_instances_event(event: JobSubmissionEvent) -> None:
+    # Not submitted, too many instances of the job are running
+    meta = get_job_meta(event.job_id)
+    job_events.inc((event.job_id, meta.executor if meta else "", "max_instances"))
+    for run_time in event.scheduled_run_times:
+        record_run(event.job_id, run_time, "max_instances")
 
 
 listener = {
@@ -83,7 +341,12 @@ listener = {
     EVENT_JOB_ERROR: partial(listen_job_execution_event, action="Error job"),
     EVENT_JOB_MISSED: partial(listen_job_execution_event, action="Missed job"),
     EVENT_JOB_SUBMITTED: listen_job_submission_event,
+    EVENT_JOB_MAX_INSTANCES: listen_max_instances_event,
+    EVENT_ALL_JOBS_REMOVED: listen_all_jobs_removed_event,
 }
 
 
 scheduler.add_listener(lambda event: listener.get(event.code, lambda _: None)(event))
+# Job stores of `SCHEDULER_CONFIG` are added before the listener
+for alias, store in scheduler._jobstores.items():
+    instrument_jobstore(alias, store)
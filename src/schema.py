@@ -2,17 +2,20 @@ import datetime
 import json
 from typing import TYPE_CHECKING, Annotated, Literal, TypeAlias
 
-from apscheduler.executors.asyncio import AsyncIOExecutor
-from apscheduler.executors.pool import ProcessPoolExecutor, ThreadPoolExecutor
 from apscheduler.job import Job
 from apscheduler.triggers.cron import CronTrigger
 from apscheduler.triggers.date import DateTrigger
 from apscheduler.triggers.interval import IntervalTrigger
-from fastapi import HTTPException
-from pydantic import BaseModel, Field, PlainSerializer, model_validator
+from fastapi import HTTPException, UploadFile
+from fastui.forms import FormFile
+from pydantic import BaseModel, Field, PlainSerializer, field_validator, model_validator
 
+from .config import TRIGGER_SPREAD
 from .exceptions import InvalidExecutor, InvalidJobStore, InvalidTrigger
+from .executors import AsyncIOExecutor, ProcessPoolExecutor, ThreadPoolExecutor
 from .scheduler import scheduler
+from .spread import spread_trigger, trigger_name
+from .store_thread import use_io_thread
 from .uv import uv_run
 
 if TYPE_CHECKING:
@@ -29,6 +32,15 @@ def format_date(date: datetime.datetime | datetime.date | None) -> str | None:
     return date.strftime("%Y-%m-%d %H:%M:%S")
 
 
+def format_seconds(seconds: float | None) -> str | None:
+    return None if seconds is None else f"{seconds:.3f}s"
+
+
+def _spread(trigger: CronTrigger | IntervalTrigger) -> str | None:
+    spread = getattr(trigger, "spread", 0)
+    return str(spread) if spread else None
+
+
 class TriggerParam(BaseModel):
     year: Annotated[str | None, Field(None, title="Year", description="Available for Cron & Date")]
     month: Annotated[
@@ -60,6 +72,16 @@ class TriggerParam(BaseModel):
         Field(None, title="End Date", description="Available for Cron & Interval"),
         PlainSerializer(format_date),
     ]
+    spread: Annotated[
+        str | None,
+        Field(
+            None,
+            title="Spread",
+            description="Available for Cron & Interval, seconds within which the jobs with the "
+            "same schedule run, each at a fixed offset from its id. Empty for the default of "
+            "the job store, 0 to run on schedule",
+        ),
+    ]
 
     @model_validator(mode="before")
     @classmethod
@@ -71,6 +93,7 @@ class TriggerParam(BaseModel):
             trigger_param = {field.name: str(field) for field in trigger.fields} | {
                 "start_date": trigger.start_date,
                 "end_date": trigger.end_date,
+                "spread": _spread(trigger),
             }
         elif isinstance(trigger, IntervalTrigger):
             trigger_param = {
@@ -80,6 +103,7 @@ class TriggerParam(BaseModel):
             } | {
                 "start_date": trigger.start_date,
                 "end_date": trigger.end_date,
+                "spread": _spread(trigger),
             }
         elif isinstance(trigger, dict):
             trigger_param = dict(filter(lambda i: i[1], trigger.items()))
@@ -88,10 +112,25 @@ class TriggerParam(BaseModel):
         return trigger_param
 
     def get_trigger(
-        self, trigger: TriggerType, next_run_time: datetime.datetime | None
+        self,
+        trigger: TriggerType,
+        next_run_time: datetime.datetime | None,
+        job_id: str = "",
+        jobstore: str | None = None,
     ) -> AllTrigger:
+        """
+        Create the trigger of a job.
+
+        Args:
+            trigger (TriggerType): Type of the trigger.
+            next_run_time (datetime | None): Defaults of the run date of a date trigger.
+            job_id (str): Id of the job, the offset of a spread trigger is taken from it.
+            jobstore (str | None): Alias of the job store of the job, for its default spread.
+        """
+
+        spread = int(self.spread) if self.spread is not None else TRIGGER_SPREAD.get(jobstore, 0)
         if trigger == "Cron":
-            return CronTrigger(
+            cron = CronTrigger(
                 year=self.year,
                 month=self.month,
                 week=self.week,
@@ -103,6 +142,7 @@ class TriggerParam(BaseModel):
                 start_date=self.start_date,
                 end_date=self.end_date,
             )
+            return spread_trigger(cron, spread, job_id)  # type: ignore
         if trigger == "Date":
             keys = ("year", "month", "day", "hour", "minute", "second")
             params = {}
@@ -115,7 +155,7 @@ class TriggerParam(BaseModel):
             )
             return DateTrigger(run_date=datetime.datetime(**params))  # type: ignore
         if trigger == "Interval":
-            return IntervalTrigger(
+            interval = IntervalTrigger(
                 weeks=int(self.week or 0),
                 days=int(self.day or 0),
                 hours=int(self.hour or 0),
@@ -124,6 +164,7 @@ class TriggerParam(BaseModel):
                 start_date=self.start_date,
                 end_date=self.end_date,
             )
+            return spread_trigger(interval, spread, job_id)  # type: ignore
         raise InvalidTrigger(trigger)
 
 
@@ -191,11 +232,26 @@ class JobInfo(BaseModel):
             data["args"] = json.dumps(job.args)
 
         data["kwargs"] = json.dumps(job.kwargs)
-        data["trigger"] = job.trigger.__class__.__name__.removesuffix("Trigger")
+        data["trigger"] = trigger_name(job.trigger)
         data["trigger_params"] = job.trigger
         return data
 
 
+class JobQuery(BaseModel):
+    """Filters, sorting and page of the job list, see `src/job_query.py`."""
+
+    id: Annotated[str, Field("", title="ID", description="Prefix of job id")]
+    name: Annotated[str, Field("", title="Name", description="Prefix of job name")]
+    trigger: Annotated[TriggerType | Literal[""], Field("", title="Trigger")]
+    store: Annotated[str, Field("", title="Job Store")]
+    state: Annotated[Literal["", "scheduled", "paused"], Field("", title="State")]
+    sort: Annotated[
+        Literal["next_run_time", "name", "executor"], Field("next_run_time", title="Sort By")
+    ]
+    order: Annotated[Literal["asc", "desc"], Field("asc", title="Order")]
+    page: Annotated[int, Field(1, ge=1)]
+
+
 class ModifyJobParam(BaseModel):
     """
     Data model for modifying APScheduler jobs, providing parsed trigger configuration,
@@ -223,11 +279,13 @@ class ModifyJobParam(BaseModel):
         params.setdefault("trigger_params", TriggerParam())  # type: ignore
         return params
 
-    def get_trigger(self) -> AllTrigger | None:
+    def get_trigger(self, job_id: str, jobstore: str | None) -> AllTrigger | None:
         trigger_params = self.trigger_params.model_dump(exclude_none=True)
         if not trigger_params:
             return None
-        return self.trigger_params.get_trigger(self.trigger, self.next_run_time)
+        return self.trigger_params.get_trigger(
+            self.trigger, self.next_run_time, job_id, jobstore
+        )
 
 
 class NewJobParam(ModifyJobParam, JobInfo):  # type: ignore
@@ -238,6 +296,178 @@ class NewJobParam(ModifyJobParam, JobInfo):  # type: ignore
     pass
 
 
+BulkAction: TypeAlias = Literal["pause", "resume", "remove", "modify"]
+# Job attributes changed by the "modify" bulk action, "spread" spreads the cron and interval
+# triggers(`src/spread.py`), other changes of the triggers are made one by one
+BULK_CHANGES = {"name", "executor", "coalesce", "max_instances", "misfire_grace_time", "spread"}
+
+
+class BulkJobParam(BaseModel):
+    """Action on all jobs matching the selection, see `src/bulk.py`."""
+
+    action: Annotated[BulkAction, Field(title="Action")]
+    ids: Annotated[
+        str,
+        Field(
+            "",
+            title="IDs",
+            description="Job ids separated by lines, spaces or commas",
+            json_schema_extra={"format": "textarea"},
+        ),
+    ]
+    name: Annotated[
+        str, Field("", title="Name", description="Pattern of job name, e.g. 'report-*'")
+    ]
+    store: Annotated[str, Field("", title="Job Store")]
+    executor: Annotated[str, Field("", title="Executor")]
+    changes: Annotated[
+        str,
+        Field(
+            "{}",
+            title="Changes",
+            description="Dict with json format for modify, e.g. {\"max_instances\": 2}",
+        ),
+    ]
+
+    @model_validator(mode="before")
+    @classmethod
+    def parse(cls, params: dict) -> dict:
+        # Lists and dicts from the JSON API
+        if isinstance(ids := params.get("ids"), list):
+            params["ids"] = "\n".join(ids)
+        if isinstance(changes := params.get("changes"), dict):
+            params["changes"] = json.dumps(changes)
+        return params
+
+    @model_validator(mode="after")
+    def check(self) -> "BulkJobParam":
+        if not (self.ids.strip() or self.name or self.store or self.executor):
+            raise ValueError("Select the jobs by ids, name, job store or executor")
+        if self.action == "modify":
+            if not (changes := self.change_dict()):
+                raise ValueError("No change to modify")
+            if unknown := set(changes) - BULK_CHANGES:
+                raise ValueError(f"Cannot modify {', '.join(sorted(unknown))} in bulk")
+            if "spread" in changes and not (
+                isinstance(spread := changes["spread"], int) and spread >= 0
+            ):
+                raise ValueError("Spread must be seconds(a non-negative integer)")
+        return self
+
+    def id_list(self) -> list[str]:
+        return list(dict.fromkeys(self.ids.replace(",", " ").split()))
+
+    def change_dict(self) -> dict:
+        return dict(json.loads(self.changes or "{}"))
+
+
+class BulkProgress(BaseModel):
+    """Progress of a bulk action."""
+
+    action: Annotated[str, Field(title="Action")]
+    selected: Annotated[int | None, Field(None, title="Selected Jobs")]
+    done: Annotated[int, Field(0, title="Done")]
+    failed: Annotated[int, Field(0, title="Failed")]
+    elapsed: Annotated[float, Field(0.0, title="Elapsed"), PlainSerializer(format_seconds)]
+    finished: Annotated[bool, Field(False, title="Finished")]
+    errors: Annotated[list[str], Field([], title="Errors")]
+
+
+def _alias(label: str) -> str:
+    """Alias of an executor or job store shown as "Class(alias)" by `JobInfo`."""
+
+    return label[label.index("(") + 1 : -1] if label.endswith(")") else label
+
+
+class ManifestJob(BaseModel):
+    """Definition of a job in a manifest, see `src/manifest.py`."""
+
+    id: str
+    name: str
+    func: str
+    uv_script: str = ""
+    args: list = []
+    kwargs: dict = {}
+    trigger: TriggerType
+    trigger_params: dict[str, str] = {}
+    executor: str = "default"
+    jobstore: str = "default"
+    coalesce: bool = True
+    max_instances: int = 1
+    misfire_grace_time: int | None = None
+    paused: bool = False
+
+    @field_validator("trigger_params", mode="before")
+    @classmethod
+    def parse_trigger_params(cls, params: dict) -> dict:
+        # Written by hand, e.g. `second: 30` in YAML
+        return {k: str(v) for k, v in params.items() if v is not None}
+
+    @classmethod
+    def from_info(cls, job: JobInfo) -> "ManifestJob":
+        return cls.model_validate(
+            job.model_dump(exclude={"next_run_time"})
+            | {
+                "args": json.loads(job.args),
+                "kwargs": json.loads(job.kwargs),
+                "trigger_params": job.trigger_params.model_dump(exclude_none=True),
+                "executor": _alias(job.executor),
+                "jobstore": _alias(job.jobstore),
+                "paused": job.next_run_time is None,
+            }
+        )
+
+    def get_trigger(self) -> AllTrigger:
+        params = TriggerParam.model_validate(self.trigger_params)
+        return params.get_trigger(self.trigger, None, self.id, self.jobstore)
+
+
+class JobManifest(BaseModel):
+    jobs: list[ManifestJob]
+
+    @model_validator(mode="after")
+    def check(self) -> "JobManifest":
+        ids = [job.id for job in self.jobs]
+        if len(set(ids)) != len(ids):
+            duplicated = sorted({job_id for job_id in ids if ids.count(job_id) > 1})[:10]
+            raise ValueError(f"Duplicated job ids: {', '.join(duplicated)}")
+        return self
+
+
+class ManifestChange(BaseModel):
+    id: Annotated[str, Field(title="ID")]
+    change: Annotated[Literal["add", "update", "remove"], Field(title="Change")]
+    jobstore: Annotated[str, Field(title="Job Store")]
+    fields: Annotated[str, Field("", title="Changed Fields")]
+
+
+class ManifestPlan(BaseModel):
+    """Changes applied by the import of a manifest, the first ones are listed."""
+
+    added: int = 0
+    updated: int = 0
+    removed: int = 0
+    unchanged: int = 0
+    changes: list[ManifestChange] = []
+    errors: list[str] = []
+
+
+class ManifestImportParam(BaseModel):
+    manifest: Annotated[
+        UploadFile,
+        FormFile(accept=".json,.yaml,.yml"),
+        Field(title="Manifest", description="JSON or YAML(needs PyYAML) exported manifest"),
+    ]
+    # An unchecked checkbox isn't posted, the fields default to False
+    apply: Annotated[
+        bool, Field(False, title="Apply", description="Apply the changes, otherwise only show them")
+    ]
+    prune: Annotated[
+        bool,
+        Field(False, title="Prune", description="Remove the jobs which are not in the manifest"),
+    ]
+
+
 class JobStoreInfo(BaseModel):
     alias: Annotated[str, Field(title="Alias")]
     type_: Annotated[
@@ -257,6 +487,15 @@ class JobStoreInfo(BaseModel):
             Redis: {"host": "host", "port": port, "db": db}""",
         ),
     ]
+    # An unchecked checkbox isn't posted, defaults to False
+    io_thread: Annotated[
+        bool,
+        Field(
+            False,
+            title="I/O Thread",
+            description="Call the store on its own thread instead of the event loop",
+        ),
+    ]
 
     @model_validator(mode="before")
     @classmethod
@@ -266,6 +505,7 @@ class JobStoreInfo(BaseModel):
             return job_store
         store = job_store.pop("store")
         type_ = store.__class__.__name__.removesuffix("JobStore")
+        job_store["io_thread"] = hasattr(store, "_store_thread")
         if type_ == "Memory":
             job_store["detail"] = ""
         elif type_ == "SQLAlchemy":
@@ -299,6 +539,10 @@ class JobStoreInfo(BaseModel):
         return {"type_": type_, **job_store}
 
     def get_store(self) -> "BaseJobStore":
+        store = self._get_store()
+        return use_io_thread(store) if self.io_thread else store
+
+    def _get_store(self) -> "BaseJobStore":
         try:
             if self.type_ == "Memory":
                 from apscheduler.jobstores.memory import MemoryJobStore
@@ -323,6 +567,11 @@ class JobStoreInfo(BaseModel):
             raise HTTPException(status_code=400, detail=e) from e
 
 
+class JobStoreStats(JobStoreInfo):
+    latency: Annotated[str, Field("", title="Latency")]
+    loop_blocked: Annotated[str, Field("", title="Loop Blocked")]
+
+
 class ExecutorInfo(BaseModel):
     alias: Annotated[str, Field(title="Alias")]
     type_: Annotated[Literal["Asyncio", "ThreadPool", "ProcessPool"], Field(title="Executor Type")]
@@ -352,3 +601,146 @@ class ExecutorInfo(BaseModel):
         if self.type_ == "ProcessPool":
             return ProcessPoolExecutor(**kwargs)
         raise InvalidExecutor(self.type_)
+
+
+class LimiterStats(BaseModel):
+    """Queue of the uv scripts of all jobs("*") or of a tag, see `src/limiter.py`."""
+
+    tag: Annotated[str, Field(title="Tag")]
+    width: Annotated[int | None, Field(None, title="Width")]
+    running: Annotated[int, Field(title="Running")]
+    queued: Annotated[int, Field(title="Queued")]
+    max_queued: Annotated[int, Field(title="Max Queued")]
+    started: Annotated[int, Field(title="Started")]
+    avg_wait: Annotated[float, Field(title="Avg Wait"), PlainSerializer(format_seconds)]
+    max_wait: Annotated[float, Field(title="Max Wait"), PlainSerializer(format_seconds)]
+
+
+class LoopLagStats(BaseModel):
+    """Lag of the event loop in a period, see `src/loop_monitor.py`."""
+
+    period: Annotated[str, Field(title="Period")]
+    samples: Annotated[int, Field(title="Samples")]
+    avg: Annotated[float, Field(title="Avg"), PlainSerializer(format_seconds)]
+    p50: Annotated[float, Field(title="P50"), PlainSerializer(format_seconds)]
+    p95: Annotated[float, Field(title="P95"), PlainSerializer(format_seconds)]
+    p99: Annotated[float, Field(title="P99"), PlainSerializer(format_seconds)]
+    max: Annotated[float, Field(title="Max"), PlainSerializer(format_seconds)]
+
+
+class SlowCallbackStats(BaseModel):
+    """Callbacks of an owner(a job, a request or a function) which blocked the event loop."""
+
+    owner: Annotated[str, Field(title="Owner")]
+    count: Annotated[int, Field(title="Count")]
+    total: Annotated[float, Field(title="Total"), PlainSerializer(format_seconds)]
+    max: Annotated[float, Field(title="Max"), PlainSerializer(format_seconds)]
+    last: Annotated[datetime.datetime, Field(title="Last"), PlainSerializer(format_date)]
+
+
+class SlowCallback(BaseModel):
+    time: Annotated[datetime.datetime, Field(title="Time"), PlainSerializer(format_date)]
+    owner: Annotated[str, Field(title="Owner")]
+    duration: Annotated[float, Field(title="Duration"), PlainSerializer(format_seconds)]
+
+
+class JobTiming(BaseModel):
+    """Lateness and run time of the runs of a job since the start, see `src/metrics.py`."""
+
+    job: Annotated[str, Field(title="Job")]
+    executor: Annotated[str, Field(title="Executor")]
+    runs: Annotated[int, Field(title="Runs")]
+    avg_lateness: Annotated[float, Field(title="Avg Lateness"), PlainSerializer(format_seconds)]
+    avg_duration: Annotated[
+        float | None, Field(None, title="Avg Duration"), PlainSerializer(format_seconds)
+    ]
+    loop_blocked: Annotated[
+        float, Field(0.0, title="Loop Blocked"), PlainSerializer(format_seconds)
+    ]
+
+
+class TimelinePeak(BaseModel):
+    """A busiest minute of the timeline, see `src/timeline.py`."""
+
+    minute: Annotated[datetime.datetime, Field(title="Minute"), PlainSerializer(format_date)]
+    fires: Annotated[int, Field(title="Fires")]
+    triggers: Annotated[str, Field(title="Triggers")]
+    jobs: Annotated[str, Field(title="Jobs")]
+
+
+class TimelineHour(BaseModel):
+    """Fires of an hour of the timeline, each character of `minutes` is a minute."""
+
+    hour: Annotated[datetime.datetime, Field(title="Hour"), PlainSerializer(format_date)]
+    fires: Annotated[int, Field(title="Fires")]
+    peak: Annotated[int, Field(title="Busiest Minute")]
+    minutes: Annotated[str, Field(title="Minutes")]
+
+
+class Timeline(BaseModel):
+    """Fires of the jobs in each minute of the next hours from the start minute."""
+
+    start: datetime.datetime
+    hours: int
+    jobs: Annotated[int, Field(description="Scheduled jobs")]
+    per_minute: list[int]
+    peaks: list[TimelinePeak]
+    capped: Annotated[
+        list[str], Field(description="Jobs firing more than TIMELINE_MAX_FIRES times")
+    ]
+
+
+class RunRecord(BaseModel):
+    """Run of a job in the run history, see `src/run_history.py`."""
+
+    scheduled: Annotated[
+        datetime.datetime, Field(title="Scheduled Run"), PlainSerializer(format_date)
+    ]
+    status: Annotated[str, Field(title="Status")]
+    lateness: Annotated[
+        float | None, Field(None, title="Lateness"), PlainSerializer(format_seconds)
+    ]
+    duration: Annotated[
+        float | None, Field(None, title="Duration"), PlainSerializer(format_seconds)
+    ]
+    detail: Annotated[str | None, Field(None, title="Detail")]
+
+    @model_validator(mode="before")
+    @classmethod
+    def parse(cls, run: dict) -> dict:
+        if isinstance(run.get("scheduled"), float):
+            run["scheduled"] = datetime.datetime.fromtimestamp(run["scheduled"], scheduler.timezone)
+        return run
+
+
+class RunSummary(BaseModel):
+    """All runs of a job by status, including the compacted runs."""
+
+    status: Annotated[str, Field(title="Status")]
+    count: Annotated[int, Field(title="Runs")]
+    avg_duration: Annotated[float, Field(title="Avg Duration"), PlainSerializer(format_seconds)]
+    max_duration: Annotated[
+        float | None, Field(None, title="Max Duration"), PlainSerializer(format_seconds)
+    ]
+    avg_lateness: Annotated[float, Field(title="Avg Lateness"), PlainSerializer(format_seconds)]
+    max_lateness: Annotated[
+        float | None, Field(None, title="Max Lateness"), PlainSerializer(format_seconds)
+    ]
+
+
+class LogRecord(BaseModel):
+    file: Annotated[str, Field(title="File")]
+    offset: Annotated[int, Field(title="Offset")]
+    pid: Annotated[str, Field(title="PID")]
+    time: Annotated[str, Field(title="Time")]
+    level: Annotated[str, Field(title="Level")]
+    name: Annotated[str, Field(title="Module")]
+    line: Annotated[str, Field(title="Line")]
+    message: Annotated[str, Field(title="Message")]
+    job_id: Annotated[str | None, Field(title="Job ID")] = None
+    run_id: Annotated[str | None, Field(title="Run ID")] = None
+
+
+class LogSearchResult(BaseModel):
+    total: int
+    records: list[LogRecord]
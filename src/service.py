@@ -0,0 +1,39 @@
+"""
+Start and stop the scheduler with its background services, in the lifespan of the WebUI
+(`main.py`) or in the scheduler daemon(`daemon.py`).
+"""
+
+import asyncio
+
+from .cluster import start_heartbeat, stop_heartbeat
+from .log_archive import wait_compressions
+from .log_search import start_indexer, stop_indexer
+from .loop_monitor import start_loop_monitor, stop_loop_monitor
+from .run_history import start_history_writer, stop_history_writer
+from .scheduler import prepare_jobstore, scheduler
+from .uv import close_uv_workers
+
+
+def start_scheduler() -> None:
+    """Start the scheduler, on the running loop."""
+
+    start_history_writer()
+    start_loop_monitor()
+    scheduler.start()
+    # The job stores are started(tables created) by the scheduler, the jobs are processed after
+    # this function returns
+    for alias, store in scheduler._jobstores.items():
+        prepare_jobstore(alias, store)
+    start_heartbeat(scheduler.wakeup)
+    start_indexer()
+
+
+async def stop_scheduler() -> None:
+    stop_indexer()
+    scheduler.shutdown()
+    stop_heartbeat()
+    await close_uv_workers()
+    stop_loop_monitor()
+    # After the scheduler, so the runs finished during the shutdown are written
+    stop_history_writer()
+    await asyncio.to_thread(wait_compressions)
@@ -30,6 +30,16 @@ def frame_page(*components: AnyComponent) -> Components:
                     on_click=GoToEvent(url="/log/jobs"),
                     active="startswith:/log",
                 ),
+                c.Link(
+                    components=[c.Text(text="Timeline")],
+                    on_click=GoToEvent(url="/timeline"),
+                    active="/timeline",
+                ),
+                c.Link(
+                    components=[c.Text(text="Monitor")],
+                    on_click=GoToEvent(url="/monitor"),
+                    active="/monitor",
+                ),
             ],
         ),
         c.Page(components=list(components)),
@@ -0,0 +1,116 @@
+"""
+Spreading of the jobs firing at the same time, e.g. hundreds of cron jobs with `minute=0`.
+
+A spread cron or interval trigger fires a fixed offset later than its schedule, the offset is
+taken from the crc32 of the job id within the spread(seconds). The runs of the jobs with the same
+schedule are then spread evenly over the window, and each job still runs at the same time every
+period. The spread is set by the Spread field of the trigger params, `TRIGGER_SPREAD` sets it for
+the jobs of a job store which don't set it, and the "modify" bulk action(`src/bulk.py`) spreads
+the triggers of many jobs at once.
+"""
+
+import zlib
+from datetime import datetime
+from typing import TYPE_CHECKING
+
+from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
+
+if TYPE_CHECKING:
+    from apscheduler.job import Job
+    from apscheduler.triggers.base import BaseTrigger
+
+
+def spread_offset(key: str, spread: int) -> int:
+    """Offset(seconds) of the job within the spread."""
+
+    return zlib.crc32(key.encode()) % spread if spread > 0 else 0
+
+
+def _shift(time: datetime, seconds: int) -> datetime:
+    # By the absolute time, a shifted wall clock time may not exist on DST changes
+    return datetime.fromtimestamp(time.timestamp() + seconds, time.tzinfo)
+
+
+class _Spread:
+    """Fire times of the base trigger shifted by the offset."""
+
+    base_class: type
+    spread = 0
+    offset = 0
+
+    def get_next_fire_time(
+        self, previous_fire_time: datetime | None, now: datetime
+    ) -> datetime | None:
+        if previous_fire_time is not None:
+            previous_fire_time = _shift(previous_fire_time, -self.offset)
+        fire_time = super().get_next_fire_time(  # type: ignore
+            previous_fire_time, _shift(now, -self.offset)
+        )
+        return None if fire_time is None else _shift(fire_time, self.offset)
+
+    def __getstate__(self) -> dict:
+        state = super().__getstate__()  # type: ignore
+        return state | {"spread": self.spread, "offset": self.offset}
+
+    def __setstate__(self, state: dict) -> None:
+        super().__setstate__(state)  # type: ignore
+        self.spread, self.offset = state["spread"], state["offset"]
+
+    def __str__(self) -> str:
+        return f"{super().__str__()}+{self.offset}s"
+
+    def __repr__(self) -> str:
+        return f"{super().__repr__()[:-2]}, spread={self.spread}, offset={self.offset})>"
+
+
+class SpreadCronTrigger(_Spread, CronTrigger):
+    base_class = CronTrigger
+
+
+class SpreadIntervalTrigger(_Spread, IntervalTrigger):
+    base_class = IntervalTrigger
+
+
+SPREAD_TRIGGERS: dict[type, type] = {
+    CronTrigger: SpreadCronTrigger,
+    IntervalTrigger: SpreadIntervalTrigger,
+}
+
+
+def trigger_name(trigger: "BaseTrigger") -> str:
+    """Name of the trigger in the UI, a spread trigger is named after its base trigger."""
+
+    trigger_class = getattr(trigger, "base_class", type(trigger))
+    return trigger_class.__name__.removesuffix("Trigger")
+
+
+def spread_trigger(trigger: "BaseTrigger", spread: int, key: str) -> "BaseTrigger":
+    """
+    Copy of the cron or interval trigger spread by the offset of the key, or without any spread
+    if the spread is 0. Other triggers are returned as is.
+    """
+
+    for base_class, spread_class in SPREAD_TRIGGERS.items():
+        if isinstance(trigger, base_class):
+            new_class = spread_class if spread > 0 else base_class
+            state = trigger.__getstate__() | {
+                "spread": spread,
+                "offset": spread_offset(key, spread),
+            }
+            new_trigger = new_class.__new__(new_class)
+            new_trigger.__setstate__(state)
+            return new_trigger
+    return trigger
+
+
+def respread_job(job: "Job", spread: int, now: datetime) -> dict:
+    """Changes of the job spreading its trigger, a paused job stays paused."""
+
+    trigger = spread_trigger(job.trigger, spread, job.id)
+    if trigger is job.trigger:
+        return {}
+    changes: dict = {"trigger": trigger}
+    if job.next_run_time is not None:
+        changes["next_run_time"] = trigger.get_next_fire_time(None, now) or job.next_run_time
+    return changes
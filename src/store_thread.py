@@ -0,0 +1,243 @@
+"""
+Job stores doing their I/O on a dedicated thread, so a slow database doesn't stall the event loop.
+
+APScheduler 3 calls the job stores synchronously, and the `AsyncIOScheduler` calls them on the
+loop: every wakeup loads the due jobs, writes each run and asks for the next run time, and the
+event listeners look up the jobs. The methods of a store with an I/O thread(the "I/O Thread" of
+a new store, or `STORE_IO_THREADS` for the job stores of `SCHEDULER_CONFIG`) are rebound to run
+on the thread of the store, one call at a time in their order, reusing the pooled connection of the
+driver(SQLAlchemy engine, Redis connection pool, MongoDB client):
+
+- A wakeup of the scheduler(`Scheduler` in `src/scheduler.py`) awaits the due jobs and the next
+  run time loaded on the thread, then processes them on the loop. The updates and removals of the
+  runs are queued on the thread without waiting for them(write-behind), and the jobs looked up by
+  the event listeners are the due jobs in memory. The next wakeup loads the jobs after the queued
+  writes.
+- The jobs are loaded without the lock of the job stores, a job written meanwhile(e.g. paused, or
+  by a bulk action, see `written`) is dropped from the due jobs instead of being processed and
+  written back stale, and the next wakeup comes at once to load it again.
+- Other calls wait for their result, errors are raised as before. The WebUI operations on the
+  jobs run in the worker threads, a call from the loop still blocks it until its turn, the time is
+  shown as "Loop Blocked" on the Store page.
+"""
+
+import asyncio
+import threading
+import time
+from collections.abc import Callable, Iterable
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import partial
+from typing import TYPE_CHECKING, TypeVar
+
+from .config import STORE_IO_THREADS
+from .log import server_log
+from .metrics import STORE_METHODS, loop_blocks, on_loop
+
+if TYPE_CHECKING:
+    from apscheduler.job import Job
+    from apscheduler.jobstores.base import BaseJobStore
+
+Store = TypeVar("Store", bound="BaseJobStore")
+
+# Methods of the store run on its thread
+THREAD_METHODS = (*STORE_METHODS, "remove_all_jobs")
+# Methods writing the job(the id of the removed one) given as their argument
+WRITE_METHODS = ("add_job", "update_job", "remove_job")
+
+
+class StoreThread:
+    """I/O thread of a job store, with the jobs loaded for the wakeup being processed."""
+
+    def __init__(self, alias: str, store: "BaseJobStore") -> None:
+        self.alias = alias
+        # The methods of the store before they are rebound, timed and coordinated ones included
+        self.calls: dict[str, Callable] = {
+            method: getattr(store, method) for method in THREAD_METHODS
+        }
+        self.shutdown_store = store.shutdown
+        self.ident: int | None = None
+        self.pool = ThreadPoolExecutor(
+            1, thread_name_prefix=f"store-{alias}", initializer=self._bind
+        )
+        # Due jobs by id(None once removed) and next run time of the wakeup, or the error loading
+        # them, used by the thread processing the wakeup
+        self.due_jobs: dict[str, "Job | None"] = {}
+        self.now: datetime | None = None
+        self.next_run_time: datetime | None = None
+        self.error: Exception | None = None
+        self.processing: int | None = None
+        # Ids of the jobs written since the due jobs are loaded, all of them if None, until
+        # they're processed. Recorded with the submission of the write, so writes queued after
+        # the load are recorded and the ones before it are seen by the load.
+        self.written_ids: set[str] | None = set()
+        self.tracking = False
+        self.stale = False
+        self._lock = threading.Lock()
+
+    def _bind(self) -> None:
+        self.ident = threading.get_ident()
+
+    def run(self, method: str, *args):
+        """Run the method on the thread, wait for the result."""
+
+        call = self.calls[method]
+        if threading.get_ident() == self.ident:
+            return call(*args)
+        with self._lock:
+            if method in WRITE_METHODS:
+                self._record([getattr(args[0], "id", args[0])])
+            elif method == "remove_all_jobs":
+                self._record(None)
+            future = self.pool.submit(call, *args)
+        if not on_loop():
+            return future.result()
+        start = time.perf_counter()
+        try:
+            return future.result()
+        finally:
+            loop_blocks.observe((self.alias,), time.perf_counter() - start)
+
+    def _load(self, now: datetime) -> tuple[list["Job"], datetime | None]:
+        return self.calls["get_due_jobs"](now), self.calls["get_next_run_time"]()
+
+    def _record(self, job_ids: Iterable[str] | None) -> None:
+        if not self.tracking:
+            return
+        if job_ids is None:
+            self.written_ids = None
+        elif self.written_ids is not None:
+            self.written_ids.update(job_ids)
+
+    def written(self, job_ids: Iterable[str]) -> None:
+        """Record the jobs written to the store without its thread, after the write."""
+
+        with self._lock:
+            self._record(job_ids)
+
+    async def prefetch(self, now: datetime) -> None:
+        """Load the due jobs and the next run time for the wakeup processed after it."""
+
+        with self._lock:
+            self.tracking, self.written_ids, self.stale = True, set(), False
+            future = self.pool.submit(self._load, now)
+        self.now = now
+        try:
+            due_jobs, self.next_run_time = await asyncio.wrap_future(future)
+            self.due_jobs, self.error = {job.id: job for job in due_jobs}, None
+        except Exception as e:
+            self.due_jobs, self.error = {}, e
+        self.processing = threading.get_ident()
+
+    def processed(self) -> None:
+        with self._lock:
+            self.tracking = False
+        self.processing = None
+        self.due_jobs = {}
+
+    def _prefetched(self, job_id: str | None = None) -> bool:
+        return self.processing == threading.get_ident() and (
+            job_id is None or job_id in self.due_jobs
+        )
+
+    def _write_behind(self, method: str, arg) -> None:
+        try:
+            self.calls[method](arg)
+        except Exception:
+            server_log.exception(f"Failed to write the run of a job to {self.alias}")
+
+    def get_due_jobs(self, now: datetime) -> list["Job"]:
+        if not self._prefetched():
+            return self.run("get_due_jobs", now)
+        if self.error is not None:
+            raise self.error
+        # Called under the lock of the job stores, no job is written until they're processed
+        with self._lock:
+            written_ids = self.due_jobs.keys() if self.written_ids is None else self.written_ids
+            if stale := written_ids & self.due_jobs.keys():
+                server_log.debug(f"Jobs written while loading them from {self.alias}: {stale}")
+                for job_id in stale:
+                    del self.due_jobs[job_id]
+                self.stale = True
+        return [job for job in self.due_jobs.values() if job is not None]
+
+    def get_next_run_time(self) -> datetime | None:
+        if not self._prefetched():
+            return self.run("get_next_run_time")
+        if self.stale:
+            # Load the jobs written meanwhile at once
+            return self.now
+        # Earlier than the new next run times of the due jobs, if there were any, so the next
+        # wakeup comes at once and loads it after their writes
+        return self.next_run_time
+
+    def lookup_job(self, job_id: str) -> "Job | None":
+        if self._prefetched(job_id):
+            return self.due_jobs[job_id]
+        return self.run("lookup_job", job_id)
+
+    def update_job(self, job: "Job") -> None:
+        if self._prefetched(job.id):
+            self.pool.submit(self._write_behind, "update_job", job)
+        else:
+            self.run("update_job", job)
+
+    def remove_job(self, job_id: str) -> None:
+        if self._prefetched(job_id):
+            self.due_jobs[job_id] = None
+            self.pool.submit(self._write_behind, "remove_job", job_id)
+        else:
+            self.run("remove_job", job_id)
+
+    def flush(self) -> None:
+        """Wait for the queued writes."""
+
+        if threading.get_ident() != self.ident:
+            self.pool.submit(lambda: None).result()
+
+    def shutdown(self) -> None:
+        # After the queued writes
+        self.pool.submit(self.shutdown_store).result()
+        self.pool.shutdown()
+
+
+def use_io_thread(store: Store) -> Store:
+    """Mark the store to run its calls on an I/O thread once it's started by the scheduler."""
+
+    store._io_thread = True  # type: ignore
+    return store
+
+
+def thread_jobstore(alias: str, store: "BaseJobStore") -> None:
+    """Rebind the methods of the store to run on its thread, if it uses one."""
+
+    if hasattr(store, "_store_thread") or not (
+        getattr(store, "_io_thread", False) or alias in STORE_IO_THREADS
+    ):
+        return
+    thread = StoreThread(alias, store)
+    for method in (*THREAD_METHODS, "shutdown"):
+        if hasattr(StoreThread, method):
+            setattr(store, method, getattr(thread, method))
+        else:
+            setattr(store, method, partial(thread.run, method))
+    store._store_thread = thread  # type: ignore
+    server_log.info(f"Job store {alias} runs its calls on an I/O thread")
+
+
+def io_threads(stores: Iterable["BaseJobStore"]) -> list[StoreThread]:
+    return [thread for store in stores if (thread := getattr(store, "_store_thread", None))]
+
+
+def flush(store: "BaseJobStore") -> None:
+    """Wait for the writes queued on the thread of the store, before loading its jobs without it."""
+
+    if (thread := getattr(store, "_store_thread", None)) is not None:
+        thread.flush()
+
+
+def written(store: "BaseJobStore", job_ids: Iterable[str]) -> None:
+    """Record the jobs written to the store without its methods(e.g. by a bulk action)."""
+
+    if (thread := getattr(store, "_store_thread", None)) is not None:
+        thread.written(job_ids)
@@ -0,0 +1,217 @@
+"""
+Timeline of the fire times of all jobs over the next hours, to spot the minutes where many jobs
+fire at once(e.g. hundreds of `0 * * * *` cron jobs).
+
+The fire times are computed like the scheduler does, by iterating `get_next_fire_time` of the
+trigger from the next run time of the job, and cached. Jobs with the same trigger and next run
+time share their fire times, and interval triggers without jitter are stepped by their interval
+without calling the trigger. The cached fire times are extended as time passes and dropped by the
+add/modify/remove events of their jobs, a run only consumes the first of them. Only the jobs not
+cached are loaded from the job stores, see `load_uncached_jobs`.
+"""
+
+import heapq
+import math
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from collections.abc import Hashable
+from datetime import datetime
+from typing import TYPE_CHECKING
+
+from apscheduler.events import (
+    EVENT_ALL_JOBS_REMOVED,
+    EVENT_JOB_ADDED,
+    EVENT_JOB_MODIFIED,
+    EVENT_JOB_REMOVED,
+    EVENT_JOBSTORE_ADDED,
+    EVENT_JOBSTORE_REMOVED,
+)
+from apscheduler.triggers.interval import IntervalTrigger
+
+from .config import TIMELINE_MAX_FIRES
+from .job_query import JobCache, load_uncached_jobs
+from .scheduler import scheduler
+from .schema import Timeline, TimelinePeak
+
+if TYPE_CHECKING:
+    from apscheduler.job import Job
+    from apscheduler.triggers.base import BaseTrigger
+
+# Busiest minutes listed, with the first jobs and the most common triggers firing in them
+PEAK_MINUTES = 20
+PEAK_JOBS = 5
+PEAK_TRIGGERS = 3
+
+
+class FireTimes:
+    """Minutes(since the epoch) of the fire times of a trigger from a first fire time."""
+
+    def __init__(self, trigger: "BaseTrigger", first: datetime) -> None:
+        self.trigger = trigger
+        self.label = str(trigger)
+        self.minutes = array("l")
+        # Next fire time not computed yet, None once the trigger is done
+        self.pending: datetime | None = first
+        self.step: float | None = None
+        if isinstance(trigger, IntervalTrigger) and not trigger.jitter:
+            self.step = trigger.interval_length
+
+    def extend(self, start: int, end: int) -> None:
+        """Drop the minutes before the start minute, compute the ones before the end minute."""
+
+        del self.minutes[: bisect_left(self.minutes, start)]
+        if self.step is not None:
+            self._step(start, end)
+            return
+        while (
+            self.pending is not None
+            and (minute := int(self.pending.timestamp() // 60)) < end
+            and len(self.minutes) < TIMELINE_MAX_FIRES
+        ):
+            if minute >= start:
+                self.minutes.append(minute)
+            self.pending = self.trigger.get_next_fire_time(self.pending, self.pending)
+
+    def _step(self, start: int, end: int) -> None:
+        if self.pending is None:
+            return
+        step = self.step or 0.0
+        end_date = self.trigger.end_date  # type: ignore
+        last = end_date.timestamp() if end_date else math.inf
+        timestamp = self.pending.timestamp()
+        if timestamp < start * 60:
+            timestamp += math.ceil((start * 60 - timestamp) / step) * step
+        while timestamp < end * 60 and len(self.minutes) < TIMELINE_MAX_FIRES:
+            if timestamp > last:
+                self.pending = None
+                return
+            self.minutes.append(int(timestamp // 60))
+            timestamp += step
+        self.pending = datetime.fromtimestamp(timestamp, self.pending.tzinfo)
+
+    def capped(self, end: int) -> bool:
+        """The trigger fires more than `TIMELINE_MAX_FIRES` times before the end minute."""
+
+        return self.pending is not None and self.pending.timestamp() < end * 60
+
+
+# Fire times shared by the jobs with the same schedule key
+_fire_times: dict[Hashable, FireTimes] = {}
+# Schedule key of each job by store alias and job id, None for the paused jobs, dropped by the
+# add/modify/remove events of its job
+_schedule_keys: JobCache[Hashable | None] = JobCache(
+    EVENT_JOB_ADDED
+    | EVENT_JOB_MODIFIED
+    | EVENT_JOB_REMOVED
+    | EVENT_ALL_JOBS_REMOVED
+    | EVENT_JOBSTORE_ADDED
+    | EVENT_JOBSTORE_REMOVED
+)
+_UNCACHED = object()  # default of `_schedule_keys.get`, None is the key of the paused jobs
+# Timelines are built one at a time in the WebUI workers, the last one is reused within a minute
+_lock = threading.Lock()
+_last: tuple[tuple[int, int, int], Timeline] | None = None
+
+
+def _schedule_key(job: "Job") -> Hashable | None:
+    if job.next_run_time is None:
+        return None
+    trigger = job.trigger
+    if getattr(trigger, "jitter", None) or type(trigger).__repr__ is object.__repr__:
+        # Fire times of the job only: random, or the trigger can't be compared by its repr
+        return (job._jobstore_alias, job.id)
+    return (repr(trigger), job.next_run_time.timestamp())
+
+
+def _schedules() -> dict[Hashable, list[str]]:
+    """Ids of the scheduled jobs by schedule key, the fire times of new keys are added."""
+
+    schedules = defaultdict(list)
+    with _schedule_keys.loading() as generation:
+        items, jobs = load_uncached_jobs(_schedule_keys)
+        for item in items:
+            if (key := _schedule_keys.get(item, _UNCACHED)) is _UNCACHED:
+                if (job := jobs.get(item)) is None:
+                    continue  # removed after the ids were selected
+                key = _schedule_key(job)
+                if key is not None and key not in _fire_times:
+                    _fire_times[key] = FireTimes(job.trigger, job.next_run_time)  # type: ignore
+                _schedule_keys.put(item, key, generation)
+            if key is not None:
+                schedules[key].append(item[1])
+    # Without the removed jobs and job stores
+    for item in _schedule_keys.keys() - set(items):
+        _schedule_keys.pop(item, None)
+    for key in _fire_times.keys() - schedules.keys():
+        del _fire_times[key]
+    return schedules
+
+
+def _peak(
+    minute: int, schedules: list[tuple[FireTimes, list[str]]], fires: int
+) -> TimelinePeak:
+    triggers: Counter[str] = Counter()
+    job_ids: list[str] = []
+    for fire_times, ids in schedules:
+        triggers[fire_times.label] += len(ids)
+        if len(job_ids) < PEAK_JOBS:
+            job_ids.extend(ids[: PEAK_JOBS - len(job_ids)])
+    others = sum(triggers.values()) - len(job_ids)
+    more = f" and {others} more" if others else ""
+    return TimelinePeak(
+        minute=datetime.fromtimestamp(minute * 60, scheduler.timezone),
+        fires=fires,
+        triggers=", ".join(
+            f"{trigger} x{count}" for trigger, count in triggers.most_common(PEAK_TRIGGERS)
+        ),
+        jobs=", ".join(job_ids) + more,
+    )
+
+
+def build_timeline(hours: int) -> Timeline:
+    """Fires of the jobs in each minute of the next hours and the busiest minutes."""
+
+    global _last
+
+    start = int(time.time() // 60)
+    end = start + hours * 60
+    with _lock:
+        state = (_schedule_keys.generation, hours, start)
+        if _last is not None and _last[0] == state:
+            return _last[1]
+        schedules = _schedules()
+        fires: Counter[int] = Counter()
+        capped = []
+        for key, job_ids in schedules.items():
+            fire_times = _fire_times[key]
+            fire_times.extend(start, end)
+            minutes = fire_times.minutes[: bisect_left(fire_times.minutes, end)]
+            if len(job_ids) == 1:
+                fires.update(minutes)
+            else:
+                for minute, count in Counter(minutes).items():
+                    fires[minute] += count * len(job_ids)
+            if fire_times.capped(end):
+                capped.extend(job_ids)
+
+        # The earliest of the minutes with as many fires first
+        busiest = heapq.nsmallest(PEAK_MINUTES, fires, key=lambda minute: (-fires[minute], minute))
+        firing, peak_minutes = defaultdict(list), set(busiest)
+        for key, job_ids in schedules.items():
+            fire_times = _fire_times[key]
+            for minute in peak_minutes.intersection(fire_times.minutes):
+                firing[minute].append((fire_times, job_ids))
+
+        timeline = Timeline(
+            start=datetime.fromtimestamp(start * 60, scheduler.timezone),
+            hours=hours,
+            jobs=sum(map(len, schedules.values())),
+            per_minute=[fires[minute] for minute in range(start, end)],
+            peaks=[_peak(minute, firing[minute], fires[minute]) for minute in busiest],
+            capped=sorted(capped),
+        )
+        _last = (state, timeline)
+    return timeline
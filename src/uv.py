@@ -1,21 +1,407 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import signal
+import tempfile
+import time
 from asyncio.subprocess import PIPE, create_subprocess_exec
+from pathlib import Path
 from subprocess import call
 
-from .config import ROOT
+from .config import (
+    ROOT,
+    UV_CPU_TIME_LIMIT,
+    UV_MEMORY_LIMIT,
+    UV_OUTPUT_LIMIT,
+    UV_TIMEOUT,
+    UV_WORKER,
+    UV_WORKER_MAX_RUNS,
+)
+from .limiter import uv_limiter
 from .log import server_log
 
+# Inline script metadata, see https://peps.python.org/pep-0723/
+METADATA_PATTERN = re.compile(r"(?m)^# /// script$\s(?:^#(?:| .*)$\s)+^# ///$")
+WORKER_SCRIPT = Path(__file__).with_name("uv_worker.py")
+# Worker scripts with the inline metadata of the uv scripts
+WORKER_STUB_PATH = Path(tempfile.gettempdir()) / "apscheduler-webui-uv"
+# Limit of a protocol line, the worker splits the output into smaller events
+LINE_LIMIT = 1024 * 1024
+# Size of the chunks read from the output of a `uv run` process
+READ_SIZE = 64 * 1024
+# Seconds to read the rest of the output after `uv run` exits(1 to 2 times)
+EXIT_GRACE = 1
+# Written by the worker to stderr at the end of each run, same as in `src/uv_worker.py`
+RUN_END = b"\0uv-worker-run-end\0\n"
 
-async def uv_run(uv_scripts: str, *args: str, **kwargs: str):
-    args = (*args, *(f"--{k}={v}" for k, v in kwargs.items()))
+
+class OutputLog:
+    """
+    Log the output of a uv script line by line as the job's records, stdout as INFO and stderr
+    as WARNING. Only the first `UV_OUTPUT_LIMIT` bytes of each run are logged, the rest is counted.
+    """
+
+    def __init__(self, uv_scripts: str) -> None:
+        # Named after the script, so the records go to the job log instead of the scheduler log
+        self.log = server_log.patch(lambda record: record.update(name=uv_scripts, line=0))
+        self.sizes = {"out": 0, "err": 0}
+        self.truncated = False
+        self._logged = 0
+        self._partial = {"out": b"", "err": b""}
+
+    def write(self, stream: str, data: bytes) -> None:
+        self.sizes[stream] += len(data)
+        if self.truncated:
+            return
+        *lines, partial = (self._partial[stream] + data).split(b"\n")
+        for line in lines:
+            self._log_line(stream, line)
+        # An unterminated line is logged once it reaches the limit, the buffer stays bounded
+        if len(partial) > UV_OUTPUT_LIMIT - self._logged:
+            self._log_line(stream, partial)
+            partial = b""
+        self._partial[stream] = partial
+
+    def _log_line(self, stream: str, line: bytes) -> None:
+        if self.truncated:
+            return
+        if len(line) > (rest := UV_OUTPUT_LIMIT - self._logged):
+            self.truncated = True
+            line = line[:rest]
+        self._logged += len(line)
+        if message := line.decode(errors="replace").rstrip():
+            self.log.log("INFO" if stream == "out" else "WARNING", "{}", message)
+        if self.truncated:
+            self.log.warning(f"Output exceeds {UV_OUTPUT_LIMIT} bytes, the rest is not logged")
+
+    def flush(self) -> None:
+        for stream, partial in self._partial.items():
+            if partial:
+                self._log_line(stream, partial)
+        self._partial = {"out": b"", "err": b""}
+
+
+def _limited(command: tuple, cpu_time: int | None) -> tuple:
+    """
+    The command run by a shell setting the resource limits first, inherited by `uv run` and the
+    script. The limits are set before `exec`, not by Python code in the forked process.
+    """
+
+    limits = []
+    if cpu_time:
+        # SIGXCPU at the soft limit, SIGKILL at the hard limit if SIGXCPU is handled
+        limits += [f"ulimit -S -t {cpu_time}", f"ulimit -H -t {cpu_time + 1}"]
+    if UV_MEMORY_LIMIT:
+        limits.append(f"ulimit -v {UV_MEMORY_LIMIT // 1024}")  # in KiB
+    if os.name == "nt" or not limits:
+        return command
+    return ("/bin/sh", "-c", f'{" && ".join(limits)} && exec "$@"', "sh", *command)
+
+
+def _kill(process: asyncio.subprocess.Process) -> None:
+    """Kill the process group of `uv run`: uv, the interpreter and the processes of the script."""
+
+    try:
+        if hasattr(os, "killpg"):
+            os.killpg(process.pid, signal.SIGKILL)
+        else:
+            process.kill()
+    except ProcessLookupError:
+        pass
+
+
+class UvWorker:
+    """A `uv run` process of `src/uv_worker.py` running the scripts of one metadata block."""
+
+    def __init__(self, process: asyncio.subprocess.Process, output: OutputLog | None) -> None:
+        self.process = process
+        self.runs = 0
+        self.mtimes: dict[Path, int] = {}  # modification time of the scripts when first run
+        self.broken = False
+        # The output of the current run, its stderr includes the output written to the file
+        # descriptors directly and the traceback of a crashed interpreter
+        self.output = output
+        self._run_end = asyncio.Event()
+        self.stderr_reader = asyncio.ensure_future(self._read_stderr())
+
+    @classmethod
+    async def start(cls, worker_script: Path, output: OutputLog | None = None) -> "UvWorker":
+        """Start a worker, the output of `uv run` while starting is written to `output`."""
+
+        # The CPU time limit is set by the worker for each run
+        process = await create_subprocess_exec(
+            *_limited(("uv", "run", worker_script), None),
+            stdin=PIPE,
+            stdout=PIPE,
+            stderr=PIPE,
+            cwd=ROOT,
+            limit=LINE_LIMIT,
+            start_new_session=True,
+        )
+        worker = cls(process, output)
+        try:
+            # Ready after uv has synced the environment and the interpreter has started
+            if await worker._event() is None:
+                await worker._wait_run_end()
+                raise RuntimeError(f"UV worker {worker_script} exited with {await process.wait()}")
+            await worker._wait_run_end()
+        except BaseException:
+            worker.broken = True
+            worker.close()
+            raise
+        return worker
+
+    @property
+    def usable(self) -> bool:
+        return not self.broken and self.process.returncode is None
+
+    def is_outdated(self, script: Path, mtime: int) -> bool:
+        return self.mtimes.get(script, mtime) != mtime
+
+    async def _event(self) -> dict | None:
+        line = await self.process.stdout.readline()  # type: ignore
+        return json.loads(line) if line else None
+
+    def _write_stderr(self, data: bytes) -> None:
+        if self.output:
+            self.output.write("err", data)
+        elif message := data.decode(errors="replace").rstrip():
+            # Written outside a run, by the threads or processes left by a script
+            server_log.warning(f"Output of the UV worker {self.process.pid}: {message}")
+
+    async def _read_stderr(self) -> None:
+        """Write stderr to the output of the run until `RUN_END`, then to the server log."""
+
+        pending = b""
+        while data := await self.process.stderr.read(READ_SIZE):  # type: ignore
+            *runs, pending = (pending + data).split(RUN_END)
+            for run in runs:
+                self._write_stderr(run)
+                self.output = None
+                self._run_end.set()
+            # The end of the data may be the start of `RUN_END`
+            keep = len(RUN_END) - 1
+            if len(pending) > keep:
+                self._write_stderr(pending[:-keep])
+                pending = pending[-keep:]
+        self._write_stderr(pending)
+        self.output = None
+        self._run_end.set()
+
+    async def _wait_run_end(self) -> None:
+        """Wait until the stderr of the run is written to its output."""
+
+        try:
+            await asyncio.wait_for(self._run_end.wait(), EXIT_GRACE)
+        except asyncio.TimeoutError:
+            # The script has closed or redirected the file descriptor 2, the end is unknown
+            self.broken = True
+            self.output = None
+
+    async def run(self, script: Path, args: tuple[str, ...], mtime: int, output: OutputLog):
+        """Run the script, its output is written to `output`, return the exit code."""
+
+        self.runs += 1
+        self.mtimes.setdefault(script, mtime)
+        request = {"script": str(script), "args": list(args), "cpu_time": UV_CPU_TIME_LIMIT}
+        self.output = output
+        self._run_end.clear()
+        try:
+            self.process.stdin.write(json.dumps(request).encode() + b"\n")  # type: ignore
+            await self.process.stdin.drain()  # type: ignore
+            while event := await self._event():
+                if event["event"] == "exit":
+                    await self._wait_run_end()
+                    return event["code"]
+                output.write(event["event"], event["data"].encode())
+            # The script killed the interpreter, its traceback is read until the end of stderr
+            self.broken = True
+            await self._wait_run_end()
+            return await self.process.wait()
+        except BaseException:
+            # Cancelled or failed in the middle of a run, the state of the worker is unknown
+            self.broken = True
+            raise
+        finally:
+            self.output = None
+
+    def close(self) -> None:
+        if self.broken:
+            # Also the processes left by the script if the interpreter has died
+            _kill(self.process)
+        elif self.process.returncode is None:
+            self.process.stdin.close()  # type: ignore  # the worker exits at the end of input
+
+
+# Idle workers by the metadata block of the scripts they run
+_idle_workers: dict[str, list[UvWorker]] = {}
+# Tasks starting the replacement of recycled workers, referenced until they're done
+_prewarm_tasks: set[asyncio.Task] = set()
+
+
+def _worker_script(script: Path) -> tuple[str, Path]:
+    """The key of the script's dependency set and the worker script running it."""
+
+    match = METADATA_PATTERN.search(script.read_text(encoding="utf-8"))
+    if not match:
+        # Without inline metadata `uv run` uses the project environment, so does the worker
+        return "", WORKER_SCRIPT
+    metadata = "\n".join(line.strip() for line in match.group().splitlines())
+    # Same metadata, uv runs the worker in the cached environment of the script
+    run_worker = f"runpy.run_path({str(WORKER_SCRIPT)!r}, run_name='__main__')"
+    content = f"{metadata}\nimport runpy\n\n{run_worker}\n"
+    key = hashlib.sha1(content.encode()).hexdigest()[:16]
+    stub = WORKER_STUB_PATH / f"worker-{key}.py"
+    if not stub.exists():
+        WORKER_STUB_PATH.mkdir(parents=True, exist_ok=True)
+        stub.write_text(content, encoding="utf-8")
+    return key, stub
+
+
+async def _run_in_worker(uv_scripts: str, args: tuple[str, ...], output: OutputLog) -> int:
+    script = ROOT / uv_scripts
+    mtime = script.stat().st_mtime_ns
+    key, worker_script = _worker_script(script)
+    idle = _idle_workers.setdefault(key, [])
+
+    worker = None
+    while idle and worker is None:
+        worker = idle.pop()
+        if not worker.usable or worker.is_outdated(script, mtime):
+            server_log.debug(f"Recycle the UV worker of {uv_scripts}")
+            worker.close()
+            worker = None
+    if worker is None:
+        worker = await UvWorker.start(worker_script, output)
+
+    try:
+        return await worker.run(script, args, mtime, output)
+    finally:
+        if worker.usable and worker.runs < UV_WORKER_MAX_RUNS:
+            idle.append(worker)
+        else:
+            recycled = worker.usable
+            worker.close()
+            if recycled:
+                # Recycled after `UV_WORKER_MAX_RUNS`, warm up the replacement for the next run
+                task = asyncio.ensure_future(_prewarm(idle, worker_script))
+                _prewarm_tasks.add(task)
+                task.add_done_callback(_prewarm_tasks.discard)
+
+
+async def _prewarm(idle: list[UvWorker], worker_script: Path) -> None:
+    try:
+        idle.append(await UvWorker.start(worker_script))
+    except Exception:
+        server_log.exception(f"Failed to start the UV worker {worker_script}")
+
+
+async def close_uv_workers() -> None:
+    # The workers being started are idle once started
+    await asyncio.gather(*_prewarm_tasks)
+    workers = [worker for workers in _idle_workers.values() for worker in workers]
+    _idle_workers.clear()
+    for worker in workers:
+        worker.close()
+    await asyncio.gather(*(worker.process.wait() for worker in workers))
+    if readers := [worker.stderr_reader for worker in workers]:
+        # The rest of stderr, unless held by the processes left running by a script
+        await asyncio.wait(readers, timeout=EXIT_GRACE)
+        for reader in readers:
+            reader.cancel()
+
+
+async def _run_in_process(uv_scripts: str, args: tuple[str, ...], output: OutputLog) -> int:
     process = await create_subprocess_exec(
-        "uv", "run", uv_scripts, *map(str, args), stdout=PIPE, stderr=PIPE, cwd=ROOT
+        *_limited(("uv", "run", uv_scripts, *args), UV_CPU_TIME_LIMIT),
+        stdout=PIPE,
+        stderr=PIPE,
+        cwd=ROOT,
+        start_new_session=True,
     )
-    stdout, stderr = await process.communicate()
-    if stdout:
-        server_log.info(f"UV script {uv_scripts} output: {stdout.decode()}")
-    if stderr:
-        server_log.warning(f"Error running uv script {uv_scripts}: {stderr.decode()}")
-    return stdout
+
+    async def read(stream: asyncio.StreamReader | None, name: str) -> None:
+        while data := await stream.read(READ_SIZE):  # type: ignore
+            output.write(name, data)
+
+    readers = asyncio.gather(read(process.stdout, "out"), read(process.stderr, "err"))
+    try:
+        # Processes left running by the script may hold the output pipes after `uv run` exits,
+        # `process.wait()` waits for the pipes too, so the exit is checked by the return code
+        exited = False
+        while not readers.done():
+            await asyncio.wait([readers], timeout=EXIT_GRACE)
+            if exited and not readers.done():
+                output.log.warning("Kill the processes left running by the script")
+                _kill(process)
+                readers.cancel()
+                return process.returncode  # type: ignore
+            exited = process.returncode is not None
+        return await process.wait()
+    except BaseException:
+        # Timed out or cancelled
+        _kill(process)
+        readers.cancel()
+        raise
+
+
+async def uv_run(
+    uv_scripts: str,
+    *args: str,
+    _timeout: float | None = None,
+    _tag: str | None = None,
+    _priority: int = 0,
+    **kwargs: str,
+) -> dict[str, int | float | bool | str | None]:
+    """
+    Run a uv script, its output is logged line by line to the job log as it is produced.
+    Return the exit code, run time and output size, also logged as the fields of the last record.
+
+    The kwargs starting with "_" are not passed to the script. The run waits for a slot of the
+    limiter with the `_tag` and `_priority`, see `src/limiter.py`. The script is killed with its
+    child processes after `_timeout` seconds(`UV_TIMEOUT` if not set) or when the running job is
+    cancelled.
+    """
+
+    args = tuple(map(str, (*args, *(f"--{k}={v}" for k, v in kwargs.items()))))
+    timeout = UV_TIMEOUT if _timeout is None else float(_timeout)
+    async with uv_limiter.slot(_tag, int(_priority)) as wait:
+        output = OutputLog(uv_scripts)
+        start = time.perf_counter()
+        status, exit_code = "exited", None
+        try:
+            run = _run_in_worker if UV_WORKER else _run_in_process
+            exit_code = await asyncio.wait_for(run(uv_scripts, args, output), timeout)
+        except asyncio.TimeoutError:
+            status = "timeout"
+            raise TimeoutError(f"UV script {uv_scripts} timed out after {timeout}s") from None
+        except asyncio.CancelledError:
+            status = "cancelled"
+            raise
+        finally:
+            output.flush()
+            fields = {
+                "status": status,
+                "exit_code": exit_code,
+                "wait": round(wait, 3),
+                "duration": round(time.perf_counter() - start, 3),
+                "stdout_bytes": output.sizes["out"],
+                "stderr_bytes": output.sizes["err"],
+                "truncated": output.truncated,
+            }
+            result = {
+                "exited": f"Exited with code {exit_code}",
+                "timeout": "Timed out",
+                "cancelled": "Cancelled",
+            }[status]
+            output.log.bind(fields=fields).log(
+                "INFO" if exit_code == 0 else "WARNING",
+                f"{result} in {fields['duration']}s(waited {fields['wait']}s), "
+                f"stdout {output.sizes['out']} bytes, stderr {output.sizes['err']} bytes",
+            )
+    return fields
 
 
 try:
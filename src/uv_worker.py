@@ -0,0 +1,129 @@
+"""
+Long-lived interpreter running uv scripts for `uv_run` in worker mode, see `src/uv.py`.
+
+It is started by `uv run` in the environment of the scripts' inline dependencies and speaks JSON
+lines: each request `{"script": path, "args": [...], "cpu_time": seconds}` read from stdin runs
+the script as `__main__`, its output is sent as `{"event": "out" | "err", "data": text}` events
+and the run ends with `{"event": "exit", "code": int}`. `RUN_END` is written to stderr before
+the "ready" and "exit" events, so the output written to the file descriptors directly is logged
+with the run it belongs to. Modules imported by the scripts stay loaded between runs, so only
+the first run pays the startup and import time.
+
+Only the standard library is used, this file is not imported by the WebUI.
+"""
+
+import io
+import json
+import os
+import runpy
+import sys
+import threading
+import traceback
+
+# Output is split into events of at most these characters
+CHUNK = 16 * 1024
+# Written to stderr at the end of each run, same as in `src/uv.py`
+RUN_END = b"\0uv-worker-run-end\0\n"
+
+_protocol = None
+_lock = threading.Lock()
+
+
+def send(event: dict) -> None:
+    with _lock:
+        _protocol.write(json.dumps(event, ensure_ascii=False) + "\n")  # type: ignore
+        _protocol.flush()  # type: ignore
+
+
+class EventStream(io.TextIOBase):
+    """Replacement of `sys.stdout`/`sys.stderr` sending the written text as events."""
+
+    def __init__(self, event: str) -> None:
+        self.event = event
+        self._buffer: list[str] = []
+        self._size = 0
+
+    @property
+    def encoding(self) -> str:  # type: ignore
+        return "utf-8"
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, text: str) -> int:
+        self._buffer.append(text)
+        self._size += len(text)
+        # Line buffered, one event per line instead of per write
+        if "\n" in text or self._size >= CHUNK:
+            self.flush()
+        return len(text)
+
+    def flush(self) -> None:
+        text = "".join(self._buffer)
+        self._buffer, self._size = [], 0
+        for start in range(0, len(text), CHUNK):
+            send({"event": self.event, "data": text[start : start + CHUNK]})
+
+
+def limit_cpu_time(seconds: int | None) -> None:
+    """Limit the CPU time of the run, the soft limit counts the CPU time of the whole worker."""
+
+    try:
+        import resource
+    except ImportError:
+        return  # Windows
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    soft = int(usage.ru_utime + usage.ru_stime) + 1 + seconds if seconds else hard
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+
+def run(script: str, args: list[str], cpu_time: int | None = None) -> int:
+    limit_cpu_time(cpu_time)
+    sys.argv = [script, *args]
+    # Same as running the script directly, its directory is the first import path
+    sys.path.insert(0, os.path.dirname(os.path.abspath(script)))
+    try:
+        runpy.run_path(script, run_name="__main__")
+        return 0
+    except SystemExit as e:
+        if e.code is None or isinstance(e.code, int):
+            return e.code or 0
+        print(e.code, file=sys.stderr)
+        return 1
+    except BaseException as e:
+        # Hide the frames of the worker and runpy, as if the script was run directly
+        tb = e.__traceback__
+        while tb and tb.tb_frame.f_code.co_filename != script:
+            tb = tb.tb_next
+        traceback.print_exception(type(e), e, tb or e.__traceback__)
+        return 1
+    finally:
+        sys.path.pop(0)
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+
+def main() -> None:
+    global _protocol
+
+    requests = sys.stdin
+    # Events are written to a duplicate of stdout, output written to the file descriptor 1
+    # directly(subprocesses, C extensions) goes to stderr and can't break the protocol, it is
+    # logged as the stderr of the run
+    _protocol = os.fdopen(os.dup(1), "w", encoding="utf-8")
+    os.dup2(2, 1)
+    sys.stdout, sys.stderr = EventStream("out"), EventStream("err")
+    sys.stdin = open(os.devnull)
+
+    os.write(2, RUN_END)
+    send({"event": "ready"})
+    while line := requests.readline():
+        request = json.loads(line)
+        code = run(request["script"], request["args"], request.get("cpu_time"))
+        os.write(2, RUN_END)
+        send({"event": "exit", "code": code})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Dedicated thread pool for the blocking work of WebUI requests.
+
+The scheduler and the `AsyncIOExecutor` jobs share the event loop with the WebUI, so log parsing,
+globbing or file reading must never run on the loop itself. The work is sent to a small pool of
+low priority threads instead of the default executor, and requests are rejected when the pool is
+saturated, so one heavy page can not pile up work behind the scheduler's wakeups.
+"""
+
+import asyncio
+import os
+import threading
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import ParamSpec, TypeVar
+
+from fastapi import HTTPException
+
+from .config import WEBUI_MAX_PENDING, WEBUI_WORKERS
+
+P = ParamSpec("P")
+T = TypeVar("T")
+
+
+def _lower_priority() -> None:
+    """Let the OS prefer the event loop thread over the workers (Linux only)."""
+
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 10)
+    except (AttributeError, OSError):
+        pass
+
+
+_pool = ThreadPoolExecutor(
+    max_workers=WEBUI_WORKERS, thread_name_prefix="webui", initializer=_lower_priority
+)
+_pending = 0
+
+
+async def run_in_worker(func: Callable[P, T], *args: P.args, **kwargs: P.kwargs) -> T:
+    """
+    Run a blocking function in the WebUI worker pool.
+
+    Raises:
+        HTTPException: 503 if there are already `WEBUI_MAX_PENDING` tasks running or waiting.
+    """
+    global _pending
+
+    if _pending >= WEBUI_MAX_PENDING:
+        raise HTTPException(status_code=503, detail="Server is busy, please retry later")
+    _pending += 1
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_pool, partial(func, *args, **kwargs))
+    finally:
+        _pending -= 1
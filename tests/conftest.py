@@ -0,0 +1,29 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+import pytest
+from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+
+from src.scheduler import scheduler
+from src.store_thread import use_io_thread
+
+
+@pytest.fixture
+def sqlite_store(tmp_path):
+    """Start the scheduler on the running loop with a SQLite job store "sql" using an I/O thread."""
+
+    @asynccontextmanager
+    async def start():
+        # Paused, the jobs don't run while they're written
+        scheduler._eventloop = asyncio.get_running_loop()
+        scheduler.start(paused=True)
+        store = SQLAlchemyJobStore(url=f"sqlite:///{tmp_path / 'jobs.sqlite'}")
+        scheduler.add_jobstore(use_io_thread(store), "sql")
+        try:
+            yield store
+        finally:
+            scheduler.remove_jobstore("sql")
+            scheduler.shutdown(wait=False)
+
+    return start
+
@@ -0,0 +1,109 @@
+import asyncio
+import threading
+import time
+from datetime import datetime, timezone
+
+from src import bulk
+from src.scheduler import BUSY_RETRY, scheduler
+from src.schema import BulkJobParam
+from src.spread import SpreadIntervalTrigger, spread_offset
+
+JOBS = 30
+
+
+async def run_bulk(**params) -> bulk.BulkProgress:
+    task_id = bulk.start_bulk(BulkJobParam.model_validate(params))
+    while not (progress := bulk.bulk_progress(task_id)).finished:  # type: ignore
+        await asyncio.sleep(0.01)
+    return progress
+
+
+def add_job(job_id: str, **kwargs) -> None:
+    scheduler.add_job(
+        "time:sleep", "interval", args=[0], hours=1, id=job_id, jobstore="sql", **kwargs
+    )
+
+
+def stored_jobs(store) -> dict:
+    return {job.id: job for job in store.get_all_jobs()}
+
+
+async def _bulk_actions(sqlite_store):
+    async with sqlite_store() as store:
+        for i in range(JOBS):
+            add_job(f"r{i}", name=f"rep-{i}")
+        add_job("other")
+        next_run_times = {job_id: job.next_run_time for job_id, job in stored_jobs(store).items()}
+
+        paused = await run_bulk(action="pause", name="rep-*")
+        jobs = stored_jobs(store)
+        assert (paused.selected, paused.done, paused.failed) == (JOBS, JOBS, 0)
+        assert all(jobs[f"r{i}"].next_run_time is None for i in range(JOBS))
+        assert jobs["other"].next_run_time == next_run_times["other"]
+
+        resumed = await run_bulk(action="resume", ids=["r1", "r2", "missing"])
+        jobs = stored_jobs(store)
+        assert (resumed.done, resumed.errors) == (2, ["Job missing not found"])
+        assert jobs["r1"].next_run_time is not None and jobs["r3"].next_run_time is None
+
+        spread = await run_bulk(action="modify", store="sql", changes={"spread": 600})
+        jobs = stored_jobs(store)
+        assert spread.done == JOBS + 1
+        for job_id, job in jobs.items():
+            assert isinstance(job.trigger, SpreadIntervalTrigger)
+            assert job.trigger.offset == spread_offset(job_id, 600)
+        # A paused job stays paused, a scheduled one is moved by its offset
+        assert jobs["r3"].next_run_time is None
+        offset = jobs["other"].next_run_time - jobs["other"].trigger.get_next_fire_time(
+            None, datetime.now(timezone.utc)
+        )
+        assert abs(offset.total_seconds()) < 1
+
+        removed = await run_bulk(action="remove", store="sql")
+        assert removed.done == JOBS + 1 and not stored_jobs(store)
+
+
+def test_bulk_actions_in_batches(sqlite_store, monkeypatch):
+    monkeypatch.setattr(bulk, "BULK_BATCH", 7)
+    asyncio.run(_bulk_actions(sqlite_store))
+
+
+async def _wakeup_during_batch(sqlite_store):
+    async with sqlite_store():
+        batch = threading.Event()
+
+        def hold_lock():
+            with scheduler._jobstores_lock:
+                batch.set()
+                time.sleep(0.5)
+
+        holder = threading.Thread(target=hold_lock)
+        holder.start()
+        batch.wait()
+        start = time.perf_counter()
+        retry = scheduler._process_jobs()
+        elapsed = time.perf_counter() - start
+        holder.join()
+        return retry, elapsed
+
+
+def test_wakeup_doesnt_wait_for_a_batch(sqlite_store):
+    retry, elapsed = asyncio.run(_wakeup_during_batch(sqlite_store))
+    assert retry == BUSY_RETRY
+    assert elapsed < 0.1
+
+
+async def _history():
+    async def run(progress):
+        pass
+
+    task_ids = [bulk.start_task("test", run) for _ in range(3)]
+    await asyncio.sleep(0.1)
+    return task_ids + [bulk.start_task("test", run)]
+
+
+def test_history_keeps_the_recent_progress(monkeypatch):
+    monkeypatch.setattr(bulk, "_progress", {})
+    monkeypatch.setattr(bulk, "BULK_HISTORY", 5)
+    task_ids = asyncio.run(_history())
+    assert list(bulk._progress) == task_ids
@@ -0,0 +1,79 @@
+import subprocess
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+
+ROOT = Path(__file__).parents[1]
+JOBS = 20
+RUN_SECONDS = 5
+
+# A node adding the shared job store at runtime, like the Store page, recording the runs it
+# submits as "<node> <job id> <scheduled run time>" and the count of its buckets in "<out>.<node>"
+NODE = """
+import asyncio, sys
+
+import src.config as config
+
+node, url, out, jobs, seconds = sys.argv[1:]
+config.CLUSTER_ENABLED, config.CLUSTER_NODE = True, node
+config.CLUSTER_LEASE_TTL, config.CLUSTER_HEARTBEAT = 3, 1
+
+from apscheduler.events import EVENT_JOB_SUBMITTED
+
+from src import cluster, operations
+from src.scheduler import scheduler
+from src.schema import JobStoreInfo
+
+
+def record(event):
+    with open(out, "a") as f:
+        for run_time in event.scheduled_run_times:
+            f.write(f"{node} {event.job_id} {run_time.timestamp()}\\n")
+
+
+async def main():
+    scheduler.add_listener(record, EVENT_JOB_SUBMITTED)
+    scheduler.start()
+    cluster.start_heartbeat(scheduler.wakeup)
+    info = JobStoreInfo(alias="shared", type_="SQLAlchemy", detail=url)
+    assert await operations.add_job_store(info) == "New job store added successfully"
+    if node == "a":
+        for i in range(int(jobs)):
+            scheduler.add_job(
+                "time:sleep", "interval", args=[0], seconds=1, id=f"j{i}", jobstore="shared"
+            )
+    await asyncio.sleep(float(seconds))
+    with open(f"{out}.{node}", "w") as f:
+        f.write(str(len(cluster._coordinators["shared"].buckets)))
+    scheduler.shutdown(wait=False)
+    cluster.stop_heartbeat()
+
+
+asyncio.run(main())
+"""
+
+
+def _start(node: str, url: str, out: Path) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, "-c", NODE, node, url, str(out), str(JOBS), str(RUN_SECONDS)],
+        cwd=ROOT,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+def test_two_nodes_share_a_sqlite_store(tmp_path):
+    url = f"sqlite:///{tmp_path / 'jobs.sqlite'}"
+    out = tmp_path / "runs.txt"
+    first = _start("a", url, out)
+    time.sleep(0.5)
+    second = _start("b", url, out)
+    assert [process.wait(timeout=60) for process in (first, second)] == [0, 0]
+    buckets = [int(Path(f"{out}.{node}").read_text()) for node in ("a", "b")]
+    assert sum(buckets) == 64 and min(buckets) > 0
+
+    runs = [line.split() for line in out.read_text().splitlines()]
+    # Each run is submitted by one node only, and both nodes run jobs
+    assert Counter((job_id, run_time) for _, job_id, run_time in runs).most_common(1)[0][1] == 1
+    assert {node for node, _, _ in runs} == {"a", "b"}
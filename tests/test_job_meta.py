@@ -0,0 +1,26 @@
+import asyncio
+
+from src import scheduler as scheduler_module
+from src.scheduler import get_job_meta, scheduler
+
+
+async def _add_and_modify(sqlite_store):
+    async with sqlite_store():
+        job = scheduler.add_job(
+            "time:sleep", "interval", args=[0], hours=1, id="job", jobstore="sql"
+        )
+        added = get_job_meta("job")
+        scheduler.modify_job("job", name="renamed")
+        scheduler.pause_job("job")
+        return job, added, get_job_meta("job")
+
+
+def test_events_keep_the_written_jobs(sqlite_store, monkeypatch):
+    def get_job(*args):
+        raise AssertionError("the job is loaded again")
+
+    monkeypatch.setattr(scheduler, "get_job", get_job)
+    job, added, modified = asyncio.run(_add_and_modify(sqlite_store))
+    assert added.name == "sleep" and added.next_run_time == job.next_run_time
+    assert modified.name == "renamed" and modified.next_run_time is None
+    assert not scheduler_module._written_meta
@@ -0,0 +1,101 @@
+import asyncio
+
+from src.limiter import ALL, ProcessLimiter
+
+
+async def queue_runs(limiter: ProcessLimiter, runs: list[tuple[str, str | None, int]]):
+    """Hold the only slot while the runs queue up, return the order they started in."""
+
+    started = []
+
+    async def run(name: str, tag: str | None, priority: int) -> None:
+        async with limiter.slot(tag, priority):
+            started.append(name)
+            await asyncio.sleep(0)
+
+    async with limiter.slot():
+        tasks = []
+        for run_args in runs:
+            tasks.append(asyncio.create_task(run(*run_args)))
+            await asyncio.sleep(0)  # enqueued in this order
+    await asyncio.gather(*tasks)
+    return started
+
+
+RUNS = [("a", None, 0), ("b", None, 5), ("c", None, 0), ("d", None, 5), ("e", None, 9)]
+
+
+def test_fifo_order():
+    started = asyncio.run(queue_runs(ProcessLimiter(1, {}), RUNS))
+    assert started == ["a", "b", "c", "d", "e"]
+
+
+def test_priority_order():
+    started = asyncio.run(queue_runs(ProcessLimiter(1, {}, "priority"), RUNS))
+    assert started == ["e", "b", "d", "a", "c"]
+
+
+async def _tag_widths():
+    limiter = ProcessLimiter(3, {"db": 1})
+    release = asyncio.Event()
+    started = []
+
+    async def run(name: str, tag: str | None) -> None:
+        async with limiter.slot(tag):
+            started.append(name)
+            await release.wait()
+
+    tasks = [
+        asyncio.create_task(run(name, tag))
+        for name, tag in (("db1", "db"), ("db2", "db"), ("web", "web"), ("any", None), ("x", None))
+    ]
+    await asyncio.sleep(0.01)
+    # The second db run waits for its tag without blocking the others, the last one waits for
+    # a slot of the limiter
+    assert started == ["db1", "web", "any"]
+    stats = {name: limiter.stats[name].as_dict() for name in (ALL, "db", "web")}
+    assert [stats[name]["running"] for name in (ALL, "db", "web")] == [3, 1, 1]
+    assert [stats[name]["queued"] for name in (ALL, "db", "web")] == [2, 1, 0]
+    release.set()
+    await asyncio.gather(*tasks)
+    assert sorted(started[3:]) == ["db2", "x"]
+    assert limiter.stats[ALL].running == limiter.stats["db"].running == 0
+
+
+def test_tag_widths():
+    asyncio.run(_tag_widths())
+
+
+async def _cancelled_waiter():
+    limiter = ProcessLimiter(1, {"db": 1})
+    started = []
+
+    async def run(name: str, tag: str | None = None) -> None:
+        async with limiter.slot(tag):
+            started.append(name)
+
+    async with limiter.slot("db"):
+        cancelled = asyncio.create_task(run("cancelled", "db"))
+        waiting = asyncio.create_task(run("waiting"))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        await asyncio.sleep(0)
+        assert cancelled.cancelled() and limiter.stats["db"].queued == 0
+    await waiting
+    # Started by the release and cancelled before it runs
+    async with limiter.slot():
+        started_cancelled = asyncio.create_task(run("started"))
+        await asyncio.sleep(0)
+    started_cancelled.cancel()
+    await asyncio.gather(started_cancelled, return_exceptions=True)
+    # The slots are free again
+    await asyncio.wait_for(run("db", "db"), 1)
+    assert started == ["waiting", "db"]
+    return limiter
+
+
+def test_cancelled_waiter_doesnt_leak_a_slot():
+    limiter = asyncio.run(_cancelled_waiter())
+    for stats in (limiter.stats[ALL], limiter.stats["db"]):
+        assert (stats.running, stats.queued) == (0, 0)
+    assert not limiter._queue
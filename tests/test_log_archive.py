@@ -0,0 +1,40 @@
+import pytest
+
+from src import log_archive, log_index
+from src.log_archive import CompressedLog, compress_log, open_log, wait_compressions
+
+
+@pytest.fixture
+def archive(tmp_path, monkeypatch):
+    monkeypatch.setattr(log_archive, "LOG_INDEX_PATH", tmp_path / "index")
+    monkeypatch.setattr(log_index, "LOG_INDEX_PATH", tmp_path / "index")
+    monkeypatch.setattr(log_archive, "LOG_COMPRESSION", "gz")
+    monkeypatch.setattr(log_archive, "LOG_COMPRESSION_BLOCK", 100)
+    content = b"".join(f"record {i} {'x' * (i % 17)}\n".encode() for i in range(200))
+    path = tmp_path / "jobs.2000-01-01.log"
+    path.write_bytes(content)
+    compress_log(str(path))
+    wait_compressions()
+    assert not path.exists() and not list(tmp_path.glob("*.tmp"))
+    return tmp_path / "jobs.2000-01-01.log.gz", content
+
+
+def test_read_across_blocks(archive):
+    path, content = archive
+    with open_log(path) as log:
+        assert isinstance(log, CompressedLog)
+        assert len(log._starts) > 10 and log.size == len(content)
+        block = log._starts[3]
+        for offset, size in ((0, 10), (block - 5, 10), (block - 5, 350), (block, 100), (0, 10**6)):
+            assert log.read(offset, size) == content[offset : offset + size]
+        assert log.read(len(content) - 3, 10) == content[-3:]
+        assert log.read(len(content), 10) == b""
+
+
+def test_read_without_block_table(archive):
+    path, content = archive
+    (log_archive.LOG_INDEX_PATH / f"{path.name}.blocks").unlink()
+    with open_log(path) as log:
+        assert len(log._starts) > 10
+        block = log._starts[5]
+        assert log.read(block - 20, 250) == content[block - 20 : block + 230]
@@ -0,0 +1,123 @@
+import multiprocessing
+import os
+from array import array
+from itertools import islice
+
+import pytest
+
+from src import log_index
+from src.log_index import LogIndex
+
+LEVELS = ("INFO", "WARNING", "ERROR")
+
+
+def record(i: int, job_id: str | None = None) -> bytes:
+    job = f"[job {job_id} 0a1b] " if job_id else ""
+    level = LEVELS[i % len(LEVELS)]
+    return f"[  42] 2000-01-01 00:00:00 | {level:<8} | mod{i % 2}:1\t{job}message {i}\n".encode()
+
+
+def line_starts(path) -> list[int]:
+    data = path.read_bytes()
+    return [0] + [i + 1 for i, byte in enumerate(data[:-1]) if byte == ord("\n")]
+
+
+@pytest.fixture
+def log(tmp_path, monkeypatch):
+    monkeypatch.setattr(log_index, "LOG_PATH", tmp_path)
+    monkeypatch.setattr(log_index, "LOG_INDEX_PATH", tmp_path / "index")
+    monkeypatch.setattr(log_index, "INDEX_LOCK", tmp_path / "index" / "index.lock")
+    return tmp_path / "jobs.2000-01-01.log"
+
+
+def messages(index: LogIndex, positions) -> list[str]:
+    return [record["message"].strip() for record in index.read(positions)]
+
+
+def append(path, data: bytes) -> None:
+    with path.open("ab") as f:
+        f.write(data)
+
+
+def test_paging(log):
+    append(log, b"".join(record(i, "job" if i < 10 else None) for i in range(30)))
+    index = LogIndex(log).refresh()
+    assert len(index) == 30
+    assert index.count("ERROR") == 10 and index.count(module="mod1") == 15
+    assert index.count(job_id="job") == 10 and index.count("INFO", "mod0", "job") == 2
+    page = list(islice(index.select("ERROR"), 3, 6))
+    assert messages(index, page) == ["message 11", "message 14", "message 17"]
+    newest = list(islice(index.select(module="mod1", reverse=True), 2))
+    assert messages(index, newest) == ["message 29", "message 27"]
+    assert next(index.read([0]))["job_id"] == "job"
+
+
+def test_append_and_partial_record(log):
+    append(log, record(0) + record(1) + record(2)[:20])
+    index = LogIndex(log).refresh()
+    assert len(index) == 2 and index.size == len(record(0) + record(1))
+    # The partial record is indexed once it is complete
+    append(log, record(2)[20:] + record(3))
+    index.refresh()
+    assert list(index.offsets) == line_starts(log)
+    assert messages(index, range(4)) == [f"message {i}" for i in range(4)]
+
+
+def test_truncate_and_replace(log):
+    append(log, b"".join(map(record, range(5))))
+    index = LogIndex(log).refresh()
+    inode = index.inode
+    log.write_bytes(record(7))  # truncated, same inode
+    index.refresh()
+    assert len(index) == 1 and messages(index, [0]) == ["message 7"]
+    # Replaced by a file with more records, told apart by the inode
+    new = log.with_name("new.log")
+    new.write_bytes(b"".join(map(record, range(10, 20))))
+    os.replace(new, log)
+    index.refresh()
+    assert index.inode != inode and len(index) == 10
+    assert messages(index, [0]) == ["message 10"]
+
+
+def test_reload_sidecars(log):
+    append(log, b"".join(record(i, "job") for i in range(20)))
+    index = LogIndex(log).refresh()
+    off = log_index.LOG_INDEX_PATH / f"{log.name}.off"
+    assert off.stat().st_size == 8 * len(index)
+
+    loaded = LogIndex(log)
+    assert (loaded.inode, loaded.size, loaded._persisted) == (index.inode, index.size, 20)
+    assert (loaded.offsets, loaded.keys) == (index.offsets, index.keys)
+    assert (loaded.key_table, loaded.key_counts) == (index.key_table, index.key_counts)
+    append(log, record(20))
+    loaded.refresh()
+    assert LogIndex(log).offsets == array("Q", line_starts(log))
+    # A sidecar of another format is rebuilt
+    off.write_bytes(b"\0" * 3)
+    assert len(LogIndex(log)) == 0 and len(LogIndex(log).refresh()) == 21
+
+
+def _append_and_refresh(path, start: int) -> None:
+    index = LogIndex(path)
+    for i in range(start, start + 50):
+        append(path, record(i))
+        if i % 3 == 0:
+            index.refresh()
+    index.refresh()
+
+
+def test_locked_save_across_processes(log):
+    log.touch()
+    context = multiprocessing.get_context("fork")
+    processes = [
+        context.Process(target=_append_and_refresh, args=(log, start)) for start in (0, 100, 200)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(30)
+    assert [process.exitcode for process in processes] == [0, 0, 0]
+    loaded = LogIndex(log)
+    assert loaded._persisted == 150
+    assert loaded.offsets == array("Q", line_starts(log))
+    assert sum(loaded.key_counts) == 150
@@ -0,0 +1,37 @@
+import asyncio
+import threading
+import time
+
+from src import loop_monitor
+
+SLOW = 0.2
+
+
+def _block() -> None:
+    time.sleep(SLOW)
+
+
+async def _block_step() -> None:
+    _block()
+
+
+async def _block_the_loops() -> list[str]:
+    loop_monitor.start_loop_monitor()
+    try:
+        # A loop of another thread isn't monitored
+        other = threading.Thread(target=asyncio.run, args=(_block_step(),))
+        other.start()
+        asyncio.get_running_loop().call_soon(_block)
+        await asyncio.sleep(SLOW * 2)
+        other.join()
+    finally:
+        loop_monitor.stop_loop_monitor()
+    return [owner for _, owner, _ in loop_monitor.slow_callbacks]
+
+
+def test_only_the_monitored_loop_is_timed(monkeypatch):
+    monkeypatch.setattr(loop_monitor, "LOOP_SLOW_CALLBACK", SLOW / 2)
+    monkeypatch.setattr(loop_monitor, "slow_callbacks", type(loop_monitor.slow_callbacks)())
+    owners = asyncio.run(_block_the_loops())
+    assert owners == ["_block"]
+    assert asyncio.Handle._run is loop_monitor._original_run
@@ -0,0 +1,63 @@
+import asyncio
+from datetime import timedelta
+
+from src import bulk, manifest
+from src.scheduler import scheduler
+from src.schema import ManifestJob
+
+
+def add_job(job_id: str, **kwargs) -> None:
+    scheduler.add_job(
+        "time:sleep", "interval", args=[0], hours=1, id=job_id, jobstore="sql", **kwargs
+    )
+
+
+def stored_jobs(store) -> dict:
+    return {job.id: job for job in store.get_all_jobs()}
+
+
+async def _import_manifest(sqlite_store):
+    async with sqlite_store() as store:
+        for i in range(5):
+            add_job(f"m{i}", name=f"job-{i}")
+        next_run_times = {job_id: job.next_run_time for job_id, job in stored_jobs(store).items()}
+        jobs = manifest.load_manifest(manifest.dump_manifest(manifest.export_jobs(), "json")).jobs
+        assert [job.id for job in jobs] == [f"m{i}" for i in range(5)]
+
+        jobs[0].name = "renamed"
+        jobs[1].trigger_params = {"hour": "2"}
+        del jobs[2]
+        jobs.append(
+            ManifestJob(
+                id="new",
+                name="new",
+                func="time:sleep",
+                args=[0],
+                trigger="Interval",
+                trigger_params={"minute": "5"},
+                jobstore="sql",
+            )
+        )
+        plan = manifest.plan_import(jobs, prune=True)
+        assert (plan.added, plan.updated, plan.removed, plan.unchanged) == (1, 2, 1, 2)
+        assert not plan.errors
+
+        task_id = manifest.start_import(jobs, prune=True)
+        while not (progress := bulk.bulk_progress(task_id)).finished:  # type: ignore
+            await asyncio.sleep(0.01)
+        assert (progress.done, progress.failed) == (4, 0)
+        stored = stored_jobs(store)
+        assert sorted(stored) == ["m0", "m1", "m3", "m4", "new"]
+        assert stored["m0"].name == "renamed"
+        # Renamed only, the next run time is kept, a changed trigger reschedules the job
+        assert stored["m0"].next_run_time == next_run_times["m0"]
+        assert stored["m1"].trigger.interval == timedelta(hours=2)
+        assert stored["m1"].next_run_time > next_run_times["m1"]
+
+        # An export of the imported jobs is unchanged
+        plan = manifest.plan_import(manifest.export_jobs(), prune=True)
+        assert (plan.added, plan.updated, plan.removed, plan.unchanged) == (0, 0, 0, 5)
+
+
+def test_import_manifest_differences(sqlite_store):
+    asyncio.run(_import_manifest(sqlite_store))
@@ -0,0 +1,94 @@
+import asyncio
+import threading
+
+import pytest
+from fastapi import HTTPException
+
+from src import rpc
+from src.exceptions import OperationFailed
+
+
+async def echo(*args, **kwargs):
+    return args, kwargs
+
+
+async def fail(message: str):
+    raise OperationFailed(message, 404)
+
+
+async def fail_unpicklable():
+    raise ValueError(threading.Lock())
+
+
+@pytest.fixture
+def operations(tmp_path, monkeypatch):
+    monkeypatch.setattr(rpc, "SCHEDULER_SOCKET", tmp_path / "scheduler.sock")
+    monkeypatch.setattr(rpc, "_serving", False)
+    monkeypatch.setattr(rpc, "_operations", {})
+    for func in (echo, fail, fail_unpicklable):
+        rpc._operations[func.__name__] = func
+
+
+async def _framing():
+    server = await rpc.serve_operations()
+    try:
+        data = bytes(range(256)) * 4096  # split across several reads
+        assert await rpc._call("echo", (data, None), {"key": [1]}) == ((data, None), {"key": [1]})
+        # Several requests on one connection, each answered by its frame
+        reader, writer = await asyncio.open_unix_connection(rpc.SCHEDULER_SOCKET)
+        for i in range(3):
+            rpc._write_frame(writer, ("echo", (i,), {}))
+        await writer.drain()
+        assert [await rpc._read_frame(reader) for _ in range(3)] == [
+            (True, ((i,), {})) for i in range(3)
+        ]
+        writer.close()
+    finally:
+        server.close()
+        await server.wait_closed()
+
+
+def test_request_response_framing(operations):
+    asyncio.run(_framing())
+
+
+async def _errors():
+    server = await rpc.serve_operations()
+    try:
+        with pytest.raises(OperationFailed) as failed:
+            await rpc._call("fail", ("missing",), {})
+        assert (failed.value.message, failed.value.status_code) == ("missing", 404)
+        # Replaced by an OperationFailed when it can't be pickled
+        with pytest.raises(OperationFailed) as failed:
+            await rpc._call("fail_unpicklable", (), {})
+        assert failed.value.status_code == 500 and "ValueError" in failed.value.message
+        # The connection of the failed operations is still served
+        assert await rpc._call("echo", (), {}) == ((), {})
+    finally:
+        server.close()
+        await server.wait_closed()
+
+
+def test_exception_propagation(operations):
+    asyncio.run(_errors())
+
+
+async def _restart():
+    server = await rpc.serve_operations()
+    assert await rpc._call("echo", (1,), {}) == ((1,), {})
+    server.close()
+    await server.wait_closed()
+    with pytest.raises(HTTPException) as unavailable:
+        await rpc._call("echo", (2,), {})
+    assert unavailable.value.status_code == 503
+
+    server = await rpc.serve_operations()
+    try:
+        assert await rpc._call("echo", (3,), {}) == ((3,), {})
+    finally:
+        server.close()
+        await server.wait_closed()
+
+
+def test_reconnect_after_restart(operations):
+    asyncio.run(_restart())
@@ -0,0 +1,35 @@
+import pickle
+from datetime import datetime, timedelta, timezone
+
+from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
+
+from src.spread import SpreadCronTrigger, SpreadIntervalTrigger, spread_offset, spread_trigger
+
+
+def test_spread_offset():
+    offsets = [spread_offset(f"job{i}", 60) for i in range(1000)]
+    assert offsets == [spread_offset(f"job{i}", 60) for i in range(1000)]
+    assert min(offsets) >= 0 and max(offsets) < 60 and len(set(offsets)) == 60
+    assert spread_offset("job", 0) == 0
+
+
+def test_spread_triggers_round_trip():
+    now = datetime(2024, 1, 1, 12, 0, 30, tzinfo=timezone.utc)
+    triggers = [
+        CronTrigger(minute=0, timezone=timezone.utc),
+        IntervalTrigger(hours=1, start_date=now - timedelta(hours=2), timezone=timezone.utc),
+    ]
+    for trigger in triggers:
+        spread = spread_trigger(trigger, 600, "job")
+        assert isinstance(spread, (SpreadCronTrigger, SpreadIntervalTrigger))
+        offset = timedelta(seconds=spread_offset("job", 600))
+        fire_time = trigger.get_next_fire_time(None, now - offset)
+        assert spread.get_next_fire_time(None, now) == fire_time + offset
+
+        loaded = pickle.loads(pickle.dumps(spread))
+        assert type(loaded) is type(spread)
+        assert (loaded.spread, loaded.offset) == (600, offset.seconds)
+        assert loaded.get_next_fire_time(None, now) == spread.get_next_fire_time(None, now)
+        # Without the spread, back to the base trigger
+        assert type(spread_trigger(loaded, 0, "job")) is type(trigger)
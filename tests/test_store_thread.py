@@ -0,0 +1,61 @@
+import asyncio
+import time
+from datetime import datetime, timezone
+
+from apscheduler.events import EVENT_JOB_SUBMITTED
+from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+
+from src.scheduler import Scheduler
+from src.store_thread import thread_jobstore, use_io_thread
+
+LOAD_DELAY = 0.5
+
+
+def _slow_store(tmp_path) -> SQLAlchemyJobStore:
+    return use_io_thread(SQLAlchemyJobStore(url=f"sqlite:///{tmp_path / 'jobs.sqlite'}"))
+
+
+async def _pause_during_prefetch(tmp_path) -> tuple[datetime | None, int, float]:
+    scheduler = Scheduler(timezone=timezone.utc)
+    store = _slow_store(tmp_path)
+    scheduler.add_jobstore(store, "slow")
+    submitted = []
+    scheduler.add_listener(lambda event: submitted.append(event.job_id), EVENT_JOB_SUBMITTED)
+    scheduler.start()
+    thread_jobstore("slow", store)
+    thread = store._store_thread  # type: ignore
+    load = thread.calls["get_due_jobs"]
+
+    def slow_load(now):
+        time.sleep(LOAD_DELAY)
+        return load(now)
+
+    thread.calls["get_due_jobs"] = slow_load
+    scheduler.add_job(
+        "time:sleep",
+        "interval",
+        args=[0],
+        hours=1,
+        id="job",
+        jobstore="slow",
+        next_run_time=datetime.now(timezone.utc),
+    )
+    # The wakeup of the added job is loading it
+    await asyncio.sleep(LOAD_DELAY / 5)
+    start = time.perf_counter()
+    pause = asyncio.create_task(asyncio.to_thread(scheduler.pause_job, "job"))
+    await asyncio.sleep(0)
+    loop_free = time.perf_counter() - start
+    await pause
+    await asyncio.sleep(LOAD_DELAY * 3)
+    thread.flush()
+    next_run_time = store.lookup_job("job").next_run_time
+    scheduler.shutdown(wait=False)
+    return next_run_time, submitted.count("job"), loop_free
+
+
+def test_pause_during_prefetch(tmp_path):
+    next_run_time, submitted, loop_free = asyncio.run(_pause_during_prefetch(tmp_path))
+    assert next_run_time is None
+    assert submitted == 0
+    assert loop_free < LOAD_DELAY / 5